@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+"""
+Generate a reproducible corpus of synthetic jars, eggs and gems.
+
+    python benchmarks/corpus.py DIRECTORY [--preset quick|full]
+
+Every artifact is described by its kind, member count, member size,
+compression level and nesting depth, and its content is derived from that
+description alone, so the same corpus is generated on every machine.
+"""
+
+import argparse
+import io
+import os
+import random
+import struct
+import sys
+import tarfile
+import zlib
+
+from javaclass_bench import synthetic_class
+
+
+PRESETS = {
+    'quick': [
+        ('jar', 10, 2048, 6, 0),
+        ('jar', 1000, 2048, 6, 0),
+        ('jar', 1000, 2048, 0, 0),
+        ('jar', 1000, 2048, 9, 0),
+        ('jar', 200, 32768, 6, 0),
+        ('jar', 100, 2048, 6, 2),
+        ('egg', 1000, 4096, 6, 0),
+        ('gem', 1000, 4096, 6, 0),
+    ],
+}
+PRESETS['full'] = PRESETS['quick'] + [
+    ('jar', 10000, 2048, 6, 0),
+    ('jar', 50000, 1024, 6, 0),
+    ('jar', 2000, 32768, 1, 0),
+    ('jar', 500, 2048, 6, 3),
+    ('egg', 10000, 2048, 6, 0),
+    ('gem', 10000, 2048, 6, 0),
+]
+
+WORDS = (
+    'def class self return import from if else for while in not and or '
+    'None True False value result data name items append len range end '
+    'module require attr_accessor puts raise rescue yield lambda index'
+).split()
+
+
+class ZipWriter(object):
+    """
+    Minimal zip writer. Unlike ``zipfile`` on Python 2 it takes a deflate
+    compression level per entry (0 stores the entry).
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.entries = []
+
+    def add(self, name, data, level=6):
+        crc = zlib.crc32(data) & 0xffffffff
+        if level:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+            payload = compressor.compress(data) + compressor.flush()
+            method = 8
+        else:
+            payload = data
+            method = 0
+        offset = self.fileobj.tell()
+        self.fileobj.write(struct.pack(
+            '<4s5H3L2H', b'PK\x03\x04', 20, 0, method, 0, 0x21, crc,
+            len(payload), len(data), len(name), 0))
+        self.fileobj.write(name)
+        self.fileobj.write(payload)
+        self.entries.append(
+            (name, method, crc, len(payload), len(data), offset))
+
+    def close(self):
+        start = self.fileobj.tell()
+        for (name, method, crc, csize, usize, offset) in self.entries:
+            self.fileobj.write(struct.pack(
+                '<4s6H3L5H2L', b'PK\x01\x02', 20, 20, 0, method, 0, 0x21,
+                crc, csize, usize, len(name), 0, 0, 0, 0, 0, offset))
+            self.fileobj.write(name)
+        end = self.fileobj.tell()
+        count = len(self.entries)
+        self.fileobj.write(struct.pack(
+            '<4s4H2LH', b'PK\x05\x06', 0, 0, count, count, end - start,
+            start, 0))
+
+
+def text(rnd, size):
+    """
+    Source-like text of about `size` bytes.
+    """
+    words = []
+    length = 0
+    while length < size:
+        word = rnd.choice(WORDS)
+        if rnd.random() < 0.15:
+            word += '%d\n' % rnd.randint(0, 99999)
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)[:size]
+
+
+def java_class(rnd, name, size):
+    methods = max(1, (size - 200) // 175)
+    return synthetic_class(methods, max(1, methods // 2), name)
+
+
+def jar_bytes(rnd, members, size, level, nesting):
+    out = io.BytesIO()
+    archive = ZipWriter(out)
+    archive.add(b'META-INF/MANIFEST.MF', (
+        b'Manifest-Version: 1.0\r\nImplementation-Title: bench\r\n'
+        b'Implementation-Version: 1.0\r\n'), level)
+    archive.add(b'META-INF/maven/bench/bench/pom.properties',
+                b'groupId=bench\nartifactId=bench\nversion=1.0\n', level)
+    if nesting:
+        # Spread the members over a few inner jars, one level down each.
+        inner = 3
+        for i in range(inner):
+            archive.add(b'WEB-INF/lib/inner%d.jar' % i, jar_bytes(
+                rnd, max(1, members // inner), size, level, nesting - 1), 0)
+    else:
+        for i in range(members):
+            name = b'bench/p%d/C%d' % (i % 97, i)
+            archive.add(name + b'.class', java_class(rnd, name, size), level)
+    archive.close()
+    return out.getvalue()
+
+
+def egg_bytes(rnd, members, size, level, nesting):
+    out = io.BytesIO()
+    archive = ZipWriter(out)
+    archive.add(b'EGG-INFO/PKG-INFO', (
+        b'Metadata-Version: 1.0\nName: bench\nVersion: 1.0\n'
+        b'Summary: synthetic\nLicense: MIT\n'), level)
+    for i in range(members):
+        archive.add(b'bench/p%d/m%d.py' % (i % 97, i), text(rnd, size), level)
+    archive.close()
+    return out.getvalue()
+
+
+def tar_add(archive, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = 0
+    archive.addfile(info, io.BytesIO(data))
+
+
+def gzip_bytes(data, level):
+    # Unlike tarfile's gzip mode, zlib leaves the header mtime at 0 so the
+    # output does not depend on when it was built.
+    gz = zlib.compressobj(level or 1, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return gz.compress(data) + gz.flush()
+
+
+def gem_bytes(rnd, members, size, level, nesting):
+    data = io.BytesIO()
+    inner = tarfile.open(fileobj=data, mode='w')
+    for i in range(members):
+        tar_add(inner, 'lib/bench/p%d/m%d.rb' % (i % 97, i), text(rnd, size))
+    inner.close()
+
+    spec = gzip_bytes(
+        b'--- !ruby/object:Gem::Specification\nname: bench\nversion: '
+        b'!ruby/object:Gem::Version\n  version: 1.0.0\nlicenses:\n- MIT\n',
+        level)
+
+    out = io.BytesIO()
+    outer = tarfile.open(fileobj=out, mode='w')
+    tar_add(outer, 'metadata.gz', spec)
+    tar_add(outer, 'data.tar.gz', gzip_bytes(data.getvalue(), level))
+    outer.close()
+    return out.getvalue()
+
+
+BUILDERS = {
+    'jar': jar_bytes,
+    'egg': egg_bytes,
+    'gem': gem_bytes,
+}
+
+
+def artifact_name(kind, members, size, level, nesting):
+    return 'bench-m%d-s%d-l%d-n%d.%s' % (members, size, level, nesting, kind)
+
+
+def generate(directory, specs):
+    """
+    Write the artifacts described by `specs` (tuples of kind, members,
+    member size, compression level and nesting) to `directory`, skipping
+    those already there. Returns their paths.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    paths = []
+    for spec in specs:
+        path = os.path.join(directory, artifact_name(*spec))
+        if not os.path.exists(path):
+            rnd = random.Random(zlib.crc32(artifact_name(*spec)))
+            content = BUILDERS[spec[0]](rnd, *spec[1:])
+            with open(path + '.tmp', 'wb') as out:
+                out.write(content)
+            os.rename(path + '.tmp', path)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('directory')
+    parser.add_argument('--preset', default='quick', choices=sorted(PRESETS))
+    args = parser.parse_args()
+
+    for path in generate(args.directory, PRESETS[args.preset]):
+        print "%10d %s" % (os.path.getsize(path), path)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
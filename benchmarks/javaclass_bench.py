@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+"""
+Compare the offset based ``javaclass.ClassData`` parser with the file-like
+``javaclass.StreamClassData`` parser.
+
+    python benchmarks/javaclass_bench.py [--repeat N] [file.jar ...]
+
+Without jars a synthetic class is parsed.
+"""
+
+import argparse
+import os
+import struct
+import sys
+import time
+import zipfile
+
+from io import BytesIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from victims_hash.archive.reader import javaclass
+
+
+def utf8(value):
+    return b'\x01' + struct.pack('>H', len(value)) + value
+
+
+def synthetic_class(methods=40, fields=20, name=b'bench/Synthetic'):
+    """
+    Build a class with a realistic mix of constants, members and code.
+    """
+    pool = [utf8(name), b'\x07\x00\x01',
+            utf8(b'java/lang/Object'), b'\x07\x00\x03',
+            utf8(b'Code'), utf8(b'LineNumberTable'), utf8(b'SourceFile'),
+            utf8(b'Synthetic.java'), utf8(b'()V'), utf8(b'I')]
+    for i in range(methods + fields):
+        pool.append(utf8(b'member%d' % i))
+        pool.append(b'\x0c' + struct.pack('>HH', len(pool), 9))
+        pool.append(b'\x0a\x00\x02' + struct.pack('>H', len(pool)))
+        pool.append(b'\x03' + struct.pack('>i', i))
+    pool.append(b'\x05' + struct.pack('>q', 1 << 40))
+    count = len(pool) + 2
+
+    out = [b'\xca\xfe\xba\xbe', struct.pack('>HHH', 0, 50, count)]
+    out.extend(pool)
+    out.append(struct.pack('>HHHH', 0x21, 2, 4, 0))
+
+    out.append(struct.pack('>H', fields))
+    for i in range(fields):
+        out.append(struct.pack('>HHHH', 0x2, 11 + 4 * i, 10, 0))
+
+    code = b'\x2a\xb7\x00\x01' * 16 + b'\xb1'
+    lines = struct.pack('>H', 8) + b''.join(
+        struct.pack('>HH', i, i + 1) for i in range(8))
+    out.append(struct.pack('>H', methods))
+    for i in range(methods):
+        body = struct.pack('>HHI', 2, 1, len(code)) + code + \
+            struct.pack('>HH', 0, 1) + \
+            struct.pack('>HI', 6, len(lines)) + lines
+        out.append(struct.pack('>HHHH', 0x1, 11 + 4 * (fields + i), 9, 1))
+        out.append(struct.pack('>HI', 5, len(body)) + body)
+
+    out.append(struct.pack('>H', 1) + struct.pack('>HIH', 7, 2, 8))
+    return b''.join(out)
+
+
+def classes_from(paths):
+    for path in paths:
+        with zipfile.ZipFile(path) as archive:
+            for name in archive.namelist():
+                if name.endswith('.class'):
+                    yield archive.read(name)
+
+
+def check(data):
+    """
+    Make sure both parsers agree before timing them.
+    """
+    old = javaclass.StreamClassData(BytesIO(data))
+    new = javaclass.ClassData(data)
+    assert (old.major, old.minor, old.access_flags, old.this_class,
+            old.super_class, old.interfaces) == \
+        (new.major, new.minor, new.access_flags, new.this_class,
+         new.super_class, new.interfaces)
+    assert sorted(old.constant_pool) == sorted(new.constant_pool)
+    for n in old.constant_pool:
+        assert old.constant_pool[n].info == new.constant_pool[n].info
+    assert [len(m.attributes) for m in old.methods] == \
+        [len(m.attributes) for m in new.methods]
+    assert [str(a.info) for a in old.attributes] == \
+        [str(a.info) for a in new.attributes]
+
+
+def touch(data):
+    """
+    Parse a class and force the lazily parsed parts.
+    """
+    parsed = javaclass.ClassData(data)
+    parsed.fields, parsed.methods, parsed.attributes
+
+
+def timeit(parse, classes, repeat):
+    best = None
+    for _ in range(3):
+        start = time.time()
+        for _ in range(repeat):
+            for data in classes:
+                parse(data)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('jars', nargs='*')
+    parser.add_argument('--repeat', default=200, type=int)
+    args = parser.parse_args()
+
+    classes = list(classes_from(args.jars)) if args.jars else \
+        [synthetic_class()]
+    for data in classes:
+        check(data)
+
+    size = sum(len(data) for data in classes) * args.repeat
+    stream = timeit(
+        lambda data: javaclass.StreamClassData(BytesIO(data)),
+        classes, args.repeat)
+    offset = timeit(javaclass.ClassData, classes, args.repeat)
+    full = timeit(touch, classes, args.repeat)
+
+    for (name, elapsed) in (('StreamClassData', stream), ('ClassData', offset),
+                            ('ClassData+lazy', full)):
+        print "%-16s %8.3fs %8.1f MB/s %10.0f classes/s" % (
+            name, elapsed, size / elapsed / 1e6,
+            len(classes) * args.repeat / elapsed)
+    print "speedup          %8.1fx (%.1fx with every member parsed)" % (
+        stream / offset, stream / full)
+
+
+if __name__ == '__main__':
+    main()
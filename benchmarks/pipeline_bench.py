@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+"""
+Time every stage of the fingerprinting pipeline over a synthetic corpus.
+
+    python benchmarks/pipeline_bench.py run [--preset quick|full]
+        [--corpus DIR] [--repeat N] [--output results.json] [artifact ...]
+    python benchmarks/pipeline_bench.py compare OLD.json NEW.json
+        [--threshold 0.1] [--min-time 0.01]
+
+Each artifact is measured in a fresh process so its peak memory is its own.
+The stages are timed separately with a fresh reader each (best of N):
+
+    index        parse the container index (central directory, tar headers)
+    readinfo     extract the metadata
+    filehash     hash the whole file
+    inflate      decompress every member
+    fingerprint  inflate and hash every member
+    javaclass    inflate and parse the class files and their members
+    analyze      the whole analysis, descending into nested archives
+    stream       the whole analysis in one pass over a non-seekable stream
+
+``compare`` prints the ratio of every stage and exits with status 1 if one
+is slower than the threshold allows, so it can gate a change in CI.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+from io import BytesIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from victims_hash.analyze import analyze, analyze_stream
+from victims_hash.archive.archive import Archive
+from victims_hash.archive.reader import javaclass
+from victims_hash.archive.reader.registry import extensions, get_reader
+
+import corpus
+
+from javaclass_bench import classes_from
+
+
+class Unseekable(object):
+    """
+    Hides ``seek`` so the stream is read like a pipe.
+    """
+
+    def __init__(self, io):
+        self.io = io
+
+    def read(self, size=-1):
+        return self.io.read(size)
+
+
+def reader_for(path):
+    return get_reader(path, open(path, 'rb'))
+
+
+def stage_index(path):
+    reader = reader_for(path)
+    len(list(reader.readmembers()))
+
+
+def stage_readinfo(path):
+    reader_for(path).readinfo()
+
+
+def stage_filehash(path):
+    Archive(reader_for(path)).filehashes()
+
+
+def stage_inflate(path):
+    reader = reader_for(path)
+    for member in reader.readmembers():
+        for _ in member.chunks():
+            pass
+
+
+def stage_fingerprint(path):
+    Archive(reader_for(path)).fingerprint()
+
+
+def stage_javaclass(path):
+    # Members are fingerprinted without their class header, so the classes
+    # are read whole from the zip.
+    for data in classes_from([path]):
+        parsed = javaclass.ClassData(data)
+        parsed.fields, parsed.methods, parsed.attributes
+
+
+def stage_analyze(path, depth):
+    analyze(path, depth=depth)
+
+
+def stage_stream(path, depth):
+    with open(path, 'rb') as io:
+        analyze_stream(Unseekable(io), path, depth=depth)
+
+
+STAGES = (
+    ('index', stage_index),
+    ('readinfo', stage_readinfo),
+    ('filehash', stage_filehash),
+    ('inflate', stage_inflate),
+    ('fingerprint', stage_fingerprint),
+    ('javaclass', stage_javaclass),
+    ('analyze', stage_analyze),
+    ('stream', stage_stream),
+)
+
+
+def nesting(path):
+    """
+    Nesting depth encoded in a corpus artifact's name, 0 for others.
+    """
+    for part in os.path.basename(path).split('.')[0].split('-'):
+        if part[:1] == 'n' and part[1:].isdigit():
+            return int(part[1:])
+    return 0
+
+
+def count(reader, depth):
+    """
+    Return the number of members, their inflated size and the number of
+    class files of an archive and its nested archives down to `depth`.
+    """
+    members = inflated = classes = 0
+    for member in reader.readmembers():
+        members += 1
+        inflated += len(member.read())
+        classes += member.name.endswith('.class')
+    if depth > 0:
+        for member in reader.readarchives(extensions()):
+            nested = count(get_reader(
+                member.name, BytesIO(member.read())), depth - 1)
+            members += nested[0]
+            inflated += nested[1]
+            classes += nested[2]
+    return members, inflated, classes
+
+
+def timed(function, repeat):
+    """
+    Return the best wall and CPU (user + system) seconds of `repeat` runs.
+    """
+    wall = cpu = None
+    for _ in range(repeat):
+        start, times = time.time(), os.times()
+        function()
+        end, after = time.time(), os.times()
+        spent = (after[0] - times[0]) + (after[1] - times[1])
+        wall = end - start if wall is None else min(wall, end - start)
+        cpu = spent if cpu is None else min(cpu, spent)
+    return wall, cpu
+
+
+def measure(path, repeat):
+    """
+    Measure all stages for one artifact in this process.
+    """
+    depth = nesting(path)
+    members, inflated, classes = count(reader_for(path), depth)
+    stages = {}
+    for (name, function) in STAGES:
+        if name == 'javaclass' and not classes:
+            continue
+        if name in ('analyze', 'stream'):
+            call = lambda function=function: function(path, depth)
+        else:
+            call = lambda function=function: function(path)
+        wall, cpu = timed(call, repeat)
+        stages[name] = {
+            'wall': wall,
+            'cpu': cpu,
+            'mb_per_s': os.path.getsize(path) / wall / 1e6 if wall else None,
+            'members_per_s': members / wall if wall else None,
+        }
+    return {
+        'path': path,
+        'bytes': os.path.getsize(path),
+        'inflated': inflated,
+        'members': members,
+        'depth': depth,
+        'stages': stages,
+        # Kilobytes on Linux.
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    paths = args.artifacts or corpus.generate(
+        args.corpus, corpus.PRESETS[args.preset])
+    results = []
+    for path in paths:
+        output = subprocess.check_output([
+            sys.executable, os.path.abspath(__file__), 'measure', path,
+            '--repeat', str(args.repeat)])
+        result = json.loads(output)
+        results.append(result)
+        print "%-40s %8.1f MB %8d members %8d KB peak" % (
+            os.path.basename(path), result['bytes'] / 1e6,
+            result['members'], result['peak_rss_kb'])
+        for (name, _) in STAGES:
+            stage = result['stages'].get(name)
+            if stage is not None:
+                print "    %-12s %8.3fs wall %8.3fs cpu %8.1f MB/s " \
+                    "%10.0f members/s" % (
+                        name, stage['wall'], stage['cpu'],
+                        stage['mb_per_s'] or 0, stage['members_per_s'] or 0)
+
+    report = {
+        'revision': revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': int(time.time()),
+        'repeat': args.repeat,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as out:
+            json.dump(report, out, indent=2, sort_keys=True)
+
+
+def compare(args):
+    with open(args.old) as io:
+        old = dict((os.path.basename(r['path']), r)
+                   for r in json.load(io)['results'])
+    with open(args.new) as io:
+        new = dict((os.path.basename(r['path']), r)
+                   for r in json.load(io)['results'])
+
+    regressions = 0
+    for artifact in sorted(set(old) & set(new)):
+        print artifact
+        for (name, _) in STAGES:
+            before = old[artifact]['stages'].get(name)
+            after = new[artifact]['stages'].get(name)
+            if not before or not after or not before['wall']:
+                continue
+            ratio = after['wall'] / before['wall']
+            flag = ''
+            if ratio > 1 + args.threshold and \
+                    after['wall'] - before['wall'] >= args.min_time:
+                flag = '  REGRESSION'
+                regressions += 1
+            print "    %-12s %8.3fs -> %8.3fs %6.2fx%s" % (
+                name, before['wall'], after['wall'], ratio, flag)
+        rss = (old[artifact]['peak_rss_kb'], new[artifact]['peak_rss_kb'])
+        print "    %-12s %8d KB -> %8d KB" % (('peak rss',) + rss)
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    commands = parser.add_subparsers(dest='command')
+
+    run_parser = commands.add_parser('run', help='Benchmark a corpus.')
+    run_parser.add_argument('artifacts', nargs='*',
+                            help='Artifacts to use instead of the corpus.')
+    run_parser.add_argument('--preset', default='quick',
+                            choices=sorted(corpus.PRESETS))
+    run_parser.add_argument('--corpus', default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'corpus'),
+        help='Directory the corpus is generated in.')
+    run_parser.add_argument('--repeat', default=3, type=int)
+    run_parser.add_argument('--output', help='Write the results as JSON.')
+
+    measure_parser = commands.add_parser('measure')
+    measure_parser.add_argument('path')
+    measure_parser.add_argument('--repeat', default=3, type=int)
+
+    compare_parser = commands.add_parser(
+        'compare', help='Compare two result files.')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument(
+        '--threshold', default=0.1, type=float,
+        help='Slowdown of a stage, as a fraction, counted as a regression.')
+    compare_parser.add_argument(
+        '--min-time', default=0.01, type=float,
+        help='Seconds a stage must slow down by to count, below is noise.')
+
+    args = parser.parse_args()
+    if args.command == 'measure':
+        print json.dumps(measure(args.path, args.repeat))
+    elif args.command == 'run':
+        run(args)
+    else:
+        return compare(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
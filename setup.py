@@ -28,7 +28,13 @@ setup(
     package_dir={'': 'src'},
     include_package_data=True,
 
-    #test_suite="",
+    entry_points={
+        'console_scripts': [
+            'victims_hash = victims_hash.__main__:main',
+        ],
+    },
+
+    test_suite="tests",
 
     classifiers=[
         'Intended Audience :: Developers',
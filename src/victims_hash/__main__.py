@@ -0,0 +1,32 @@
+"""
+Command line entry point::
+
+    python -m victims_hash batch [options] PATH...
+    python -m victims_hash index {add,query,compact} INDEX ...
+"""
+
+import sys
+
+
+COMMANDS = {
+    'batch': 'victims_hash.batch',
+    'index': 'victims_hash.index',
+}
+
+
+def main(argv=None):
+    """
+    Dispatch to the requested sub command.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in COMMANDS:
+        sys.stderr.write(
+            "usage: victims_hash {%s} ...\n" % ",".join(sorted(COMMANDS)))
+        return 2
+
+    module = __import__(COMMANDS[argv[0]], fromlist=['main'])
+    return module.main(argv[1:])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,391 @@
+from multiprocessing.pool import ThreadPool
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+from archive.archive import Archive
+from archive.reader import BUFFER_SIZE, Member
+from archive.reader.registry import extensions, find_reader, get_reader, peek
+from archive.reader.zipstream import TeeReader
+from sidecar import MODES, TRUST, VERIFY, read_sidecars, verify
+from similarity import add_sketch
+
+
+# Inner archives larger than this are not descended into by default.
+MAX_NESTED_SIZE = 256 * 1024 * 1024
+
+
+class Cancelled(Exception):
+    """
+    Raised by a `progress` callable to stop an analysis. Unlike the other
+    errors of an inner archive it is not recorded in the result but stops
+    the outer archive too.
+    """
+
+
+def analyze(source, name=None, algorithms=["sha512", "sha1"],
+            hashes=True, meta=True, cache=None, member_cache=None,
+            depth=0, max_size=MAX_NESTED_SIZE, workers=1, normalize=False,
+            sketch=False, previous=None, members=False, progress=None,
+            metrics=None, hash_workers=1, scopes=None, sidecar=None,
+            checksums=None, trust_record=False):
+    """
+    Open an artifact once and return its fingerprint and metadata.
+
+    The result is a dict holding ``hash`` and ``hashes`` (see
+    ``Archive.fingerprint``) and ``meta`` (see ``Archive.metadata``).
+    When descending into nested archives it also holds ``archives``, a list
+    with the result of every inner archive plus its ``name``.
+
+    :Parameters:
+       - `source`: Path of the artifact or a file-like object.
+       - `name`: Name used to pick the reader. Defaults to the path or the
+         ``name`` attribute of the file-like object.
+       - `algorithms`: Hash algorithms to fingerprint with.
+       - `hashes`: Include the fingerprint in the result.
+       - `meta`: Include the metadata in the result.
+       - `cache`: Optional ``FingerprintCache`` consulted before and
+         updated after analyzing a path.
+       - `member_cache`: Optional ``MemberCache`` of member digests shared
+         between archives.
+       - `depth`: How many levels of nested archives to descend into.
+       - `max_size`: Largest inner archive, in bytes, to descend into.
+       - `workers`: Threads analyzing inner archives in parallel.
+       - `hash_workers`: Threads inflating and hashing the members of each
+         archive, see ``Archive``.
+       - `scopes`: Optional {format: ``Scope``} of the members to
+         fingerprint, replacing the defaults of the readers (see
+         ``archive.reader.scope``).
+       - `normalize`: Hash class files in their compiler independent
+         normal form (see ``archive.reader.normalize``).
+       - `sketch`: Add a MinHash ``sketch`` of the members to every
+         fingerprint (see ``similarity``).
+       - `previous`: Result of an earlier analysis of the artifact whose
+         unchanged member digests are reused. Adds a ``diff`` of the
+         members to the result (see ``Archive.fingerprint``).
+       - `members`: Include the container key of every member, needed by
+         later incremental runs.
+       - `progress`: Optional callable invoked with every member before it
+         is hashed (see ``Archive``) and every inner archive before it is
+         read. Raising `Cancelled` stops the whole analysis.
+       - `metrics`: Optional ``metrics.Metrics`` recording stage timings
+         and counters of this and the nested archives.
+       - `sidecar`: How to use the known digests of the whole artifact:
+         ``"trust"`` them instead of reading it, or ``"verify"`` them
+         against the digest computed in the same pass as the members,
+         raising ``sidecar.ChecksumMismatch`` (see ``sidecar``).
+       - `checksums`: {algorithm: hexdigest} of the whole artifact. Read
+         from the checksum files next to a path by default.
+       - `trust_record`: Use the member digests an archive lists itself
+         (the RECORD of a wheel) instead of hashing those members. They
+         are not verified, only set this for archives from a trusted
+         source.
+    """
+    if sidecar is not None:
+        if sidecar not in MODES:
+            raise ValueError("Unknown sidecar mode %r" % sidecar)
+        if checksums is None and isinstance(source, basestring):
+            checksums = read_sidecars(source, algorithms)
+        if not checksums or not hashes:
+            sidecar = checksums = None
+
+    if sketch:
+        result = analyze(
+            source, name, algorithms, hashes, meta, cache, member_cache,
+            depth, max_size, workers, normalize, previous=previous,
+            members=members, progress=progress, metrics=metrics,
+            hash_workers=hash_workers, scopes=scopes, sidecar=sidecar,
+            checksums=checksums, trust_record=trust_record)
+        if hashes:
+            add_sketch(result, "sha512" if "sha512" in algorithms
+                       else algorithms[0])
+        return result
+
+    options = dict(
+        algorithms=algorithms, hashes=hashes, meta=meta,
+        member_cache=member_cache, depth=depth, max_size=max_size,
+        normalize=normalize, members=members, progress=progress,
+        metrics=metrics, hash_workers=hash_workers, scopes=scopes,
+        trust_record=trust_record)
+
+    # A result diffed against an earlier one is specific to it, so it is
+    # neither looked up in nor stored into the cache.
+    if cache is not None and previous is None and \
+            isinstance(source, basestring):
+        key = "%s;hashes=%s;meta=%s;depth=%s;max_size=%s;normalize=%s" % (
+            ",".join(algorithms), hashes, meta, depth, max_size, normalize)
+        if members:
+            key += ";members"
+        if trust_record:
+            key += ";trust_record"
+        if scopes:
+            key += ";scopes=%r" % sorted(scopes.items())
+        # The file is only read up front when it changed since its digest
+        # was recorded and the analysis would not compute it anyway.
+        digest, stamp = cache.recorded(source)
+        if sidecar == TRUST and checksums.get("sha512"):
+            digest = checksums["sha512"]
+        elif digest is None and not (hashes and "sha512" in algorithms):
+            digest = cache.digest(source)
+        result = cache.get(digest, key)
+        if result is None:
+            if metrics is not None:
+                metrics.count("cache_misses")
+            result = analyze(source, name, workers=workers, sidecar=sidecar,
+                             checksums=checksums, **options)
+            if digest is None:
+                digest = result["hashes"]["sha512"]["combined"]
+                if not digest:
+                    digest = cache.digest(source)
+                cache.record(stamp, digest)
+            cache.put(digest, result, key)
+        else:
+            if metrics is not None:
+                metrics.count("cache_hits")
+            if sidecar == VERIFY:
+                verify(result, checksums, name or source)
+        return result
+
+    if isinstance(source, basestring):
+        name = name or source
+        io = open(source, "rb")
+    else:
+        name = name or getattr(source, "name", None)
+        io = source
+
+    pool = None
+    try:
+        # The digest of the whole file is computed from the same read as
+        # the members instead of a read of its own, always for the formats
+        # that are read sequentially anyway.
+        single = hashes and previous is None and not members and (
+            (sidecar == VERIFY and member_cache is None) or
+            find_reader(name, peek(io)).sequential)
+        if single:
+            result = analyze_stream(
+                io, name, algorithms, hashes, meta, depth, max_size,
+                normalize, progress, metrics, scopes, member_cache,
+                hash_workers, checksums if sidecar == TRUST else None,
+                trust_record)
+        else:
+            if depth > 0 and workers > 1:
+                pool = ThreadPool(workers)
+            result = _analyze(
+                get_reader(name, io, normalize, scopes), pool,
+                previous=previous,
+                checksums=checksums if sidecar == TRUST else None,
+                **options)
+        if sidecar == VERIFY:
+            verify(result, checksums, name)
+            if metrics is not None:
+                metrics.count("checksums_verified")
+        return result
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        # Only close what was opened here.
+        if io is not source and not io.closed:
+            io.close()
+
+
+def _analyze(reader, pool, algorithms, hashes, meta, member_cache, depth,
+             max_size, normalize, members=False, previous=None,
+             progress=None, metrics=None, hash_workers=1, scopes=None,
+             checksums=None, trust_record=False):
+    """
+    Analyze the archive behind a reader, then its nested archives.
+    """
+    reader.trust_record = trust_record
+    archive = Archive(
+        reader, algorithms, member_cache, progress, metrics, hash_workers,
+        checksums=checksums)
+    if metrics is not None:
+        metrics.count("archives")
+    result = {}
+    if hashes:
+        result.update(archive.fingerprint(previous, members))
+    if meta:
+        result.update(archive.metadata())
+    if depth <= 0:
+        return result
+
+    options = dict(
+        algorithms=algorithms, hashes=hashes, meta=meta,
+        member_cache=member_cache, depth=depth - 1, max_size=max_size,
+        normalize=normalize, members=members, progress=progress,
+        metrics=metrics, hash_workers=hash_workers, scopes=scopes,
+        trust_record=trust_record)
+    earlier = {}
+    if previous is not None:
+        earlier = dict(
+            (inner["name"], inner) for inner in previous.get("archives", [])
+            if "hashes" in inner)
+
+    def nested(job):
+        return _nested(job[0], job[1], earlier.get(job[0]), options)
+
+    # Inner archives are read from the container one at a time and
+    # analyzed in batches, so at most one batch is held in memory.
+    batchsize = pool._processes if pool is not None else 1
+    mapper = pool.map if pool is not None else map
+    result["archives"] = archives = []
+    batch = []
+    for member in reader.readarchives(extensions()):
+        if progress is not None:
+            progress(member)
+        if member.size is not None and member.size > max_size:
+            batch.append((member.name, None))
+        else:
+            batch.append((member.name, member.read()))
+        if len(batch) >= batchsize:
+            archives.extend(mapper(nested, batch))
+            batch = []
+    if batch:
+        archives.extend(mapper(nested, batch))
+    return result
+
+
+def _nested(name, content, previous, options):
+    """
+    Analyze the content of an inner archive, None if it was too large.
+    """
+    if content is None:
+        if options["metrics"] is not None:
+            options["metrics"].count("archives_skipped")
+        return {"name": name,
+                "skipped": "larger than %i bytes" % options["max_size"]}
+    try:
+        inner = _analyze(
+            get_reader(name, StringIO(content), options["normalize"],
+                       options["scopes"]),
+            None, previous=previous, **options)
+    except Cancelled:
+        raise
+    except Exception, ex:
+        inner = {"error": "%s: %s" % (type(ex).__name__, ex)}
+    inner["name"] = name
+    return inner
+
+
+def analyze_stream(stream, name, algorithms=["sha512", "sha1"], hashes=True,
+                   meta=True, depth=0, max_size=MAX_NESTED_SIZE,
+                   normalize=False, progress=None, metrics=None,
+                   scopes=None, member_cache=None, hash_workers=1,
+                   checksums=None, trust_record=False):
+    """
+    Like `analyze`, for a stream that can only be read once from start to
+    end, eg. an HTTP response. The digest of the whole artifact is
+    computed from the bytes going by while its members are read in the
+    same pass, so it does not need to be saved to disk first. Only the
+    files `readinfo` needs and the inner archives are held in memory.
+
+    :Parameters:
+       - `stream`: File-like object with a ``read`` method.
+       - `name`: Name used to pick the reader.
+       - `algorithms`, `hashes`, `meta`, `depth`, `max_size`, `normalize`,
+         `progress`, `metrics`, `scopes`, `member_cache`: See `analyze`.
+       - `hash_workers`, `trust_record`: See `analyze`, used by the
+         nested archives.
+       - `checksums`: Optional {algorithm: hexdigest} of the whole
+         artifact, trusted instead of hashing the stream for those
+         algorithms.
+    """
+    known = dict((alg, checksums[alg]) for alg in algorithms
+                 if alg in (checksums or {}))
+    missing = [alg for alg in algorithms if alg not in known]
+    tee = TeeReader(stream, missing)
+    reader = get_reader(name, tee, normalize, scopes)
+    archive = Archive(reader, algorithms, member_cache, progress, metrics)
+    options = dict(
+        algorithms=algorithms, hashes=hashes, meta=meta,
+        member_cache=member_cache, depth=depth - 1, max_size=max_size,
+        normalize=normalize, progress=progress, metrics=metrics,
+        hash_workers=hash_workers, scopes=scopes, trust_record=trust_record)
+
+    files = dict((alg, {}) for alg in algorithms)
+    archives = []
+    nested = extensions() if depth > 0 else ()
+    count = 0
+    for (kind, member) in reader.readsequential(nested):
+        if kind == "member":
+            if hashes:
+                if progress is not None:
+                    progress(member)
+                # Without its size up front a member is selected by name,
+                # the size bounds are checked once it was read.
+                counted = member.size is None and reader.scope.sized
+                if counted:
+                    member = _CountedMember(member)
+                checksums = archive.memberhashes(member)
+                if counted and not reader.scope.match(
+                        member.name, member.size):
+                    continue
+                for (alg, checksum) in checksums.iteritems():
+                    files[alg][checksum] = member.name
+                count += 1
+        else:
+            if progress is not None:
+                progress(member)
+            archives.append(_nested(
+                member.name, _readlimited(member, max_size), None, options))
+    if missing:
+        tee.drain()
+    if metrics is not None:
+        # Reading the stream is the whole file hash, nested archives are
+        # timed on their own, so only counters are recorded here.
+        metrics.count("archives")
+        metrics.count("members", count)
+        metrics.count("bytes_read", tee.tell())
+        if not missing:
+            metrics.count("checksums_trusted")
+
+    result = {}
+    if hashes:
+        combined = tee.hexdigests()
+        combined.update(known)
+        result["hash"] = combined.get("sha512", "")
+        result["hashes"] = dict(
+            (alg, {"combined": combined[alg], "files": files[alg]})
+            for alg in algorithms)
+    if meta:
+        result.update(archive.metadata())
+    if depth > 0:
+        result["archives"] = archives
+    return result
+
+
+class _CountedMember(Member):
+    """
+    A member whose size is learned while it is read.
+    """
+
+    def __init__(self, member):
+        Member.__init__(self, member.name, member.open, member.key)
+        self.recorded = member.recorded
+
+    def chunks(self, size=BUFFER_SIZE):
+        total = 0
+        for buff in Member.chunks(self, size):
+            total += len(buff)
+            yield buff
+        self.size = total
+
+
+def _readlimited(member, max_size):
+    """
+    Return the content of a member, or None if it is larger than
+    `max_size` bytes.
+    """
+    if member.size is not None and member.size > max_size:
+        return None
+    chunks = []
+    size = 0
+    for buff in member.chunks():
+        size += len(buff)
+        if size > max_size:
+            return None
+        chunks.append(buff)
+    return b''.join(chunks)
@@ -1,24 +1,149 @@
 import hashlib
+import threading
+import time
+
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+from victims_hash.archive.reader import BUFFER_SIZE
+from victims_hash.metrics import NULL
+
+
+# Bytes of members hashed at the same time in parallel mode.
+MAX_INFLIGHT = 64 * 1024 * 1024
+
+
+class MultiDigest(object):
+    """
+    Feeds the same data to several hashlib digests at once so every
+    algorithm is computed from a single read of the input.
+    """
+
+    def __init__(self, algorithms):
+        """
+        Creates a new set of digests.
+
+        :Parameters:
+           - `algorithms`: List of hashlib algorithm names.
+        """
+        self.digests = [(alg, hashlib.new(alg)) for alg in algorithms]
+
+    def update(self, data):
+        for (_, digest) in self.digests:
+            digest.update(data)
+
+    def hexdigests(self):
+        """
+        Return a dict of algorithm name to hex digest.
+        """
+        return dict((alg, digest.hexdigest()) for (alg, digest) in self.digests)
+
+
+class ByteBudget(object):
+    """
+    Limits the total size of the members being hashed at once. A member
+    larger than the whole budget is let through alone.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, size):
+        with self.condition:
+            while self.used and self.used + size > self.limit:
+                self.condition.wait()
+            self.used += size
+
+    def release(self, size):
+        with self.condition:
+            self.used -= size
+            self.condition.notify_all()
+
 
 class Archive(object):
 
-    def __init__(self, reader, algorithms=["sha512", "sha1"]):
+    def __init__(self, reader, algorithms=["sha512", "sha1"],
+                 member_cache=None, progress=None, metrics=None, workers=1,
+                 max_inflight=MAX_INFLIGHT, checksums=None):
+        """
+        Creates an archive.
+
+        :Parameters:
+           - `reader`: ``ArchiveReader`` for the archive.
+           - `algorithms`: Hash algorithms to fingerprint with.
+           - `member_cache`: Optional ``MemberCache`` of member digests.
+           - `progress`: Optional callable invoked with every member before
+             it is hashed. Exceptions it raises abort the fingerprint.
+           - `metrics`: Optional ``Metrics`` recording stage timings and
+             counters, also passed on to the reader.
+           - `workers`: Threads inflating and hashing members, for readers
+             whose members can be read concurrently. Inflating and hashing
+             release the GIL, so large members use several cores. The
+             fingerprint is the same as with one.
+           - `max_inflight`: Bytes of (uncompressed) members hashed at the
+             same time when `workers` is above one.
+           - `checksums`: Optional {algorithm: hexdigest} of the whole
+             file known beforehand (see ``sidecar``), trusted instead of
+             reading the file for those algorithms.
+        """
         self.reader = reader
         self.algorithms = algorithms
+        self.member_cache = member_cache
+        self.progress = progress
+        self.workers = workers
+        self.max_inflight = max_inflight
+        self.checksums = checksums or {}
+        self.metrics = NULL
+        if metrics is not None:
+            self.metrics = reader.metrics = metrics
 
     def metadata(self):
         """
         Read all metadata associated with this archive
         """
-        return {
-            "meta" : self.reader.readinfo()
-        }
+        with self.metrics.stage("metadata"):
+            return {
+                "meta" : self.reader.readinfo()
+            }
+
+    def filehashes(self):
+        """
+        Hash the whole archive file once for every algorithm that has no
+        known checksum. The file is not read at all if they all have one.
+        """
+        known = dict((alg, self.checksums[alg]) for alg in self.algorithms
+                     if alg in self.checksums)
+        missing = [alg for alg in self.algorithms if alg not in known]
+        if not missing:
+            self.metrics.count("checksums_trusted")
+            return known
+
+        size = 0
+        with self.metrics.stage("filehash"):
+            try:
+                self.reader.io.seek(0)
+                digests = MultiDigest(missing)
+                for buff in iter(
+                        lambda: self.reader.io.read(BUFFER_SIZE), b''):
+                    size += len(buff)
+                    digests.update(buff)
+                known.update(digests.hexdigests())
+                return known
+            except:
+                return dict((alg, "") for alg in self.algorithms)
+            finally:
+                self.reader.io.seek(0)
+                self.metrics.count("bytes_read", size)
 
     def filehash(self, algorithm):
+        if algorithm in self.checksums:
+            return self.checksums[algorithm]
         try:
             self.reader.io.seek(0)
             digest = hashlib.new(algorithm)
-            for buff in iter(self.reader.io.read, b''):
+            for buff in iter(lambda: self.reader.io.read(BUFFER_SIZE), b''):
                 digest.update(buff)
             return digest.hexdigest()
         except:
@@ -26,34 +151,242 @@ class Archive(object):
         finally:
             self.reader.io.seek(0)
 
-    def fingerprint(self):
+    def memberhashes(self, member):
         """
-        Create a fingerprint for this archive
+        Hash a member for every algorithm, consulting the digests recorded
+        by the archive and the member cache.
         """
-        hashes = {}
-        filehash = ""
+        metrics = self.metrics
+        recorded = member.recorded
+        if recorded and all(alg in recorded for alg in self.algorithms):
+            metrics.count("members_recorded")
+            return dict((alg, recorded[alg]) for alg in self.algorithms)
 
-        for algorithm in self.algorithms:
+        cache = self.member_cache
+        if cache is not None:
+            checksums = cache.get(member, self.algorithms)
+            if checksums is not None:
+                metrics.count("member_cache_hits")
+                return checksums
+            metrics.count("member_cache_misses")
 
-            files = {}
-            combined = self.filehash(algorithm)
+        digests = MultiDigest(self.algorithms)
+        if metrics.enabled:
+            self._timedhash(member, digests)
+        else:
+            for buff in member.chunks():
+                digests.update(buff)
+        checksums = digests.hexdigests()
 
-            for (filename, content) in self.reader.readfiles():
-                h = hashlib.new(algorithm)
-                h.update(content)
+        if cache is not None:
+            cache.put(member, checksums)
+        return checksums
 
-                checksum = h.hexdigest()
-                files[checksum] = filename
+    def _timedhash(self, member, digests):
+        """
+        Feed a member to `digests`, timing reading (inflating) and hashing
+        apart.
+        """
+        inflate = digest = 0.0
+        size = 0
+        chunks = member.chunks()
+        while True:
+            start = time.time()
+            buff = next(chunks, None)
+            read = time.time()
+            if buff is None:
+                inflate += read - start
+                break
+            digests.update(buff)
+            inflate += read - start
+            digest += time.time() - read
+            size += len(buff)
+        self.metrics.time("inflate", inflate)
+        self.metrics.time("hash", digest)
+        self.metrics.count("bytes_inflated", size)
+        self.metrics.count("members_hashed")
+
+    def fingerprint(self, previous=None, members=False):
+        """
+        Create a fingerprint for this archive. The archive is read and each
+        member decompressed exactly once no matter how many algorithms
+        are requested.
 
-            if algorithm == "sha512":
-                filehash = combined
+        Given the fingerprint of an earlier version of the archive, made
+        with ``members`` and the same algorithms, the digests of members
+        whose name and container key (for zip: CRC32, sizes and method)
+        are unchanged are reused instead of recomputed, and a ``diff``
+        of the added, removed and changed members is included. Without
+        ``members`` nothing is reused and members sharing their content
+        with another one may be reported as added.
 
+        :Parameters:
+           - `previous`: Optional earlier fingerprint of the archive.
+           - `members`: Include ``members``, the container key of every
+             member, which later incremental runs compare against.
+        """
+        combined = self.filehashes()
+        files = dict((alg, {}) for alg in self.algorithms)
+        keys = {}
+        names = {}
+
+        reuse = {}
+        if previous is not None:
+            reuse = self._previous_digests(previous)
+        reused = 0
+
+        with self.metrics.stage("fingerprint"):
+            for (member, key, checksums, known) in self._hashmembers(reuse):
+                reused += known
+                for (alg, checksum) in checksums.iteritems():
+                    files[alg][checksum] = member.name
+                keys[member.name] = key
+                names[member.name] = checksums[self.algorithms[0]]
+        self.metrics.count("members", len(keys))
+        if reused:
+            self.metrics.count("members_reused", reused)
+
+        hashes = {}
+        for algorithm in self.algorithms:
             hashes[algorithm] = {
-                    "combined"  : combined,
-                    "files"     : files
+                    "combined"  : combined[algorithm],
+                    "files"     : files[algorithm]
             }
 
-        return {
-            "hash": filehash,
+        result = {
+            "hash": combined.get("sha512", ""),
             "hashes": hashes
         }
+        if members or previous is not None:
+            result["members"] = keys
+        if previous is not None:
+            result["diff"] = self._diff(previous, keys, names)
+            result["diff"]["reused"] = reused
+        return result
+
+    def _hashmembers(self, reuse):
+        """
+        Yield (member, key, checksums, reused) for every member, in archive
+        order however they were hashed.
+        """
+        if self.workers > 1 and self.reader.concurrent:
+            return self._hashparallel(reuse)
+        return self._hashserial(reuse)
+
+    def _lookup(self, member, reuse):
+        """
+        Return the key of a member, as a list, and its reused checksums or
+        None.
+        """
+        if self.progress is not None:
+            self.progress(member)
+        key = list(member.key) if member.key is not None else None
+        entry = reuse.get(member.name)
+        if key is not None and entry is not None and entry[0] == key:
+            return key, entry[1]
+        return key, None
+
+    def _hashserial(self, reuse):
+        for member in self.reader.readmembers():
+            key, checksums = self._lookup(member, reuse)
+            if checksums is not None:
+                yield (member, key, checksums, True)
+            else:
+                yield (member, key, self.memberhashes(member), False)
+
+    def _hashparallel(self, reuse):
+        """
+        Hash members on a thread pool. Members are submitted in archive
+        order as long as the byte budget allows and their results handed
+        back in that order as they complete.
+        """
+        budget = ByteBudget(self.max_inflight)
+        pool = ThreadPool(self.workers)
+        queue = deque()
+
+        def hashmember(member, size):
+            try:
+                return self.memberhashes(member)
+            finally:
+                budget.release(size)
+
+        try:
+            for member in self.reader.readmembers():
+                key, checksums = self._lookup(member, reuse)
+                if checksums is not None:
+                    queue.append((member, key, checksums, True))
+                else:
+                    # Members of unknown size count as one buffer.
+                    size = member.size if member.size is not None \
+                        else BUFFER_SIZE
+                    budget.acquire(size)
+                    queue.append((member, key, pool.apply_async(
+                        hashmember, (member, size)), False))
+                while queue and (queue[0][3] or queue[0][2].ready()):
+                    yield self._completed(queue.popleft())
+            while queue:
+                yield self._completed(queue.popleft())
+        finally:
+            # Drop what is still queued if we stopped early (eg. cancelled
+            # through `progress`).
+            pool.terminate()
+            pool.join()
+
+    def _completed(self, entry):
+        member, key, checksums, known = entry
+        if not known:
+            checksums = checksums.get()
+        return (member, key, checksums, known)
+
+    def _previous_digests(self, previous):
+        """
+        Return {name: (key, {algorithm: digest})} for the members of an
+        earlier fingerprint that can be reused.
+        """
+        keys = previous.get("members")
+        hashes = previous.get("hashes", {})
+        if not keys or not all(alg in hashes for alg in self.algorithms):
+            return {}
+
+        digests = {}
+        for alg in self.algorithms:
+            for (checksum, name) in hashes[alg]["files"].iteritems():
+                digests.setdefault(name, {})[alg] = checksum
+
+        # Members sharing their content with another one only appear once
+        # in the digest maps, those are simply hashed again.
+        return dict(
+            (name, (keys[name], checksums))
+            for (name, checksums) in digests.iteritems()
+            if len(checksums) == len(self.algorithms) and
+            keys.get(name) is not None)
+
+    def _diff(self, previous, keys, names):
+        """
+        Compare the members of an earlier fingerprint with the current ones,
+        by digest, or by container key for members whose earlier digest is
+        not known because another member had the same content.
+        """
+        algorithm = self.algorithms[0]
+        before = {}
+        files = previous.get("hashes", {}).get(algorithm, {}).get("files", {})
+        for (checksum, name) in files.iteritems():
+            before[name] = checksum
+        previous_keys = previous.get("members") or {}
+
+        old = set(previous_keys) | set(before)
+        new = set(keys)
+        changed = []
+        for name in old & new:
+            if name in before:
+                if before[name] != names[name]:
+                    changed.append(name)
+            elif previous_keys.get(name) != keys[name]:
+                changed.append(name)
+
+        return {
+            "added": sorted(new - old),
+            "removed": sorted(old - new),
+            "changed": sorted(changed),
+        }
+
@@ -0,0 +1,103 @@
+"""
+Memoization of member digests across archives.
+"""
+
+import threading
+
+from collections import OrderedDict
+
+
+class MemberCache(object):
+    """
+    In memory LRU cache of member digests keyed on the identity recorded in
+    the container index (for zip: CRC32, compressed size, size and method).
+    A key match is confirmed against a digest of the stored compressed
+    bytes before it is trusted, so a hit skips decompression and hashing
+    but never returns the digests of different content.
+    """
+
+    def __init__(self, max_entries=100000, verify=True):
+        """
+        Creates an empty cache.
+
+        :Parameters:
+           - `max_entries`: Number of members to remember.
+           - `verify`: Confirm key matches against the stored bytes.
+        """
+        self.max_entries = max_entries
+        self.verify = verify
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    def get(self, member, algorithms):
+        """
+        Return the cached {algorithm: hexdigest} of a member, or None.
+
+        :Parameters:
+           - `member`: ``Member`` to look up.
+           - `algorithms`: Algorithms that must all be present.
+        """
+        if member.key is None:
+            return self._miss()
+        # Read the stored bytes outside of the lock, a miss needs them too.
+        check = member.rawdigest() if self.verify else None
+
+        with self.lock:
+            entry = self.entries.pop(member.key, None)
+            if entry is None:
+                return self._miss()
+
+            # Re-insert to mark it as most recently used.
+            self.entries[member.key] = entry
+            if self.verify and check != entry[0]:
+                self.rejected += 1
+                return self._miss()
+            if not all(alg in entry[1] for alg in algorithms):
+                return self._miss()
+
+            self.hits += 1
+            return entry[1]
+
+    def _miss(self):
+        self.misses += 1
+        return None
+
+    def put(self, member, checksums):
+        """
+        Remember the digests of a member.
+
+        :Parameters:
+           - `member`: ``Member`` the digests were computed from.
+           - `checksums`: {algorithm: hexdigest} of the member.
+        """
+        if member.key is None:
+            return
+        check = member.rawdigest() if self.verify else None
+        if check is None and self.verify:
+            return
+
+        with self.lock:
+            entry = self.entries.pop(member.key, None)
+            if entry is not None and entry[0] == check:
+                merged = dict(entry[1])
+                merged.update(checksums)
+                checksums = merged
+            self.entries[member.key] = (check, checksums)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        """
+        Return the hit/miss counters of the cache.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "rejected": self.rejected,
+            "entries": len(self.entries),
+            "hit_rate": float(self.hits) / lookups if lookups else 0.0,
+        }
@@ -2,20 +2,147 @@
 Archive reader classes.
 """
 
+from victims_hash.archive.reader.scope import Scope
+from victims_hash.metrics import NULL
+
+
+# Size of the chunks members and archives are read and hashed in.
+BUFFER_SIZE = 64 * 1024
+
+
+class Member(object):
+    """
+    A file within an archive.
+    """
+
+    def __init__(self, name, open, key=None, size=None):
+        """
+        Creates a member.
+
+        :Parameters:
+           - `name`: Name of the member within the archive.
+           - `open`: Callable returning a file-like object positioned at the
+             content of the member to fingerprint.
+           - `key`: Cheap identity of the content taken from the container
+             index, eg. (crc32, compressed size, size) for zip, or None.
+           - `size`: Uncompressed size of the member if known.
+        """
+        self.name = name
+        self.key = key
+        self.size = size
+        self._open = open
+        # Digests of the content known without reading it, eg. listed by
+        # the archive itself: {algorithm: hexdigest}.
+        self.recorded = {}
+
+    def open(self):
+        """
+        Return a file-like object streaming the content of the member.
+        """
+        return self._open()
+
+    def chunks(self, size=BUFFER_SIZE):
+        """
+        Yield the content of the member in chunks of at most `size` bytes.
+        """
+        stream = self.open()
+        try:
+            for buff in iter(lambda: stream.read(size), b''):
+                yield buff
+        finally:
+            stream.close()
+
+    def read(self):
+        """
+        Return the whole content of the member.
+        """
+        return b''.join(self.chunks())
+
+    def rawdigest(self):
+        """
+        Digest of the stored (still compressed) bytes of the member, used to
+        confirm a `key` match without decompressing. None if unsupported.
+        """
+        return None
+
 
 class ArchiveReader(object):
     """
     Master reader class.
     """
 
-    def __init__(self, io):
+    # Name of the format, used to configure it (see `scope`).
+    format = None
+
+    # Lower case file extensions, with the dot, the reader handles.
+    extensions = ()
+
+    # Members fingerprinted unless another ``Scope`` is given.
+    scope = Scope()
+
+    # ``Metrics`` the reader records into, set by ``Archive``.
+    metrics = NULL
+
+    # Whether the members returned by `readmembers` can be read at the
+    # same time from several threads.
+    concurrent = False
+
+    # Whether the archive can only be read front to back (eg. a tarball),
+    # so reading its members is a pass over the whole file anyway.
+    sequential = False
+
+    # Whether digests the archive lists for its members (eg. the RECORD of
+    # a wheel) are used instead of hashing them. Whoever built the archive
+    # wrote them, nothing checks them against the content.
+    trust_record = False
+
+    @classmethod
+    def sniff(cls, head):
+        """
+        Whether the first bytes of a file are in a format the reader
+        handles.
+
+        :Parameters:
+           - `head`: Up to the first 512 bytes of the file.
+        """
+        return False
+
+    def __init__(self, io, normalize=False, scope=None):
         """
         Creates an instance of a reader.
 
         :Parameters:
            - `io`: File-like object.
+           - `normalize`: Fingerprint members in their normal form where
+             the format has one (class files).
+           - `scope`: ``Scope`` of the members to fingerprint, replacing
+             the reader's default (whose include globs it inherits if it
+             has none).
         """
         self.io = io
+        self.normalize = normalize
+        if scope is not None:
+            self.scope = scope.inherit(self.scope)
+        self._container = None
+
+    @property
+    def container(self):
+        """
+        The parsed container (zip central directory, tar index) for the
+        archive. It is built on first use and shared by all readers so the
+        index is only parsed once per archive.
+        """
+        if self._container is None:
+            with self.metrics.stage("index"):
+                self.io.seek(0)
+                self._container = self.opencontainer()
+        return self._container
+
+    def opencontainer(self):
+        """
+        Parse the container index of the archive.
+        """
+        raise NotImplementedError('opencontainer must be implemented.')
 
     def readinfo(self, hints={}):
         """
@@ -30,11 +157,58 @@ class ArchiveReader(object):
         """
         Read files within the archive and return their content
         """
-        raise NotImplementedError('readfiles must be implemented.')
+        for member in self.readmembers():
+            yield (member.name, member.read())
+
+    def readmembers(self):
+        """
+        Return the members of the archive selected by the `scope` without
+        reading their content.
+        """
+        raise NotImplementedError('readmembers must be implemented.')
+
+    def readarchives(self, extensions):
+        """
+        Return the members of the archive that are archives themselves.
+
+        :Parameters:
+           - `extensions`: File extensions of supported archives.
+        """
+        return iter(())
+
+    def readsequential(self, extensions):
+        """
+        Read the archive in a single pass without seeking, yielding
+        ("member", member) for the members `readmembers` would return and
+        ("archive", member) for the nested archives, in archive order. A
+        member is only readable until the next one is yielded. Afterwards
+        `readinfo` answers from what was collected on the way.
+
+        :Parameters:
+           - `extensions`: File extensions of supported archives, empty to
+             skip nested archives.
+        """
+        raise NotImplementedError(
+            'Reading %s from a stream is not supported.' %
+            type(self).__name__)
+
+    def isinfo(self, name):
+        """
+        Whether the member called `name` is read by `readinfo`.
+        """
+        return False
+
+    def contentstream(self, name, stream):
+        """
+        Return the part of the opened member `name` that is fingerprinted.
+        """
+        return stream
 
     def __del__(self):
         """
         Always close the file on instance deletion.
         """
+        if self._container is not None:
+            self._container.close()
         if not self.io.closed:
             self.io.close()
@@ -1,11 +1,25 @@
 
-import zipfile
-
-from victims_hash.archive.reader import ArchiveReader
+from victims_hash.archive.reader import ArchiveReader, zipstream
+from victims_hash.archive.reader.pkginfo import read_pkg_info
+from victims_hash.archive.reader.zipindex import ZipIndex, is_zip
+from victims_hash.archive.reader.scope import Scope
+from victims_hash.archive.reader.zipmember import readarchives, readmembers
 
 
 class EggReader(ArchiveReader):
 
+    format = "egg"
+    extensions = (".egg",)
+    scope = Scope(["*.py"])
+    concurrent = True
+
+    @classmethod
+    def sniff(cls, head):
+        return is_zip(head)
+
+    def opencontainer(self):
+        return ZipIndex(self.io)
+
     def readinfo(self, hints={}):
         """
         Extract meta information from the archive.
@@ -13,22 +27,26 @@ class EggReader(ArchiveReader):
         :Parameters:
            - `hints`: specify things to look for if available.
         """
-        self.io.seek(0)
-        metadata = {}
+        with self.container.open('EGG-INFO/PKG-INFO') as pkg_info:
+            return read_pkg_info(pkg_info)
 
-        with zipfile.ZipFile(self.io) as archive:
-            with archive.open('EGG-INFO/PKG-INFO') as pkg_info:
-                for line in pkg_info.readlines():
-                    key, value = line.split(': ', 1)
-                    metadata[key] = value[:-1]
-        return metadata
+    def readmembers(self):
+        """
+        Return the python sources (by default) of the archive.
+        """
+        return readmembers(self.container, self.scope)
 
-    def readfiles(self):
+    def readarchives(self, extensions):
         """
-        Read files within the archive and return their content
+        Return the archives nested in the archive.
+
+        :Parameters:
+           - `extensions`: File extensions of supported archives.
         """
-        self.io.seek(0)
-        with zipfile.ZipFile(self.io) as archive:
-            for filename in archive.namelist():
-                if filename.endswith(".py"):
-                    yield(filename, archive.read(filename))
+        return readarchives(self.container, extensions)
+
+    def readsequential(self, extensions):
+        return zipstream.readsequential(self, extensions)
+
+    def isinfo(self, name):
+        return name == 'EGG-INFO/PKG-INFO'
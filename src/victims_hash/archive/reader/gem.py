@@ -1,33 +1,165 @@
 
+import re
 import tarfile
+import zlib
 
-from victims_hash.archive.reader import ArchiveReader
+from victims_hash.archive.reader import ArchiveReader, Member, tarstream
+from victims_hash.archive.reader.scope import Scope
+
+
+# Entries a gem starts with.
+GEM_ENTRIES = (b"metadata.gz", b"data.tar.gz", b"checksums.yaml.gz")
+
+
+def read_gemspec(spec):
+    """
+    Extract the name, version and licenses from the YAML gemspec stored in
+    the metadata.gz of a gem. Only the handful of top level keys we need are
+    read, which avoids depending on a YAML library able to load the ruby
+    object tags used by gemspecs.
+
+    Parameters:
+        - `spec`: Iterable over the lines of the gemspec.
+    """
+
+    metadata = {}
+    top_level = re.compile(r"^(\w+):\s*(.*)$")
+    nested_version = re.compile(r"^\s+version:\s*(.*)$")
+
+    key = None
+    for line in spec:
+        line = line.rstrip()
+
+        match = top_level.match(line)
+        if match:
+            key, value = match.groups()
+            if key in ("name", "version", "license"):
+                if value and not value.startswith("!"):
+                    metadata[key] = value.strip("'\"")
+            elif key == "licenses":
+                metadata["licenses"] = []
+            continue
+
+        if key == "version" and "version" not in metadata:
+            match = nested_version.match(line)
+            if match:
+                metadata["version"] = match.group(1).strip("'\"")
+
+        elif key == "licenses" and line.lstrip().startswith("- "):
+            metadata["licenses"].append(line.lstrip()[2:].strip("'\""))
+
+    # Older gemspecs only carry a single license.
+    if "license" in metadata:
+        metadata.setdefault("licenses", []).append(metadata.pop("license"))
+
+    return metadata
 
 
 class GemReader(ArchiveReader):
+    """
+    Reads a gem in a single sequential pass. A gem is a plain tar holding
+    metadata.gz (the gemspec) and data.tar.gz (the files), the latter is
+    decompressed on the fly while its ruby sources are hashed.
+    """
 
-    #TODO
-    def readinfo(self, hints={}):
+    format = "gem"
+    extensions = (".gem",)
+    scope = Scope(["*.rb"])
+    sequential = True
+
+    @classmethod
+    def sniff(cls, head):
+        # ustar magic and name of the first tar header: other tarballs
+        # (eg. an uncompressed sdist) are ustar too.
+        return head[257:262] == b"ustar" and \
+            head[:100].rstrip(b"\0") in GEM_ENTRIES
+
+    def __init__(self, io, normalize=False, scope=None):
+        ArchiveReader.__init__(self, io, normalize, scope)
+        self.info = None
+
+    def scan(self, select=None, data=True):
         """
-        Extract meta information from the archive.
+        Stream through the gem once, yielding the members of data.tar.gz
+        (and of the outer tar) picked by `select` from their tar header.
+        The gemspec is parsed as it passes by.
+
+        Members are only readable until the next one is yielded.
 
         :Parameters:
-           - `hints`: specify things to look for if available.
+           - `select`: Callable taking the name and size of a member,
+             the scope's ``match`` by default.
+           - `data`: Whether to look inside data.tar.gz at all.
         """
+        if select is None:
+            select = self.scope.match
         self.io.seek(0)
-        metadata = {}
+        outer = tarfile.open(fileobj=self.io, mode="r|")
+        try:
+            for info in outer:
+                if not info.isfile():
+                    continue
 
-        with tarfile.open(self.io) as archive:
-            for filename in archive.getnames():
+                if info.name == "metadata.gz":
+                    # Small enough to inflate in one go.
+                    spec = zlib.decompress(
+                        outer.extractfile(info).read(), 16 + zlib.MAX_WBITS)
+                    self.info = read_gemspec(spec.splitlines())
+
+                elif info.name == "data.tar.gz" and data:
+                    inner = tarfile.open(
+                        fileobj=outer.extractfile(info), mode="r|gz")
+                    try:
+                        for member in self._members(inner, select):
+                            yield member
+                    finally:
+                        inner.close()
+
+                elif select(info.name, info.size):
+                    yield Member(
+                        info.name, lambda info=info: outer.extractfile(info),
+                        size=info.size)
+        finally:
+            outer.close()
+
+        if self.info is None:
+            self.info = {}
+
+    def _members(self, archive, select):
+        for info in archive:
+            if info.isfile() and select(info.name, info.size):
+                yield Member(
+                    info.name, lambda info=info: archive.extractfile(info),
+                    size=info.size)
+
+    def readinfo(self, hints={}):
+        """
+        Extract meta information from the archive. When the members were
+        already read the gemspec seen on the way is returned.
+
+        :Parameters:
+           - `hints`: specify things to look for if available.
+        """
+        if self.info is None:
+            for member in self.scan(lambda name, size: False, data=False):
                 pass
+        return self.info
 
-    def readfiles(self):
+    def readmembers(self):
         """
-        Read files within the archive and return their content
+        Return the ruby sources (by default) of the archive.
         """
-        self.io.seek(0)
+        return self.scan()
+
+    def readarchives(self, extensions):
+        """
+        Return the archives nested in the archive.
+
+        :Parameters:
+           - `extensions`: File extensions of supported archives.
+        """
+        extensions = tuple(extensions)
+        return self.scan(lambda name, size: name.endswith(extensions))
 
-        with tarfile.open(self.io) as archive:
-            for filename in archive.getnames():
-                if filename.endswith(".rb"):
-                    yield(filename, archive.extractfile(filename).read())
+    def readsequential(self, extensions):
+        return tarstream.readsequential(self, extensions)
@@ -1,15 +1,21 @@
 
 import re
-import zipfile
+import struct
 import javaclass
 
-from victims_hash.archive.reader import ArchiveReader
-
 try:
     from cStringIO import StringIO
 except ImportError:
     from StringIO import StringIO
 
+from victims_hash.archive.reader import ArchiveReader, zipstream
+from victims_hash.archive.reader.zipindex import ZipIndex, is_zip
+from victims_hash.archive.reader.zipmember import (
+    ZipMember, readarchives, readmembers)
+from victims_hash.archive.reader.normalize import (
+    NORMALIZE_VERSION, normalize_class)
+from victims_hash.archive.reader.scope import Scope
+
 
 def read_manifest(manifest):
 
@@ -73,7 +79,80 @@ def read_pom_properties(properties):
 
     return metadata
 
+def skip_class_header(stream):
+    """
+    Skip the magic number and java compiler version of a class file.
+
+    :Parameters:
+       - `stream`: File-like object positioned at the start of the class.
+    """
+    javaclass.read_magic(stream)
+    javaclass.read_version(stream)
+
+
+class HeaderlessClass(ZipMember):
+    """
+    A class file fingerprinted without its header, see
+    `skip_class_header`.
+    """
+
+    def __init__(self, index, i, name=None):
+        ZipMember.__init__(self, index, i, name, skip_class_header)
+        # Not to be mixed up with the digests of the whole content, eg. of
+        # a copy of the class under another name.
+        self.key = self.key + ("skip_header",)
+
+
+class NormalizedClass(ZipMember):
+    """
+    A class file fingerprinted in its normal form, see ``normalize``.
+    """
+
+    def __init__(self, index, i, name=None):
+        ZipMember.__init__(self, index, i, name)
+        # Normalized digests must not be mixed up with the raw ones.
+        self.key = self.key + ("normalized", NORMALIZE_VERSION)
+
+    def _openmember(self):
+        return normal_form(ZipMember._openmember(self).read())
+
+
+def normal_form(content):
+    """
+    Return a stream of the normal form of a class file.
+
+    :Parameters:
+       - `content`: The class file.
+    """
+    try:
+        return StringIO(normalize_class(content))
+    except (ValueError, IndexError, KeyError, struct.error):
+        # Classes that can not be parsed are hashed as they are stored.
+        iostr = StringIO(content)
+        skip_class_header(iostr)
+        return iostr
+
+
 class JarReader(ArchiveReader):
+    """
+    Reads java archives: jars, web and enterprise archives, Android and
+    Jenkins plugin archives, and plain zips.
+    """
+
+    format = "jar"
+    extensions = (
+        ".jar", ".war", ".ear", ".zip", ".aar", ".hpi", ".jpi")
+    scope = Scope(["*.class"])
+
+    # Members are inflated from independent slices of the mapped file.
+    concurrent = True
+
+    @classmethod
+    def sniff(cls, head):
+        return is_zip(head)
+
+    def opencontainer(self):
+        return ZipIndex(self.io)
 
     def readinfo(self, hints={}):
         """
@@ -82,43 +161,63 @@ class JarReader(ArchiveReader):
         :Parameters:
            - `hints`: specify things to look for if available.
         """
-        self.io.seek(0)
         metadata = []
+        archive = self.container
 
-        with zipfile.ZipFile(self.io) as archive:
-    
-            manifest_file = "META-INF/MANIFEST.MF"
+        manifest_file = "META-INF/MANIFEST.MF"
+        # Plain zips and some wars ship without a manifest.
+        if manifest_file in archive:
             with archive.open(manifest_file) as manifest:
                 metadata.append({
                     "filename"  : manifest_file,
                     "properties": read_manifest(manifest)})
 
-            pom_properties = filter(lambda x: x.endswith('pom.properties'),\
-                archive.namelist())
+        pom_properties = filter(lambda x: x.endswith('pom.properties'),\
+            archive.namelist())
 
-            if len(pom_properties) > 0:
-                pom = pom_properties.pop(0)
-                with archive.open(pom) as properties: 
-                    metadata.append({
-                        "filename" : pom, 
-                        "properties" : read_pom_properties(properties)})
+        if len(pom_properties) > 0:
+            pom = pom_properties.pop(0)
+            with archive.open(pom) as properties: 
+                metadata.append({
+                    "filename" : pom, 
+                    "properties" : read_pom_properties(properties)})
 
         return metadata
 
-    def readfiles(self):
+    def readmembers(self):
         """
-        Read files within the archive and return their content
+        Return the class files (by default) of the archive.
         """
+        return readmembers(self.container, self.scope, self._member)
 
-        self.io.seek(0)
-        with zipfile.ZipFile(self.io) as archive:
+    def _member(self, index, i, name):
+        # Other files included by the scope are hashed as they are.
+        if not name.endswith(".class"):
+            return ZipMember(index, i, name)
+        if self.normalize:
+            return NormalizedClass(index, i, name)
+        return HeaderlessClass(index, i, name)
 
-            for filename in archive.namelist():
-
-                if filename.endswith(".class"):
+    def readarchives(self, extensions):
+        """
+        Return the archives nested in the archive.
 
-                    iostr = StringIO(archive.read(filename))
-                    # Skip java compiler version.
-                    javaclass.read_magic(iostr)
-                    javaclass.read_version(iostr)
-                    yield(filename, iostr.read())
+        :Parameters:
+           - `extensions`: File extensions of supported archives.
+        """
+        return readarchives(self.container, extensions)
+
+    def readsequential(self, extensions):
+        return zipstream.readsequential(self, extensions)
+
+    def isinfo(self, name):
+        return name == "META-INF/MANIFEST.MF" or \
+            name.endswith('pom.properties')
+
+    def contentstream(self, name, stream):
+        if not name.endswith(".class"):
+            return stream
+        if self.normalize:
+            return normal_form(stream.read())
+        skip_class_header(stream)
+        return stream
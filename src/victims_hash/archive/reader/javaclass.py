@@ -1,5 +1,7 @@
 import struct
 
+from array import array
+
 # Based off spec: 
 # http://docs.oracle.com/javase/specs/jvms/se7/html/jvms-4.html
 #
@@ -26,7 +28,11 @@ import struct
 #        u2 attributes_count;
 #        attribute_info attributes[attributes_count];
 #}
-class ClassData(object):
+class StreamClassData(object):
+    """
+    Class file parsed field by field from a file-like object. Kept for
+    streams, ``ClassData`` is much faster on bytes.
+    """
     
     def __init__(self, f):
         
@@ -193,6 +199,9 @@ CONSTANT_Utf8               = 1
 CONSTANT_MethodHandle       = 15
 CONSTANT_MethodType         = 16
 CONSTANT_InvokeDynamic      = 18
+CONSTANT_Dynamic            = 17
+CONSTANT_Module             = 19
+CONSTANT_Package            = 20
 
 # Constant Pool 
 def read_constant_pool(f):
@@ -560,3 +569,309 @@ def read_attribute_info(f):
     return attribute_info(attribute_name_index, info)
 
 
+#
+# Offset based parser
+#
+# ClassData parses a whole class held in memory with precompiled structs
+# and offsets instead of a read per field. The constant pool is kept as a
+# flat array of entry offsets into the class bytes and entries are only
+# decoded when asked for. Fields, methods and attributes are skipped over
+# on construction and parsed on first access. The parsed objects are the
+# same as those of StreamClassData.
+#
+
+U2              = struct.Struct(">H")
+U2U4            = struct.Struct(">HI")
+MEMBER_HEADER   = struct.Struct(">HHHH")
+CLASS_HEADER    = struct.Struct(">IHH")
+CLASS_INFO      = struct.Struct(">HHHH")
+
+# Size of the info of every constant pool tag, CONSTANT_Utf8 excepted.
+CP_INFO_SIZE = {
+    CONSTANT_Class              : 2,
+    CONSTANT_FieldRef           : 4,
+    CONSTANT_MethodRef          : 4,
+    CONSTANT_InterfaceMethodref : 4,
+    CONSTANT_String             : 2,
+    CONSTANT_Integer            : 4,
+    CONSTANT_Float              : 4,
+    CONSTANT_Long               : 8,
+    CONSTANT_Double             : 8,
+    CONSTANT_NameAndType        : 4,
+    CONSTANT_MethodHandle       : 3,
+    CONSTANT_MethodType         : 2,
+    CONSTANT_Dynamic            : 4,
+    CONSTANT_InvokeDynamic      : 4,
+    CONSTANT_Module             : 2,
+    CONSTANT_Package            : 2,
+}
+
+# Size of a whole entry, tag included, indexed by tag. 0 is unknown.
+CP_ENTRY_SIZE = [0] * 256
+for (_tag, _size) in CP_INFO_SIZE.items():
+    CP_ENTRY_SIZE[_tag] = _size + 1
+
+
+class ConstantPool(object):
+    """
+    Array backed constant pool. Behaves like the {index: cp_info} dict
+    built by ``read_constant_pool`` while only materializing the entries
+    that are looked up.
+    """
+
+    def __init__(self, data, offsets):
+        """
+        :Parameters:
+           - `data`: The class bytes.
+           - `offsets`: Array of the offset of the tag of every entry,
+             0 for the unusable slots.
+        """
+        self.data       = data
+        self.offsets    = offsets
+        self.count      = len(offsets)
+        self._utf8      = {}
+
+    def tag(self, n):
+        return ord(self.data[self.offsets[n]])
+
+    def info(self, n):
+        """
+        Raw info bytes of entry `n`, without the tag (and length for utf8).
+        """
+        start = self.offsets[n] + 1
+        tag = ord(self.data[start - 1])
+        if tag == CONSTANT_Utf8:
+            length, = U2.unpack_from(self.data, start)
+            start += 2
+        else:
+            length = CP_INFO_SIZE[tag]
+        return self.data[start:start + length]
+
+    def utf8(self, n):
+        """
+        Decoded value of the CONSTANT_Utf8 entry `n`.
+        """
+        value = self._utf8.get(n)
+        if value is None:
+            if self.tag(n) != CONSTANT_Utf8:
+                raise ValueError("Constant %i is not CONSTANT_Utf8" % n)
+            value = self.info(n).decode('utf-8', 'replace')
+            self._utf8[n] = value
+        return value
+
+    def ref(self, n):
+        """
+        First u2 index stored in entry `n` (eg. the name of a class).
+        """
+        return U2.unpack_from(self.data, self.offsets[n] + 1)[0]
+
+    def keys(self):
+        offsets = self.offsets
+        return [n for n in xrange(1, self.count) if offsets[n]]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __contains__(self, n):
+        return 0 < n < self.count and self.offsets[n] != 0
+
+    def __getitem__(self, n):
+        if n not in self:
+            raise KeyError(n)
+        return cp_info(self.tag(n), bytearray(self.info(n)))
+
+    def get(self, n, default=None):
+        return self[n] if n in self else default
+
+    def items(self):
+        return [(n, self[n]) for n in self.keys()]
+
+    def values(self):
+        return [self[n] for n in self.keys()]
+
+
+def parse_constant_pool(data, pos):
+    """
+    Index the constant pool starting at `pos`, returning the pool and the
+    offset just after it.
+    """
+    count, = U2.unpack_from(data, pos)
+    pos += 2
+
+    offsets = array('L', [0]) * max(count, 1)
+    sizes = CP_ENTRY_SIZE
+    unpack = U2.unpack_from
+
+    n = 1
+    while n < count:
+        tag = ord(data[pos])
+        offsets[n] = pos
+        if tag == CONSTANT_Utf8:
+            pos += unpack(data, pos + 1)[0] + 3
+            n += 1
+            continue
+
+        size = sizes[tag]
+        if not size:
+            raise ValueError("Unknown constant pool tag %i" % tag)
+        pos += size
+        n += 1
+        # All 8-byte constants take up two entries in the constant_pool table of the class file
+        if tag == CONSTANT_Double or tag == CONSTANT_Long:
+            n += 1
+
+    return ConstantPool(data, offsets), pos
+
+
+def skip_attributes(data, pos):
+    """
+    Return the offset just after the attributes table at `pos`.
+    """
+    count, = U2.unpack_from(data, pos)
+    pos += 2
+    unpack = U2U4.unpack_from
+    for _ in xrange(count):
+        pos += unpack(data, pos)[1] + 6
+    return pos
+
+
+def skip_members(data, pos):
+    """
+    Return the offset just after the fields or methods table at `pos`.
+    """
+    unpack_count = U2.unpack_from
+    unpack = U2U4.unpack_from
+    count, = unpack_count(data, pos)
+    pos += 2
+    for _ in xrange(count):
+        attributes_count, = unpack_count(data, pos + 6)
+        pos += 8
+        for _ in xrange(attributes_count):
+            pos += unpack(data, pos)[1] + 6
+    return pos
+
+
+def parse_attributes(data, pos):
+    """
+    Parse an attributes table. Attribute contents are strings, like those
+    read by ``read_attribute_info``.
+    """
+    count, = U2.unpack_from(data, pos)
+    pos += 2
+
+    attributes = []
+    unpack = U2U4.unpack_from
+    for _ in xrange(count):
+        name_index, length = unpack(data, pos)
+        pos += 6
+        attributes.append(attribute_info(name_index, data[pos:pos + length]))
+        pos += length
+
+    return attributes
+
+
+def parse_members(data, pos, cls):
+    """
+    Parse a fields or methods table into `cls` instances.
+    """
+    count, = U2.unpack_from(data, pos)
+    pos += 2
+
+    members = []
+    unpack_header = MEMBER_HEADER.unpack_from
+    unpack = U2U4.unpack_from
+    for _ in xrange(count):
+        flags, name, desc, attributes_count = unpack_header(data, pos)
+        pos += 8
+        # The attributes are parsed inline, in the same pass that finds
+        # where the next member starts.
+        attributes = []
+        for _ in xrange(attributes_count):
+            name_index, length = unpack(data, pos)
+            pos += 6
+            attributes.append(
+                attribute_info(name_index, data[pos:pos + length]))
+            pos += length
+        members.append(cls(flags, name, desc, attributes))
+
+    return members
+
+
+class ClassData(object):
+    """
+    Class file parsed from its bytes. ``fields``, ``methods`` and
+    ``attributes`` are parsed on first access.
+
+    :Parameters:
+       - `data`: The class as a string or buffer, or a file-like object
+         to read it from.
+    """
+
+    def __init__(self, data):
+
+        if hasattr(data, 'read'):
+            data = data.read()
+        if not isinstance(data, str):
+            data = str(data)
+        self.data = data
+
+        magic, self.minor, self.major = CLASS_HEADER.unpack_from(data, 0)
+        if magic != 0xcafebabe:
+            raise ValueError("Not a class file")
+        self.magic = [ 0xca, 0xfe, 0xba, 0xbe ]
+
+        self.constant_pool, pos = parse_constant_pool(data, 8)
+
+        (self.access_flags, self.this_class, self.super_class,
+         interfaces_count) = CLASS_INFO.unpack_from(data, pos)
+        pos += 8
+        if interfaces_count:
+            self.interfaces = list(struct.unpack_from(
+                ">%dH" % interfaces_count, data, pos))
+            pos += 2 * interfaces_count
+        else:
+            self.interfaces = []
+
+        self.fields_offset = pos
+        self.methods_offset = skip_members(data, pos)
+        self.attributes_offset = skip_members(data, self.methods_offset)
+        if skip_attributes(data, self.attributes_offset) > len(data):
+            raise ValueError("Truncated class file")
+
+        self._fields = self._methods = self._attributes = None
+
+    @property
+    def fields(self):
+        if self._fields is None:
+            self._fields = parse_members(
+                self.data, self.fields_offset, field_info)
+        return self._fields
+
+    @property
+    def methods(self):
+        if self._methods is None:
+            self._methods = parse_members(
+                self.data, self.methods_offset, method_info)
+        return self._methods
+
+    @property
+    def attributes(self):
+        if self._attributes is None:
+            self._attributes = parse_attributes(
+                self.data, self.attributes_offset)
+        return self._attributes
+
+    def class_name(self, idx):
+        """
+        Name of the CONSTANT_Class entry `idx`, or None for index 0.
+        """
+        if idx == 0:
+            return None
+        return self.constant_pool.utf8(self.constant_pool.ref(idx))
+
+    @property
+    def name(self):
+        return self.class_name(self.this_class)
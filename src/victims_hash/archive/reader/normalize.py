@@ -0,0 +1,379 @@
+"""
+Compiler independent normal form of class files.
+
+Two builds of the same source rarely produce identical class files: the
+constant pool is laid out differently and debug information depends on the
+compiler flags. ``normalize_class`` rewrites a class into a canonical byte
+string where
+
+ - every constant pool reference (in the class header, members, bytecode
+   operands and the attributes listed below) is replaced by the value it
+   resolves to, so the pool order no longer matters,
+ - debug attributes (``SourceFile``, ``LineNumberTable``,
+   ``LocalVariableTable``, ...) and ``StackMapTable`` are dropped,
+ - the class file version is left out.
+
+Only the attributes that are kept get decoded.
+"""
+
+import struct
+
+import javaclass
+
+from javaclass import (
+    ClassData, U2, CONSTANT_Class, CONSTANT_FieldRef, CONSTANT_MethodRef,
+    CONSTANT_InterfaceMethodref, CONSTANT_String, CONSTANT_Integer,
+    CONSTANT_Float, CONSTANT_Long, CONSTANT_Double, CONSTANT_NameAndType,
+    CONSTANT_Utf8, CONSTANT_MethodHandle, CONSTANT_MethodType,
+    CONSTANT_Dynamic, CONSTANT_InvokeDynamic, CONSTANT_Module,
+    CONSTANT_Package)
+
+
+# Bump whenever the normal form changes.
+NORMALIZE_VERSION = 1
+
+# Attributes that do not change what a class does.
+DROPPED_ATTRIBUTES = frozenset([
+    u"SourceFile",
+    u"SourceDebugExtension",
+    u"LineNumberTable",
+    u"LocalVariableTable",
+    u"LocalVariableTypeTable",
+    u"StackMapTable",
+    u"MethodParameters",
+])
+
+U4 = struct.Struct(">I")
+CODE_HEADER = struct.Struct(">HHI")
+EXCEPTION_ENTRY = struct.Struct(">HHHH")
+SWITCH_HEADER = struct.Struct(">iii")
+
+# Operand bytes of every opcode, -1 for the variable length ones.
+OPERANDS = [0] * 256
+for (_first, _last, _length) in (
+        (0x10, 0x10, 1), (0x11, 0x11, 2), (0x12, 0x12, 1), (0x13, 0x14, 2),
+        (0x15, 0x19, 1), (0x36, 0x3a, 1), (0x84, 0x84, 2), (0x99, 0xa8, 2),
+        (0xa9, 0xa9, 1), (0xaa, 0xab, -1), (0xb2, 0xb8, 2), (0xb9, 0xba, 4),
+        (0xbb, 0xbb, 2), (0xbc, 0xbc, 1), (0xbd, 0xbd, 2), (0xc0, 0xc1, 2),
+        (0xc4, 0xc4, -1), (0xc5, 0xc5, 3), (0xc6, 0xc7, 2), (0xc8, 0xc9, 4)):
+    for _op in xrange(_first, _last + 1):
+        OPERANDS[_op] = _length
+
+# How every opcode is handled when rewriting bytecode.
+PLAIN, CP_INDEX, CP_INDEX_BYTE, WIDE, SWITCH = range(5)
+OPCODE_KIND = [PLAIN] * 256
+for _op in [0x13, 0x14] + range(0xb2, 0xbc) + [0xbd, 0xc0, 0xc1, 0xc5]:
+    OPCODE_KIND[_op] = CP_INDEX
+OPCODE_KIND[0x12] = CP_INDEX_BYTE   # ldc
+OPCODE_KIND[0xc4] = WIDE
+OPCODE_KIND[0xaa] = SWITCH          # tableswitch
+OPCODE_KIND[0xab] = SWITCH          # lookupswitch
+TABLESWITCH = 0xaa
+IINC = 0x84
+
+
+class Normalizer(object):
+    """
+    Writes the normal form of one class.
+    """
+
+    def __init__(self, data):
+        self.cls = ClassData(data)
+        self.pool = self.cls.constant_pool
+        self.resolved = {}
+        # Constants being resolved, a malformed pool may refer in circles.
+        self.resolving = set()
+        self.out = []
+
+    def constant(self, n):
+        """
+        Canonical, length prefixed encoding of the value of constant `n`.
+        """
+        value = self.resolved.get(n)
+        if value is not None:
+            return value
+        if n == 0:
+            return b"\x00"
+        if n in self.resolving:
+            raise ValueError("Constant %i refers to itself" % n)
+        self.resolving.add(n)
+
+        pool = self.pool
+        tag = pool.tag(n)
+        info = pool.info(n)
+        if tag == CONSTANT_Utf8:
+            value = U4.pack(len(info)) + info
+        elif tag in (CONSTANT_Integer, CONSTANT_Float, CONSTANT_Long,
+                     CONSTANT_Double):
+            value = info
+        elif tag in (CONSTANT_Class, CONSTANT_String, CONSTANT_MethodType,
+                     CONSTANT_Module, CONSTANT_Package):
+            value = self.constant(pool.ref(n))
+        elif tag in (CONSTANT_FieldRef, CONSTANT_MethodRef,
+                     CONSTANT_InterfaceMethodref, CONSTANT_NameAndType):
+            first, second = struct.unpack(">HH", info)
+            value = self.constant(first) + self.constant(second)
+        elif tag == CONSTANT_MethodHandle:
+            kind, ref = struct.unpack(">BH", info)
+            value = chr(kind) + self.constant(ref)
+        elif tag in (CONSTANT_Dynamic, CONSTANT_InvokeDynamic):
+            # The bootstrap index points in the BootstrapMethods attribute,
+            # whose order is kept.
+            bootstrap, nat = struct.unpack(">HH", info)
+            value = U2.pack(bootstrap) + self.constant(nat)
+        else:
+            raise ValueError("Unknown constant pool tag %i" % tag)
+
+        value = chr(tag) + value
+        self.resolved[n] = value
+        self.resolving.discard(n)
+        return value
+
+    def ref(self, data, pos):
+        """
+        Encoding of the constant whose u2 index is at `pos` in `data`.
+        """
+        return self.constant(U2.unpack_from(data, pos)[0])
+
+    def refs(self, data, pos):
+        """
+        Encoding of a u2 count followed by that many u2 indexes, and the
+        offset just after them.
+        """
+        count, = U2.unpack_from(data, pos)
+        pos += 2
+        out = [U2.pack(count)]
+        for _ in xrange(count):
+            out.append(self.ref(data, pos))
+            pos += 2
+        return b"".join(out), pos
+
+    def write(self):
+        """
+        Return the normal form of the class.
+        """
+        cls = self.cls
+        out = self.out
+        out.append(U2.pack(cls.access_flags))
+        out.append(self.constant(cls.this_class))
+        out.append(self.constant(cls.super_class))
+        out.append(U2.pack(len(cls.interfaces)))
+        for interface in cls.interfaces:
+            out.append(self.constant(interface))
+
+        for (marker, members) in ((b"F", cls.fields), (b"M", cls.methods)):
+            out.append(marker + U2.pack(len(members)))
+            for member in members:
+                out.append(U2.pack(member.access_flags))
+                out.append(self.constant(member.name_index))
+                out.append(self.constant(member.descriptor_index))
+                self.attributes(member.attributes)
+
+        out.append(b"A")
+        self.attributes(cls.attributes)
+        return b"".join(out)
+
+    def attributes(self, attributes):
+        """
+        Write the attributes that are kept, in their original order.
+        """
+        for attribute in attributes:
+            name = self.pool.utf8(attribute.attribute_name_index)
+            if name in DROPPED_ATTRIBUTES:
+                continue
+            info = attribute.info
+            writer = ATTRIBUTE_WRITERS.get(name)
+            if writer is None:
+                # Attributes whose layout is not known are kept verbatim.
+                content = str(info)
+            else:
+                content = writer(self, str(info))
+            self.out.append(
+                self.constant(attribute.attribute_name_index) +
+                U4.pack(len(content)))
+            self.out.append(content)
+
+    def code(self, info):
+        max_stack, max_locals, length = CODE_HEADER.unpack_from(info, 0)
+        out = [CODE_HEADER.pack(max_stack, max_locals, length)]
+        out.append(self.bytecode(info, CODE_HEADER.size, length))
+
+        pos = CODE_HEADER.size + length
+        count, = U2.unpack_from(info, pos)
+        pos += 2
+        out.append(U2.pack(count))
+        for _ in xrange(count):
+            start, end, handler, catch = EXCEPTION_ENTRY.unpack_from(info, pos)
+            out.append(struct.pack(">HHH", start, end, handler))
+            out.append(self.constant(catch))
+            pos += EXCEPTION_ENTRY.size
+
+        # Nested attributes (LineNumberTable, ...) go through the same
+        # filter as the others.
+        saved, self.out = self.out, out
+        try:
+            self.attributes(javaclass.parse_attributes(info, pos))
+        finally:
+            self.out = saved
+        return b"".join(out)
+
+    def bytecode(self, info, start, length):
+        """
+        Copy the bytecode replacing constant pool operands by their values.
+        Runs of instructions without such operands are copied in one slice.
+        """
+        out = []
+        append = out.append
+        constant = self.constant
+        resolved = self.resolved.get
+        kinds = OPCODE_KIND
+        sizes = OPERANDS
+
+        end = start + length
+        pos = copied = start
+        while pos < end:
+            opcode = ord(info[pos])
+            kind = kinds[opcode]
+            if kind == PLAIN:
+                pos += sizes[opcode] + 1
+            elif kind == CP_INDEX:
+                index = (ord(info[pos + 1]) << 8) | ord(info[pos + 2])
+                append(info[copied:pos + 1])
+                append(resolved(index) or constant(index))
+                copied = pos + 3
+                pos += sizes[opcode] + 1
+            elif kind == CP_INDEX_BYTE:
+                append(info[copied:pos + 1])
+                append(constant(ord(info[pos + 1])))
+                pos = copied = pos + 2
+            elif kind == WIDE:
+                pos += 6 if ord(info[pos + 1]) == IINC else 4
+            else:
+                # Operands are aligned on the start of the code.
+                operands = pos + 4 - (pos - start) % 4
+                if opcode == TABLESWITCH:
+                    default, low, high = SWITCH_HEADER.unpack_from(
+                        info, operands)
+                    pos = operands + 12 + 4 * (high - low + 1)
+                else:
+                    default, pairs = struct.unpack_from(">ii", info, operands)
+                    pos = operands + 8 + 8 * pairs
+
+        append(info[copied:end])
+        return b"".join(out)
+
+    def single(self, info):
+        return self.ref(info, 0)
+
+    def reflist(self, info):
+        return self.refs(info, 0)[0]
+
+    def inner_classes(self, info):
+        count, = U2.unpack_from(info, 0)
+        out = [U2.pack(count)]
+        pos = 2
+        for _ in xrange(count):
+            out.append(self.ref(info, pos))
+            out.append(self.ref(info, pos + 2))
+            out.append(self.ref(info, pos + 4))
+            out.append(info[pos + 6:pos + 8])
+            pos += 8
+        return b"".join(out)
+
+    def enclosing_method(self, info):
+        return self.ref(info, 0) + self.ref(info, 2)
+
+    def bootstrap_methods(self, info):
+        count, = U2.unpack_from(info, 0)
+        out = [U2.pack(count)]
+        pos = 2
+        for _ in xrange(count):
+            out.append(self.ref(info, pos))
+            content, pos = self.refs(info, pos + 2)
+            out.append(content)
+        return b"".join(out)
+
+    def annotations(self, info):
+        return self.annotation_list(info, 0)[0]
+
+    def parameter_annotations(self, info):
+        count = ord(info[0])
+        out = [info[0]]
+        pos = 1
+        for _ in xrange(count):
+            content, pos = self.annotation_list(info, pos)
+            out.append(content)
+        return b"".join(out)
+
+    def annotation_default(self, info):
+        return self.element_value(info, 0)[0]
+
+    def annotation_list(self, info, pos):
+        count, = U2.unpack_from(info, pos)
+        pos += 2
+        out = [U2.pack(count)]
+        for _ in xrange(count):
+            content, pos = self.annotation(info, pos)
+            out.append(content)
+        return b"".join(out), pos
+
+    def annotation(self, info, pos):
+        out = [self.ref(info, pos)]
+        count, = U2.unpack_from(info, pos + 2)
+        pos += 4
+        out.append(U2.pack(count))
+        for _ in xrange(count):
+            out.append(self.ref(info, pos))
+            content, pos = self.element_value(info, pos + 2)
+            out.append(content)
+        return b"".join(out), pos
+
+    def element_value(self, info, pos):
+        tag = info[pos]
+        pos += 1
+        if tag in b"BCDFIJSZsc":
+            return tag + self.ref(info, pos), pos + 2
+        if tag == b"e":
+            return tag + self.ref(info, pos) + self.ref(info, pos + 2), pos + 4
+        if tag == b"@":
+            content, pos = self.annotation(info, pos)
+            return tag + content, pos
+        if tag == b"[":
+            count, = U2.unpack_from(info, pos)
+            pos += 2
+            out = [tag, U2.pack(count)]
+            for _ in xrange(count):
+                content, pos = self.element_value(info, pos)
+                out.append(content)
+            return b"".join(out), pos
+        raise ValueError("Unknown element value tag %r" % tag)
+
+
+ATTRIBUTE_WRITERS = {
+    u"Code": Normalizer.code,
+    u"ConstantValue": Normalizer.single,
+    u"Signature": Normalizer.single,
+    u"NestHost": Normalizer.single,
+    u"ModuleMainClass": Normalizer.single,
+    u"Exceptions": Normalizer.reflist,
+    u"NestMembers": Normalizer.reflist,
+    u"PermittedSubclasses": Normalizer.reflist,
+    u"InnerClasses": Normalizer.inner_classes,
+    u"EnclosingMethod": Normalizer.enclosing_method,
+    u"BootstrapMethods": Normalizer.bootstrap_methods,
+    u"RuntimeVisibleAnnotations": Normalizer.annotations,
+    u"RuntimeInvisibleAnnotations": Normalizer.annotations,
+    u"RuntimeVisibleParameterAnnotations": Normalizer.parameter_annotations,
+    u"RuntimeInvisibleParameterAnnotations": Normalizer.parameter_annotations,
+    u"AnnotationDefault": Normalizer.annotation_default,
+}
+
+
+def normalize_class(data):
+    """
+    Return the normal form of a class file.
+
+    :Parameters:
+       - `data`: The class as a string or buffer.
+    """
+    return Normalizer(data).write()
@@ -0,0 +1,44 @@
+"""
+Python core metadata (PKG-INFO, METADATA) parsing.
+"""
+
+# Fields that may appear more than once, kept as lists.
+MULTIPLE_USE = set([
+    "Classifier", "Dynamic", "License-File", "Obsoletes",
+    "Obsoletes-Dist", "Platform", "Project-URL", "Provides",
+    "Provides-Dist", "Provides-Extra", "Requires", "Requires-Dist",
+    "Requires-External", "Supported-Platform",
+])
+
+
+def read_pkg_info(lines):
+    """
+    Extract the header fields of a core metadata file. Continuation lines
+    are joined to their field and the description body is skipped.
+
+    :Parameters:
+       - `lines`: Iterable over the lines of the file.
+    """
+    metadata = {}
+    key = None
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not line:
+            # The description body follows the first blank line.
+            break
+        if line[0] in " \t" and key is not None:
+            value = line.strip()
+            if key in MULTIPLE_USE:
+                metadata[key][-1] += " " + value
+            else:
+                metadata[key] += " " + value
+            continue
+        if ":" not in line:
+            continue
+        key, value = line.split(":", 1)
+        value = value.strip()
+        if key in MULTIPLE_USE:
+            metadata.setdefault(key, []).append(value)
+        else:
+            metadata[key] = value
+    return metadata
@@ -0,0 +1,160 @@
+"""
+Registry of the archive readers.
+
+A reader is picked by the extension of the artifact's name, confirmed by
+sniffing its first bytes, so artifacts without an extension (eg. from
+content addressed storage) or with an unknown one are still recognized
+by their content. Reading the first bytes is the only I/O a lookup does.
+
+Other packages add readers through the ``victims_hash.readers`` entry
+point, naming ``ArchiveReader`` subclasses that set ``extensions`` and
+``sniff``::
+
+    entry_points={
+        'victims_hash.readers': ['apk = mypackage.apk:ApkReader'],
+    }
+"""
+
+import sys
+import threading
+
+from victims_hash.archive.reader.egg import EggReader
+from victims_hash.archive.reader.gem import GemReader
+from victims_hash.archive.reader.jar import JarReader
+from victims_hash.archive.reader.sdist import SdistReader
+from victims_hash.archive.reader.wheel import WheelReader
+
+
+ENTRY_POINT = 'victims_hash.readers'
+
+# Enough for the ustar magic of a tar header.
+SNIFF_SIZE = 512
+
+_readers = []
+_plugins_loaded = False
+_lock = threading.Lock()
+
+
+def register(reader):
+    """
+    Add a reader class. Readers registered first win when several accept
+    the same content.
+
+    :Parameters:
+       - `reader`: ``ArchiveReader`` subclass.
+    """
+    with _lock:
+        if reader not in _readers:
+            _readers.append(reader)
+
+
+def load_plugins():
+    """
+    Register the readers advertised through the entry point, once.
+    """
+    global _plugins_loaded
+    if _plugins_loaded:
+        return
+    _plugins_loaded = True
+    try:
+        import pkg_resources
+    except ImportError:
+        return
+    for entry_point in pkg_resources.iter_entry_points(ENTRY_POINT):
+        try:
+            register(entry_point.load())
+        except Exception, ex:
+            # A broken plugin must not take the supported formats down.
+            sys.stderr.write("Could not load reader %s: %s\n" % (
+                entry_point, ex))
+
+
+def readers():
+    """
+    Return the registered reader classes.
+    """
+    load_plugins()
+    return list(_readers)
+
+
+def extensions():
+    """
+    Return the file extensions handled by a reader, as a tuple for
+    ``str.endswith``.
+    """
+    return tuple(sorted(set(
+        extension for reader in readers()
+        for extension in reader.extensions)))
+
+
+def formats():
+    """
+    Return the names of the formats handled by a reader.
+    """
+    return sorted(set(
+        reader.format for reader in readers() if reader.format))
+
+
+def peek(io, size=SNIFF_SIZE):
+    """
+    Return the first `size` bytes of a file-like object positioned at its
+    start, leaving it where it was.
+    """
+    if hasattr(io, 'unread'):
+        head = io.read(size)
+        io.unread(head)
+        return head
+    position = io.tell()
+    try:
+        return io.read(size)
+    finally:
+        io.seek(position)
+
+
+def find_reader(name, head):
+    """
+    Return the reader class for an artifact.
+
+    A reader claiming the extension is used when it accepts the content,
+    or when no reader recognizes the content at all (eg. a self extracting
+    zip). Otherwise the first reader accepting the content is used.
+
+    :Parameters:
+       - `name`: Name of the artifact, may be None.
+       - `head`: First bytes of the artifact, see `peek`.
+    """
+    lowered = (name or "").lower()
+    claimed = [r for r in readers() if r.extensions and
+               lowered.endswith(r.extensions)]
+    for reader in claimed:
+        if reader.sniff(head):
+            return reader
+
+    sniffed = [r for r in readers() if r.sniff(head)]
+    if sniffed:
+        return sniffed[0]
+    if claimed:
+        return claimed[0]
+    raise NotImplementedError("No support for %s files." % name)
+
+
+def get_reader(name, io, normalize=False, scopes=None):
+    """
+    Create the reader matching an artifact.
+
+    :Parameters:
+       - `name`: Name of the artifact, may be None.
+       - `io`: File-like object to read the artifact from.
+       - `normalize`: Fingerprint members in their normal form.
+       - `scopes`: Optional {format: ``Scope``} replacing the default
+         scope of the readers.
+    """
+    reader = find_reader(name, peek(io))
+    return reader(io, normalize, (scopes or {}).get(reader.format))
+
+
+register(JarReader)
+register(GemReader)
+register(EggReader)
+register(WheelReader)
+register(SdistReader)
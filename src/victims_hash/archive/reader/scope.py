@@ -0,0 +1,157 @@
+"""
+Which members of an archive are fingerprinted.
+
+Every reader has a default `Scope` (eg. ``*.class`` for jars) that can be
+replaced per format, eg. to also fingerprint native libraries and
+javascript bundles shipped in wars while skipping huge resources:
+
+    scopes = parse_scopes([
+        "jar:include=*.class,*.so,*.js;max_size=64M",
+    ])
+    analyze('app.war', scopes=scopes)
+
+A scope is matched against the name and size recorded in the container
+index (zip central directory, tar headers), so excluded members are never
+decompressed.
+"""
+
+import fnmatch
+import re
+
+
+UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_size(value):
+    """
+    Parse a size in bytes with an optional K, M or G suffix.
+    """
+    match = re.match(r"^\s*(\d+)\s*([KMG]?)B?\s*$", value, re.I)
+    if match is None:
+        raise ValueError("Invalid size %r" % value)
+    return int(match.group(1)) * UNITS[match.group(2).upper()]
+
+
+class Scope(object):
+    """
+    Include and exclude globs plus size bounds selecting members.
+
+    A member is selected when its name matches an `include` glob, no
+    `exclude` glob, and its uncompressed size is within the bounds. Globs
+    match the whole path within the archive and ``*`` crosses directories,
+    so ``*.class`` selects every class file. A size that is not known is
+    within any bounds.
+
+    A scope without `include` globs takes those of the reader's default
+    scope, so ``exclude=*/test/*`` narrows the default selection.
+    """
+
+    def __init__(self, include=None, exclude=(), min_size=None,
+                 max_size=None):
+        """
+        Creates a scope.
+
+        :Parameters:
+           - `include`: Globs of the members to select, None for those of
+             the default scope (see `inherit`).
+           - `exclude`: Globs of members not to select even if included.
+           - `min_size`: Smallest size in bytes to select, if any.
+           - `max_size`: Largest size in bytes to select, if any.
+        """
+        self.include = tuple(include) if include is not None else None
+        self.exclude = tuple(exclude)
+        self.min_size = min_size
+        self.max_size = max_size
+        self._include = [re.compile(fnmatch.translate(glob)).match
+                         for glob in self.include or ()]
+        self._exclude = [re.compile(fnmatch.translate(glob)).match
+                         for glob in self.exclude]
+
+    @property
+    def sized(self):
+        """
+        Whether the scope depends on the size of members.
+        """
+        return self.min_size is not None or self.max_size is not None
+
+    def inherit(self, default):
+        """
+        Return the scope with the `include` globs of `default` if it has
+        none of its own.
+
+        :Parameters:
+           - `default`: ``Scope`` of the reader.
+        """
+        if self.include is not None:
+            return self
+        return Scope(default.include, self.exclude, self.min_size,
+                     self.max_size)
+
+    def match(self, name, size=None):
+        """
+        Whether the member called `name` of `size` bytes is selected.
+        """
+        if size is not None:
+            if self.min_size is not None and size < self.min_size:
+                return False
+            if self.max_size is not None and size > self.max_size:
+                return False
+        for match in self._include:
+            if match(name):
+                break
+        else:
+            return False
+        for match in self._exclude:
+            if match(name):
+                return False
+        return True
+
+    @classmethod
+    def parse(cls, spec):
+        """
+        Create a scope from a string like
+        ``include=*.class,*.so;exclude=*/test/*;max_size=10M``.
+        """
+        options = {}
+        for part in spec.split(";"):
+            if not part.strip():
+                continue
+            key, sep, value = part.partition("=")
+            key = key.strip()
+            if not sep:
+                raise ValueError("Invalid scope %r" % part)
+            if key in ("include", "exclude"):
+                options[key] = [glob.strip() for glob in value.split(",")
+                                if glob.strip()]
+            elif key in ("min_size", "max_size"):
+                options[key] = parse_size(value)
+            else:
+                raise ValueError("Unknown scope option %r" % key)
+        return cls(**options)
+
+    def __eq__(self, other):
+        return isinstance(other, Scope) and repr(self) == repr(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "Scope(include=%r, exclude=%r, min_size=%r, max_size=%r)" % (
+            self.include, self.exclude, self.min_size, self.max_size)
+
+
+def parse_scopes(specs):
+    """
+    Return {format: Scope} from strings of the form ``format:scope``, see
+    `Scope.parse`.
+
+    :Parameters:
+       - `specs`: Iterable of strings, eg. ``jar:include=*.class,*.so``.
+    """
+    scopes = {}
+    for spec in specs:
+        name, sep, scope = spec.partition(":")
+        if not sep:
+            raise ValueError("Scope %r does not name a format" % spec)
+        scopes[name.strip()] = Scope.parse(scope)
+    return scopes
@@ -0,0 +1,98 @@
+import tarfile
+
+from victims_hash.archive.reader import ArchiveReader, Member, tarstream
+from victims_hash.archive.reader.gem import GEM_ENTRIES
+from victims_hash.archive.reader.pkginfo import read_pkg_info
+from victims_hash.archive.reader.scope import Scope
+
+
+class SdistReader(ArchiveReader):
+    """
+    Reads python source distributions in a single sequential pass over the
+    (compressed) tarball, parsing the PKG-INFO as it goes by.
+    """
+
+    format = "sdist"
+    extensions = (".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar")
+    scope = Scope(["*.py"])
+    sequential = True
+
+    @classmethod
+    def sniff(cls, head):
+        if head[257:262] == b"ustar":
+            # A gem is a plain tar too, told apart by its first entry.
+            return head[:100].rstrip(b"\0") not in GEM_ENTRIES
+        return head[:2] == b"\x1f\x8b" or head[:3] == b"BZh"
+
+    def __init__(self, io, normalize=False, scope=None):
+        ArchiveReader.__init__(self, io, normalize, scope)
+        self.info = None
+
+    def scan(self, select=None):
+        """
+        Stream through the tarball once, yielding the members picked by
+        `select` from their tar header. The PKG-INFO at the top of the
+        distribution is parsed on the way, the one of the egg-info
+        directory if there is none.
+
+        Members are only readable until the next one is yielded.
+
+        :Parameters:
+           - `select`: Callable taking the name and size of a member,
+             the scope's ``match`` by default.
+        """
+        if select is None:
+            select = self.scope.match
+        self.io.seek(0)
+        archive = tarfile.open(fileobj=self.io, mode="r|*")
+        found = {}
+        try:
+            for info in archive:
+                if not info.isfile():
+                    continue
+                if info.name.endswith("/PKG-INFO"):
+                    depth = info.name.strip("/").count("/")
+                    if depth not in found:
+                        found[depth] = read_pkg_info(
+                            archive.extractfile(info))
+                elif select(info.name, info.size):
+                    yield Member(
+                        info.name,
+                        lambda info=info: archive.extractfile(info),
+                        size=info.size)
+        finally:
+            archive.close()
+
+        self.info = found[min(found)] if found else {}
+
+    def readinfo(self, hints={}):
+        """
+        Extract meta information from the archive. When the members were
+        already read the PKG-INFO seen on the way is returned.
+
+        :Parameters:
+           - `hints`: specify things to look for if available.
+        """
+        if self.info is None:
+            for member in self.scan(lambda name, size: False):
+                pass
+        return self.info
+
+    def readmembers(self):
+        """
+        Return the python sources (by default) of the archive.
+        """
+        return self.scan()
+
+    def readarchives(self, extensions):
+        """
+        Return the archives nested in the archive.
+
+        :Parameters:
+           - `extensions`: File extensions of supported archives.
+        """
+        extensions = tuple(extensions)
+        return self.scan(lambda name, size: name.endswith(extensions))
+
+    def readsequential(self, extensions):
+        return tarstream.readsequential(self, extensions)
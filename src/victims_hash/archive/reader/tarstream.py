@@ -0,0 +1,36 @@
+"""
+Sequential reading shared by the tarball based readers (gem, sdist).
+"""
+
+from io import BytesIO
+
+from victims_hash.archive.reader import Member
+
+
+def readsequential(reader, extensions):
+    """
+    Implements ``ArchiveReader.readsequential`` for tarball readers, which
+    read in a single pass anyway. The reader's ``scan`` yields the members
+    picked by a callable taking their name and size, and collects what
+    ``readinfo`` needs on the way.
+
+    :Parameters:
+       - `reader`: The ``ArchiveReader``.
+       - `extensions`: File extensions of supported archives.
+    """
+    extensions = tuple(extensions)
+    match = reader.scope.match
+    for member in reader.scan(lambda name, size: match(name, size) or
+                              name.endswith(extensions)):
+        if not match(member.name, member.size):
+            yield ("archive", member)
+        elif member.name.endswith(extensions):
+            # Both, it cannot be read twice from the stream.
+            content = member.read()
+            member = Member(
+                member.name, lambda content=content: BytesIO(content),
+                size=len(content))
+            yield ("member", member)
+            yield ("archive", member)
+        else:
+            yield ("member", member)
@@ -0,0 +1,117 @@
+import base64
+import binascii
+import csv
+import hashlib
+import re
+
+from victims_hash.archive.reader import ArchiveReader, zipstream
+from victims_hash.archive.reader.pkginfo import read_pkg_info
+from victims_hash.archive.reader.scope import Scope
+from victims_hash.archive.reader.zipindex import ZipIndex, is_zip
+from victims_hash.archive.reader.zipmember import readarchives, readmembers
+
+
+METADATA = re.compile(r"^[^/]+\.dist-info/METADATA$")
+RECORD = re.compile(r"^[^/]+\.dist-info/RECORD$")
+
+
+def read_record(lines):
+    """
+    Return {path: (algorithm, hexdigest, size)} from the RECORD of a wheel,
+    leaving out entries without a well formed digest or size.
+
+    :Parameters:
+       - `lines`: Iterable over the lines of the RECORD.
+    """
+    record = {}
+    for row in csv.reader(lines):
+        if len(row) != 3 or "=" not in row[1]:
+            continue
+        path, digest, size = row
+        algorithm, encoded = digest.split("=", 1)
+        try:
+            raw = base64.urlsafe_b64decode(
+                encoded + "=" * (-len(encoded) % 4))
+            if len(raw) != hashlib.new(algorithm).digest_size:
+                continue
+            record[path.decode("utf-8")] = (
+                algorithm, binascii.hexlify(raw), int(size))
+        except (TypeError, ValueError):
+            continue
+    return record
+
+
+class WheelReader(ArchiveReader):
+    """
+    Reads python wheels: the core metadata from ``*.dist-info/METADATA``
+    and the python sources.
+
+    The RECORD of a wheel lists the digest of every file. If it is trusted
+    (`trust_record`), holds the only algorithm fingerprinted with (eg.
+    ``algorithms=["sha256"]``) and the recorded size matches the one in the
+    central directory, the recorded digest is used instead of reading the
+    file. It is not trusted by default: a crafted RECORD would otherwise
+    pass content off as a known file.
+    """
+
+    format = "wheel"
+    extensions = (".whl",)
+    scope = Scope(["*.py"])
+    concurrent = True
+
+    @classmethod
+    def sniff(cls, head):
+        return is_zip(head)
+
+    def opencontainer(self):
+        return ZipIndex(self.io)
+
+    def readinfo(self, hints={}):
+        """
+        Extract meta information from the archive.
+
+        :Parameters:
+           - `hints`: specify things to look for if available.
+        """
+        for name in self.container.namelist():
+            if METADATA.match(name):
+                with self.container.open(name) as metadata:
+                    return read_pkg_info(metadata)
+        return {}
+
+    def readrecord(self):
+        """
+        Return the parsed RECORD of the wheel, see `read_record`.
+        """
+        for name in self.container.namelist():
+            if RECORD.match(name):
+                with self.container.open(name) as record:
+                    return read_record(record)
+        return {}
+
+    def readmembers(self):
+        """
+        Return the python sources (by default) of the archive.
+        """
+        record = self.readrecord() if self.trust_record else {}
+        for member in readmembers(self.container, self.scope):
+            recorded = record.get(member.name)
+            if recorded is not None and recorded[2] == member.size:
+                member.recorded = {recorded[0]: recorded[1]}
+            yield member
+
+    def readarchives(self, extensions):
+        """
+        Return the archives nested in the archive.
+
+        :Parameters:
+           - `extensions`: File extensions of supported archives.
+        """
+        return readarchives(self.container, extensions)
+
+    def readsequential(self, extensions):
+        # The RECORD comes last, so a stream is always hashed.
+        return zipstream.readsequential(self, extensions)
+
+    def isinfo(self, name):
+        return METADATA.match(name) is not None
@@ -0,0 +1,327 @@
+"""
+Memory mapped zip central directory index.
+
+``zipfile.ZipFile`` builds a ``ZipInfo`` object for every entry which is slow
+for jars with tens of thousands of entries. ``ZipIndex`` instead maps the
+file and scans the central directory into flat arrays of offsets, sizes,
+CRCs and name slices. Members are decompressed straight from ``buffer``
+slices of the mapping (Python 2's zero copy view, ``memoryview`` does not
+support ``mmap`` or ``zlib`` there).
+"""
+
+import io
+import mmap
+import struct
+import zlib
+
+from array import array
+from zipfile import BadZipfile
+
+from victims_hash.archive.reader import BUFFER_SIZE
+
+
+END_RECORD = struct.Struct("<4s4H2LH")
+END_RECORD_MAGIC = b"PK\x05\x06"
+END_RECORD64 = struct.Struct("<4sQ2H2L4Q")
+END_RECORD64_MAGIC = b"PK\x06\x06"
+END_LOCATOR64 = struct.Struct("<4sLQL")
+END_LOCATOR64_MAGIC = b"PK\x06\x07"
+CENTRAL_HEADER = struct.Struct("<4s4B4HL2L5H2L")
+CENTRAL_HEADER_MAGIC = b"PK\x01\x02"
+LOCAL_HEADER = struct.Struct("<4s22xHH")
+LOCAL_HEADER_MAGIC = b"PK\x03\x04"
+EXTRA_HEADER = struct.Struct("<HH")
+ZIP64_EXTRA = 0x0001
+
+# General purpose flags.
+FLAG_ENCRYPTED = 0x0001
+FLAG_UTF8 = 0x0800
+
+# Compression methods.
+STORED = 0
+DEFLATED = 8
+
+# End of central directory record plus the longest possible comment.
+MAX_END_SEARCH = END_RECORD.size + 0xffff
+
+
+def is_zip(head):
+    """
+    Whether the first bytes of a file are those of a zip (or of an empty
+    one).
+    """
+    return head[:4] in (LOCAL_HEADER_MAGIC, END_RECORD_MAGIC)
+
+
+class ZipIndex(object):
+    """
+    Compact, read only index of a zip file.
+
+    Entry ``i`` of the archive is described by ``offsets[i]`` (local
+    header), ``compress_sizes[i]``, ``file_sizes[i]``, ``crcs[i]``,
+    ``methods[i]``, ``flags[i]`` and its name slice
+    ``name_starts[i]``/``name_lengths[i]`` into the mapped file.
+    """
+
+    def __init__(self, fileobj):
+        """
+        Maps and indexes a zip file.
+
+        :Parameters:
+           - `fileobj`: File-like object. Real files are memory mapped, other
+             objects are read into memory once.
+        """
+        self.fileobj = fileobj
+        try:
+            fileobj.seek(0, 2)
+            size = fileobj.tell()
+            self.data = mmap.mmap(
+                fileobj.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        except (AttributeError, IOError, ValueError, EnvironmentError):
+            if hasattr(fileobj, 'getvalue'):
+                self.data = fileobj.getvalue()
+            else:
+                fileobj.seek(0)
+                self.data = fileobj.read()
+        self._names = None
+        self._lookup = None
+        self._scan()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _scan(self):
+        data = self.data
+        size = len(data)
+        end = data.rfind(END_RECORD_MAGIC, max(0, size - MAX_END_SEARCH))
+        if end < 0:
+            raise BadZipfile("File is not a zip file")
+
+        (_, _, _, _, count, cd_size, cd_offset, _) = END_RECORD.unpack_from(
+            data, end)
+
+        locator = end - END_LOCATOR64.size
+        if locator >= 0 and \
+                data[locator:locator + 4] == END_LOCATOR64_MAGIC:
+            # The record usually sits right before the locator, whose
+            # offset of it does not account for a prefix.
+            record64 = locator - END_RECORD64.size
+            if record64 < 0 or \
+                    data[record64:record64 + 4] != END_RECORD64_MAGIC:
+                record64 = END_LOCATOR64.unpack_from(data, locator)[2]
+            if record64 + END_RECORD64.size > size:
+                raise BadZipfile("Corrupt zip64 end of central directory")
+            fields = END_RECORD64.unpack_from(data, record64)
+            if fields[0] != END_RECORD64_MAGIC:
+                raise BadZipfile("Corrupt zip64 end of central directory")
+            count, cd_size, cd_offset = fields[7], fields[8], fields[9]
+            end = record64
+
+        # Archives with a prefix (eg. self extracting) have all offsets
+        # shifted by the length of the prefix.
+        self.prefix = end - cd_size - cd_offset
+        if self.prefix < 0:
+            raise BadZipfile("Corrupt central directory offset")
+
+        self.offsets = offsets = array('L')
+        self.compress_sizes = compress_sizes = array('L')
+        self.file_sizes = file_sizes = array('L')
+        self.crcs = crcs = array('L')
+        self.methods = methods = array('H')
+        self.flags = flags = array('H')
+        self.name_starts = name_starts = array('L')
+        self.name_lengths = name_lengths = array('H')
+
+        unpack = CENTRAL_HEADER.unpack_from
+        header_size = CENTRAL_HEADER.size
+        pos = cd_offset + self.prefix
+        for _ in xrange(count):
+            (magic, _, _, _, _, flag, method, _, _, crc, csize, usize,
+             name_length, extra_length, comment_length, _, _, _,
+             offset) = unpack(data, pos)
+            if magic != CENTRAL_HEADER_MAGIC:
+                raise BadZipfile("Bad magic number for central directory")
+
+            name_start = pos + header_size
+            extra_start = name_start + name_length
+            if 0xffffffff in (csize, usize, offset):
+                usize, csize, offset = self._zip64(
+                    extra_start, extra_length, usize, csize, offset)
+
+            offsets.append(offset + self.prefix)
+            compress_sizes.append(csize)
+            file_sizes.append(usize)
+            crcs.append(crc)
+            methods.append(method)
+            flags.append(flag)
+            name_starts.append(name_start)
+            name_lengths.append(name_length)
+            pos = extra_start + extra_length + comment_length
+
+    def _zip64(self, pos, length, usize, csize, offset):
+        """
+        Read the 64 bit sizes and offset from a zip64 extra field.
+        """
+        end = pos + length
+        while pos + EXTRA_HEADER.size <= end:
+            tag, size = EXTRA_HEADER.unpack_from(self.data, pos)
+            pos += EXTRA_HEADER.size
+            if tag == ZIP64_EXTRA:
+                values = list(struct.unpack_from(
+                    "<%dQ" % (size // 8), self.data, pos))
+                if usize == 0xffffffff:
+                    usize = values.pop(0)
+                if csize == 0xffffffff:
+                    csize = values.pop(0)
+                if offset == 0xffffffff:
+                    offset = values.pop(0)
+                break
+            pos += size
+        return (usize, csize, offset)
+
+    def name(self, i):
+        """
+        Return the name of entry `i`.
+        """
+        start = self.name_starts[i]
+        name = self.data[start:start + self.name_lengths[i]]
+        if self.flags[i] & FLAG_UTF8:
+            name = name.decode('utf-8')
+        return name
+
+    def namelist(self):
+        """
+        Return the names of all entries, decoded once and kept.
+        """
+        if self._names is None:
+            self._names = [self.name(i) for i in xrange(len(self))]
+        return self._names
+
+    def __contains__(self, name):
+        try:
+            self.find(name)
+            return True
+        except KeyError:
+            return False
+
+    def find(self, name):
+        """
+        Return the index of the entry called `name`.
+        """
+        if self._lookup is None:
+            self._lookup = dict(
+                (n, i) for (i, n) in enumerate(self.namelist()))
+        try:
+            return self._lookup[name]
+        except KeyError:
+            raise KeyError("There is no item named %r in the archive" % name)
+
+    def key(self, i):
+        """
+        Identity of the content of entry `i`: (crc32, compressed size,
+        size, method).
+        """
+        return (self.crcs[i], self.compress_sizes[i], self.file_sizes[i],
+                self.methods[i])
+
+    def raw(self, i):
+        """
+        Return a zero copy ``buffer`` over the stored bytes of entry `i`.
+        """
+        offset = self.offsets[i]
+        magic, name_length, extra_length = LOCAL_HEADER.unpack_from(
+            self.data, offset)
+        if magic != LOCAL_HEADER_MAGIC:
+            raise BadZipfile("Bad magic number for file header")
+        start = offset + LOCAL_HEADER.size + name_length + extra_length
+        if start + self.compress_sizes[i] > len(self.data):
+            raise BadZipfile("Truncated file %s" % self.name(i))
+        return buffer(self.data, start, self.compress_sizes[i])
+
+    def open(self, i):
+        """
+        Return a buffered stream of the decompressed content of entry `i`.
+
+        :Parameters:
+           - `i`: Index of the entry, or its name.
+        """
+        if isinstance(i, basestring):
+            i = self.find(i)
+        if self.flags[i] & FLAG_ENCRYPTED:
+            raise RuntimeError("File %s is encrypted" % self.name(i))
+        if self.methods[i] not in (STORED, DEFLATED):
+            raise NotImplementedError(
+                "Compression method %i is not supported" % self.methods[i])
+        return io.BufferedReader(EntryStream(self, i), BUFFER_SIZE)
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+
+class EntryStream(io.RawIOBase):
+    """
+    Raw stream inflating one entry from slices of the index's data and
+    checking its CRC once fully read.
+    """
+
+    def __init__(self, index, i):
+        self.name = index.name(i)
+        self.raw = index.raw(i)
+        self.size = index.file_sizes[i]
+        self.crc = index.crcs[i]
+        self.position = 0
+        self.produced = 0
+        self.running_crc = 0
+        self.pending = b''
+        if index.methods[i] == DEFLATED:
+            self.inflater = zlib.decompressobj(-15)
+        else:
+            self.inflater = None
+
+    def readable(self):
+        return True
+
+    def _next(self, size):
+        """
+        Return up to `size` more bytes of content, or '' at the end.
+        """
+        if self.pending:
+            data, self.pending = self.pending[:size], self.pending[size:]
+            return data
+
+        while self.position < len(self.raw):
+            if self.inflater is None:
+                data = self.raw[self.position:self.position + size]
+                self.position += len(data)
+            else:
+                chunk = buffer(self.raw, self.position, BUFFER_SIZE)
+                self.position += len(chunk)
+                data = self.inflater.decompress(chunk, size)
+                # Keep what was not inflated because of the size limit.
+                self.position -= len(self.inflater.unconsumed_tail)
+            if data:
+                return data
+
+        if self.inflater is not None:
+            data = self.inflater.flush()
+            self.inflater = None
+            if data:
+                self.pending = data[size:]
+                return data[:size]
+        return b''
+
+    def readinto(self, b):
+        data = self._next(len(b))
+        n = len(data)
+        b[:n] = data
+        self.produced += n
+        self.running_crc = zlib.crc32(data, self.running_crc)
+        if n == 0 or self.produced >= self.size:
+            self._check()
+        return n
+
+    def _check(self):
+        if self.produced != self.size or \
+                (self.running_crc & 0xffffffff) != self.crc:
+            raise BadZipfile("Bad CRC-32 for file %r" % self.name)
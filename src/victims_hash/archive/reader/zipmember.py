@@ -0,0 +1,86 @@
+"""
+Members of zip based archives.
+"""
+
+import hashlib
+
+from victims_hash.archive.reader import BUFFER_SIZE, Member
+
+
+class ZipMember(Member):
+    """
+    An entry of a ``ZipIndex`` keyed on the CRC32 and sizes recorded in the
+    central directory.
+    """
+
+    def __init__(self, index, i, name=None, skip=None):
+        """
+        Creates a zip member.
+
+        :Parameters:
+           - `index`: The ``ZipIndex`` holding the member.
+           - `i`: Position of the member in the index.
+           - `name`: Name of the member if already known.
+           - `skip`: Optional callable reading past a header that should
+             not be fingerprinted from the opened member stream.
+        """
+        self.index = index
+        self.i = i
+        self.skip = skip
+        self._rawdigest = None
+        Member.__init__(
+            self, name if name is not None else index.name(i),
+            self._openmember, index.key(i), index.file_sizes[i])
+
+    def _openmember(self):
+        stream = self.index.open(self.i)
+        if self.skip is not None:
+            self.skip(stream)
+        return stream
+
+    def rawchunks(self, size=BUFFER_SIZE):
+        """
+        Yield the stored bytes of the member without decompressing them.
+        """
+        raw = self.index.raw(self.i)
+        for start in xrange(0, len(raw), size):
+            yield buffer(raw, start, size)
+
+    def rawdigest(self):
+        if self._rawdigest is None:
+            digest = hashlib.sha1()
+            for buff in self.rawchunks():
+                digest.update(buff)
+            self._rawdigest = digest.digest()
+        return self._rawdigest
+
+
+def readmembers(index, scope, member=ZipMember):
+    """
+    Return the members of a zip file selected by `scope`, judged by their
+    name and size in the central directory.
+
+    :Parameters:
+       - `index`: The ``ZipIndex`` to look in.
+       - `scope`: ``Scope`` of the members.
+       - `member`: Callable creating the member from the index, position
+         and name.
+    """
+    sizes = index.file_sizes
+    for (i, name) in enumerate(index.namelist()):
+        if scope.match(name, sizes[i]):
+            yield member(index, i, name)
+
+
+def readarchives(index, extensions):
+    """
+    Return the members of a zip file that are archives themselves.
+
+    :Parameters:
+       - `index`: The ``ZipIndex`` to look in.
+       - `extensions`: File extensions of supported archives.
+    """
+    extensions = tuple(extensions)
+    for (i, name) in enumerate(index.namelist()):
+        if name.lower().endswith(extensions):
+            yield ZipMember(index, i)
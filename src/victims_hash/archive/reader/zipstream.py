@@ -0,0 +1,428 @@
+"""
+Sequential reading of zip files from streams that can not seek.
+
+The central directory sits at the end of a zip, so a stream is read
+through its local file headers instead. Every entry is read (or skipped)
+in order while `TeeReader` hashes all the bytes going by, which yields the
+digest of the whole file once the stream is drained.
+
+Entries written with a data descriptor do not record their sizes up
+front. Deflated ones end where the deflate stream ends; stored ones are
+buffered until a descriptor whose CRC and size match what was read.
+"""
+
+import io
+import struct
+import zlib
+
+from zipfile import BadZipfile
+
+from victims_hash.archive.archive import MultiDigest
+from victims_hash.archive.reader import BUFFER_SIZE, Member
+from victims_hash.archive.reader.zipindex import (
+    CENTRAL_HEADER_MAGIC, DEFLATED, END_RECORD_MAGIC, EXTRA_HEADER,
+    FLAG_ENCRYPTED, FLAG_UTF8, LOCAL_HEADER_MAGIC, STORED, ZIP64_EXTRA)
+
+
+LOCAL_FILE_HEADER = struct.Struct("<5H3L2H")
+DESCRIPTOR_MAGIC = b"PK\x07\x08"
+DESCRIPTOR = struct.Struct("<3L")
+DESCRIPTOR64 = struct.Struct("<L2Q")
+
+# General purpose flag: sizes and CRC follow the data.
+FLAG_DESCRIPTOR = 0x0008
+
+
+class TeeReader(object):
+    """
+    Wraps a stream, hashing every byte read from it. Data read ahead can
+    be pushed back with `unread`; it is only hashed once.
+    """
+
+    def __init__(self, stream, algorithms):
+        """
+        :Parameters:
+           - `stream`: File-like object with a ``read`` method.
+           - `algorithms`: Hash algorithms of the whole stream.
+        """
+        self.stream = stream
+        self.digests = MultiDigest(algorithms)
+        self.pending = b''
+        self.position = 0
+        self.closed = False
+
+    def read(self, size=-1):
+        if self.pending and 0 <= size <= len(self.pending):
+            data, self.pending = self.pending[:size], self.pending[size:]
+        else:
+            data, self.pending = self.pending, b''
+            if size < 0:
+                more = self.stream.read()
+            else:
+                more = self.stream.read(size - len(data))
+            self.digests.update(more)
+            data += more
+        self.position += len(data)
+        return data
+
+    def readexact(self, size):
+        """
+        Read exactly `size` bytes, raising ``BadZipfile`` at the end of the
+        stream.
+        """
+        data = self.read(size)
+        while len(data) < size:
+            more = self.read(size - len(data))
+            if not more:
+                raise BadZipfile("Truncated zip stream")
+            data += more
+        return data
+
+    def unread(self, data):
+        """
+        Push back data read too far; the next read returns it first.
+        """
+        self.pending = data + self.pending
+        self.position -= len(data)
+
+    def skip(self, size):
+        while size > 0:
+            data = self.read(min(size, BUFFER_SIZE))
+            if not data:
+                raise BadZipfile("Truncated zip stream")
+            size -= len(data)
+
+    def drain(self):
+        """
+        Read what is left of the stream so its digest is complete.
+        """
+        for _ in iter(lambda: self.read(BUFFER_SIZE), b''):
+            pass
+
+    def hexdigests(self):
+        return self.digests.hexdigests()
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=0):
+        """
+        Only seeking to the current position (eg. rewinding a stream
+        nothing was read from yet) is possible.
+        """
+        if (whence == 0 and offset == self.position) or \
+                (whence == 1 and offset == 0):
+            return self.position
+        raise IOError("Stream is not seekable")
+
+    def close(self):
+        # The wrapped stream belongs to the caller.
+        self.closed = True
+
+
+class LocalEntry(object):
+    """
+    An entry of a zip read from its local file header. Its content must be
+    read with `open` before the next entry is, `finish` skips the rest.
+    """
+
+    def __init__(self, tee, name, flags, method, crc, csize, usize, zip64):
+        self.tee = tee
+        self.name = name
+        self.flags = flags
+        self.method = method
+        self.crc = crc
+        self.csize = csize
+        self.size = usize
+        self.zip64 = zip64
+        self.raw = None
+
+    def open(self):
+        """
+        Return a buffered stream of the decompressed content.
+        """
+        if self.raw is not None:
+            raise ValueError("Entry %s was already read" % self.name)
+        if self.flags & FLAG_ENCRYPTED:
+            raise RuntimeError("File %s is encrypted" % self.name)
+        if self.method not in (STORED, DEFLATED):
+            raise NotImplementedError(
+                "Compression method %i is not supported" % self.method)
+        self.raw = LocalEntryStream(self)
+        return io.BufferedReader(self.raw, BUFFER_SIZE)
+
+    def finish(self):
+        """
+        Move the stream past the entry, checking its CRC if it was read.
+        """
+        if self.raw is None:
+            if not self.flags & FLAG_DESCRIPTOR:
+                self.tee.skip(self.csize)
+                return
+            self.open()
+        raw = self.raw
+        while raw.next(BUFFER_SIZE):
+            pass
+        if raw.remaining:
+            # Padding after the end of the deflate stream.
+            self.tee.skip(raw.remaining)
+        if self.flags & FLAG_DESCRIPTOR and not raw.described:
+            self.readdescriptor()
+        if raw.produced != self.size or \
+                (raw.running_crc & 0xffffffff) != self.crc:
+            raise BadZipfile("Bad CRC-32 for file %r" % self.name)
+
+    def readdescriptor(self):
+        """
+        Read the data descriptor following the content.
+        """
+        layout = DESCRIPTOR64 if self.zip64 else DESCRIPTOR
+        data = self.tee.readexact(4)
+        if data == DESCRIPTOR_MAGIC:
+            data = b''
+        data += self.tee.readexact(layout.size - len(data))
+        self.crc, self.csize, self.size = layout.unpack(data)
+
+    def scanstored(self):
+        """
+        Return the content of a stored entry with a data descriptor, found
+        by looking for a descriptor matching the bytes before it.
+        """
+        layout = DESCRIPTOR64 if self.zip64 else DESCRIPTOR
+        buff = b''
+        start = 0
+        while True:
+            at = buff.find(DESCRIPTOR_MAGIC, start)
+            if at >= 0 and len(buff) >= at + 4 + layout.size:
+                crc, csize, usize = layout.unpack_from(buff, at + 4)
+                if csize == at and usize == at and \
+                        (zlib.crc32(buff[:at]) & 0xffffffff) == crc:
+                    self.tee.unread(buff[at + 4 + layout.size:])
+                    self.crc, self.csize, self.size = crc, csize, usize
+                    return buff[:at]
+                start = at + 1
+                continue
+            if at >= 0:
+                # Wait for the rest of a possible descriptor.
+                start = at
+            else:
+                start = max(0, len(buff) - 3)
+            data = self.tee.read(BUFFER_SIZE)
+            if not data:
+                raise BadZipfile("No data descriptor for %s" % self.name)
+            buff += data
+
+
+class LocalEntryStream(io.RawIOBase):
+    """
+    Raw stream of the content of a `LocalEntry`, read from the tee.
+    """
+
+    def __init__(self, entry):
+        self.entry = entry
+        self.tee = entry.tee
+        self.produced = 0
+        self.running_crc = 0
+        self.pending = b''
+        self.ended = False
+        self.described = False
+        self.content = None
+        self.remaining = None
+        if not entry.flags & FLAG_DESCRIPTOR:
+            self.remaining = entry.csize
+        elif entry.method == STORED:
+            self.content = io.BytesIO(entry.scanstored())
+            self.described = True
+        if entry.method == DEFLATED:
+            self.inflater = zlib.decompressobj(-15)
+        else:
+            self.inflater = None
+
+    def readable(self):
+        return True
+
+    def compressed(self, size):
+        """
+        Return up to `size` more stored bytes of the entry, '' at its end.
+        """
+        if self.content is not None:
+            return self.content.read(size)
+        if self.remaining is None:
+            # Deflated with a descriptor: the inflater finds the end.
+            return self.tee.read(size)
+        data = self.tee.read(min(size, self.remaining))
+        if not data and self.remaining:
+            raise BadZipfile("Truncated file %s" % self.entry.name)
+        self.remaining -= len(data)
+        return data
+
+    def next(self, size):
+        """
+        Return up to `size` more bytes of content, or '' at the end.
+        """
+        data = self._next(size)
+        self.produced += len(data)
+        self.running_crc = zlib.crc32(data, self.running_crc)
+        return data
+
+    def _next(self, size):
+        if self.pending:
+            data, self.pending = self.pending[:size], self.pending[size:]
+            return data
+        if self.ended:
+            return b''
+
+        if self.inflater is None:
+            data = self.compressed(size)
+            self.ended = not data
+            return data
+
+        data = b''
+        while True:
+            tail = self.inflater.unconsumed_tail
+            if tail:
+                data = self.inflater.decompress(tail, size)
+            else:
+                chunk = self.compressed(BUFFER_SIZE)
+                if not chunk:
+                    if self.remaining is None:
+                        raise BadZipfile(
+                            "Truncated file %s" % self.entry.name)
+                    break
+                data = self.inflater.decompress(chunk, size)
+            if self.inflater.unused_data:
+                if self.remaining is None:
+                    # What follows the end of the deflate stream is the
+                    # descriptor and the next entry.
+                    self.tee.unread(self.inflater.unused_data)
+                break
+            if data:
+                return data
+
+        self.ended = True
+        rest = self.inflater.flush()
+        if data:
+            rest = data + rest
+        self.pending = rest[size:]
+        return rest[:size]
+
+    def readinto(self, b):
+        data = self.next(len(b))
+        n = len(data)
+        b[:n] = data
+        return n
+
+
+def readentries(tee):
+    """
+    Yield the `LocalEntry` of every entry of a zip stream in order, each
+    finished before the next is read. The stream is left at the central
+    directory.
+
+    :Parameters:
+       - `tee`: `TeeReader` over the zip.
+    """
+    first = True
+    while True:
+        magic = tee.read(4)
+        if magic != LOCAL_HEADER_MAGIC:
+            if first and magic and magic not in (
+                    CENTRAL_HEADER_MAGIC, END_RECORD_MAGIC):
+                raise BadZipfile(
+                    "File is not a zip file, or has a prefix which needs "
+                    "a seekable file")
+            tee.unread(magic)
+            return
+        first = False
+
+        (_, flags, method, _, _, crc, csize, usize, name_length,
+         extra_length) = LOCAL_FILE_HEADER.unpack(
+             tee.readexact(LOCAL_FILE_HEADER.size))
+        name = tee.readexact(name_length)
+        if flags & FLAG_UTF8:
+            name = name.decode('utf-8')
+        extra = tee.readexact(extra_length)
+
+        zip64 = False
+        pos = 0
+        while pos + EXTRA_HEADER.size <= len(extra):
+            tag, size = EXTRA_HEADER.unpack_from(extra, pos)
+            pos += EXTRA_HEADER.size
+            if tag == ZIP64_EXTRA:
+                zip64 = True
+                values = list(struct.unpack_from(
+                    "<%dQ" % (size // 8), extra, pos))
+                if usize == 0xffffffff and values:
+                    usize = values.pop(0)
+                if csize == 0xffffffff and values:
+                    csize = values.pop(0)
+            pos += size
+
+        entry = LocalEntry(
+            tee, name, flags, method, crc, csize, usize, zip64)
+        yield entry
+        entry.finish()
+
+
+class CollectedFiles(object):
+    """
+    Stands in for a ``ZipIndex`` once a stream was read, holding the names
+    of all entries and the content of those collected on the way, so
+    ``readinfo`` works unchanged.
+    """
+
+    def __init__(self, names, files):
+        self.names = names
+        self.files = files
+
+    def __contains__(self, name):
+        return name in self.files
+
+    def namelist(self):
+        return self.names
+
+    def open(self, name):
+        if name not in self.files:
+            raise KeyError("%r was not collected from the stream" % name)
+        return io.BytesIO(self.files[name])
+
+    def close(self):
+        pass
+
+
+def readsequential(reader, extensions):
+    """
+    Implements ``ArchiveReader.readsequential`` for zip based readers whose
+    `io` is a `TeeReader`. Members are selected by the reader's scope from
+    their local header, those written with a data descriptor by name alone
+    as their size is not known up front. Files read by ``readinfo`` are
+    collected on the way and are members too when the scope selects them.
+
+    :Parameters:
+       - `reader`: The ``ArchiveReader``.
+       - `extensions`: File extensions of supported archives.
+    """
+    names = []
+    files = {}
+    extensions = tuple(extensions)
+    for entry in readentries(reader.io):
+        names.append(entry.name)
+        size = None if entry.flags & FLAG_DESCRIPTOR else entry.size
+        if reader.isinfo(entry.name):
+            content = files[entry.name] = entry.open().read()
+            if reader.scope.match(entry.name, len(content)):
+                yield ("member", Member(
+                    entry.name,
+                    lambda entry=entry, content=content:
+                        reader.contentstream(
+                            entry.name, io.BytesIO(content)),
+                    size=len(content)))
+        elif reader.scope.match(entry.name, size):
+            yield ("member", Member(
+                entry.name,
+                lambda entry=entry: reader.contentstream(
+                    entry.name, entry.open()),
+                size=size))
+        elif entry.name.lower().endswith(extensions):
+            yield ("archive", Member(entry.name, entry.open, size=size))
+    reader._container = CollectedFiles(names, files)
@@ -1,10 +1,14 @@
 import argparse
+import json
 import multiprocessing
 import os.path
+import signal
 import pyinotify
 
-from victims_hash.autoprocess.processor import process
-from victims_hash.autoprocess import store
+from victims_hash.autoprocess.pipeline import Pipeline
+from victims_hash.autoprocess import exporter, store
+from victims_hash.autoprocess.sinks import SINKS
+from victims_hash.metrics import Metrics
 
 
 class EventHandler(pyinotify.ProcessEvent):
@@ -12,30 +16,44 @@ class EventHandler(pyinotify.ProcessEvent):
     How to handle events from the watch.
     """
 
-    def my_init(self, pool, store, topdir, config):
+    def my_init(self, pipeline, topdir):
         """
         Additional items on creation of instance.
 
         :Parameters:
-           - `pool`: Multiprocessing pool.
-           - `store`: Callable that will store results (filename data)
+           - `pipeline`: Pipeline files are handed to once written.
            - `topdir`: Top directory everything processing should be under
         """
-        self.pool = pool
-        self.store = store
+        self.pipeline = pipeline
         self.topdir = topdir
-        self.config = config
 
-    def process_IN_CREATE(self, event):
+    def notify(self, event):
+        if not event.dir and event.pathname.startswith(self.topdir):
+            self.pipeline.notify(event.pathname)
+
+    def process_IN_CLOSE_WRITE(self, event):
         """
-        How to process a create event.
+        A file opened for writing was closed: it may be complete.
 
         :Parameters:
-           - `event`: The create event.
+           - `event`: The close event.
+        """
+        self.notify(event)
+
+    def process_IN_MOVED_TO(self, event):
         """
-        if event.pathname.startswith(self.topdir):
-            self.pool.apply_async(
-                process, (event.pathname, self.store, self.config))
+        A file was moved in place, usually once fully uploaded.
+
+        :Parameters:
+           - `event`: The move event.
+        """
+        self.notify(event)
+
+    def process_IN_Q_OVERFLOW(self, event):
+        """
+        The kernel dropped events because we did not keep up.
+        """
+        print "Event queue overflowed, some files were not seen"
 
 
 def main():
@@ -49,6 +67,24 @@ def main():
         '-d', '--directory', default=os.path.realpath('.'), type=str)
     parser.add_argument('-s', '--store', required=True, type=str)
     parser.add_argument('-c', '--config', default=None, type=str)
+    parser.add_argument(
+        '--max-inflight', default=None, type=int,
+        help='Files processed at once, defaults to twice the workers.')
+    parser.add_argument(
+        '--max-pending', default=1000, type=int,
+        help='Files waiting to be processed before events are held back.')
+    parser.add_argument(
+        '--debounce', default=1.0, type=float,
+        help='Seconds a file must be left alone before it is processed.')
+    parser.add_argument('--retries', default=2, type=int)
+    parser.add_argument(
+        '--timeout', default=3600.0, type=float,
+        help='Seconds a file may take before it counts as failed, eg. '
+             'because its worker died.')
+    parser.add_argument(
+        '--metrics-port', default=None, type=int,
+        help='Record per stage timings and counters and serve them on '
+             'this port at /metrics (Prometheus) and /metrics.json.')
 
     args = parser.parse_args()
     args.directory = os.path.realpath(args.directory)
@@ -59,20 +95,58 @@ def main():
     if args.config:
         with open(args.config, 'r') as c_obj:
             for line in c_obj.readlines():
-                key, value = line.split('=')
+                key, value = line.split('=', 1)
                 config[key.strip()] = value.strip()
 
+    # Batched stores are written from here, once for all the workers, so
+    # files are only counted as processed once their result is stored.
+    sink = None
+    if args.store in SINKS:
+        sink = store.create_sink(args.store, config)
+
     pool = multiprocessing.Pool(args.workers)
+    pipeline = Pipeline(
+        pool, getattr(store, args.store) if sink is None else None, config,
+        max_inflight=args.max_inflight or 2 * args.workers,
+        max_pending=args.max_pending, debounce=args.debounce,
+        retries=args.retries, timeout=args.timeout,
+        metrics=Metrics() if args.metrics_port else None, sink=sink)
+    if args.metrics_port:
+        exporter.serve(pipeline, args.metrics_port)
+
+    # kill -USR1 <pid> prints the queue state.
+    signal.signal(
+        signal.SIGUSR1, lambda signum, frame: print_stats(pipeline))
+
     try:
+        pipeline.start()
         wm = pyinotify.WatchManager()
         notifier = pyinotify.Notifier(
-            wm, EventHandler(pool=pool, store=getattr(
-                store, args.store), topdir=args.directory, config=config))
-        wm.add_watch(args.directory, pyinotify.IN_CREATE)
+            wm, EventHandler(pipeline=pipeline, topdir=args.directory))
+        wm.add_watch(
+            args.directory, pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO,
+            rec=True, auto_add=True)
         notifier.loop()
     except Exception, ex:
         print ex
+    finally:
+        pipeline.stop()
         pool.close()
+        pool.join()
+        pipeline.close()
+
+
+def print_stats(pipeline):
+    """
+    Print the pipeline counters and the latest outcomes.
+    """
+    stats = {
+        "stats": pipeline.stats(),
+        "outcomes": dict(list(pipeline.outcomes.items())[-20:]),
+    }
+    if pipeline.metrics is not None:
+        stats["metrics"] = pipeline.metrics.snapshot()
+    print json.dumps(stats)
 
 
 if __name__ == '__main__':
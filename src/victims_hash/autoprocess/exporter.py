@@ -0,0 +1,61 @@
+"""
+HTTP endpoint exposing the metrics of the autoprocess daemon.
+
+    GET /metrics       Prometheus text format
+    GET /metrics.json  JSON
+"""
+
+import threading
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Answers with the metrics of the server's pipeline.
+    """
+
+    def do_GET(self):
+        pipeline = self.server.pipeline
+        stats = pipeline.stats()
+        gauges = {
+            "pending": stats.pop("pending"),
+            "inflight": stats.pop("inflight"),
+            "storing": stats.pop("storing"),
+        }
+        if self.path == "/metrics":
+            body = pipeline.metrics.prometheus(stats, gauges)
+            content_type = "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body = pipeline.metrics.json(stats, gauges)
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would drown the daemon's output.
+        pass
+
+
+def serve(pipeline, port, host=""):
+    """
+    Serve the metrics of `pipeline` on a daemon thread and return the
+    server; ``shutdown`` stops it.
+
+    :Parameters:
+       - `pipeline`: ``Pipeline`` created with a ``Metrics``.
+       - `port`: Port to listen on.
+       - `host`: Address to listen on, all by default.
+    """
+    server = HTTPServer((host, port), MetricsHandler)
+    server.pipeline = pipeline
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
@@ -0,0 +1,314 @@
+"""
+Debounced, bounded dispatch of files to the processing pool.
+"""
+
+import threading
+import time
+
+from collections import OrderedDict
+
+from victims_hash.autoprocess.processor import process
+from victims_hash.metrics import Metrics
+
+
+def run(filename, store, config, metrics=False):
+    """
+    Process a file in a pool worker, returning None on success or a
+    description of the error, the metrics snapshot of the file (None
+    unless `metrics` is set) and the result when it was not stored.
+    Exceptions do not cross the pool so no failure goes unnoticed.
+
+    :Parameters:
+       - `filename`: Path of the file.
+       - `store`: Callable that will store results (filename data), None
+         to return them instead.
+       - `config`: Configuration dict.
+       - `metrics`: Record the timings and counters of the file.
+    """
+    recorder = Metrics() if metrics else None
+    data = None
+    try:
+        data = process(filename, store, config, recorder)
+        error = None
+    except NotImplementedError, ex:
+        # Unsupported files will not get better by retrying.
+        error = ("unsupported", str(ex))
+    except Exception, ex:
+        error = ("error", "%s: %s" % (type(ex).__name__, ex))
+    return (error, recorder.snapshot() if recorder is not None else None,
+            data if store is None else None)
+
+
+class Pipeline(object):
+    """
+    Collects file events, waits until a file has been quiet for `debounce`
+    seconds and hands it to the pool, keeping at most `max_inflight` files
+    in the pool. At most `max_pending` files wait to be dispatched, beyond
+    that `notify` blocks, pushing back on the event source. Failed files
+    are retried `retries` times. Given a ``Metrics``, the timings and
+    counters recorded by the workers are merged into it.
+
+    A Python 2 pool never reports a task whose worker died, so files
+    without a result after `timeout` seconds are failed (and retried) by a
+    watchdog, freeing their slot.
+
+    Given a ``Sink``, the workers return their results and they are
+    stored through it here, batched across all workers. A file is only
+    counted as processed once its result was written; until then it is
+    ``storing``, with the error of the last failed write if any.
+    """
+
+    def __init__(self, pool, store, config, max_inflight=4, max_pending=1000,
+                 debounce=1.0, retries=2, retry_delay=5.0, history=1000,
+                 metrics=None, timeout=3600.0, sink=None):
+        """
+        Creates a pipeline. Call `start` to begin dispatching.
+
+        :Parameters:
+           - `pool`: Multiprocessing pool.
+           - `store`: Callable that will store results (filename data)
+           - `config`: Configuration dict passed to the processor.
+           - `max_inflight`: Files processed at the same time.
+           - `max_pending`: Files waiting to be processed.
+           - `debounce`: Seconds without events before a file is processed.
+           - `retries`: Times a failed file is tried again.
+           - `retry_delay`: Seconds before the first retry, doubled after.
+           - `history`: Number of per file outcomes to remember.
+           - `metrics`: Optional ``Metrics`` collecting worker metrics.
+           - `timeout`: Seconds a file may be processed before it counts
+             as failed, None to wait forever.
+           - `sink`: Optional ``Sink`` storing the results in this process
+             instead of `store` in the workers.
+        """
+        self.pool = pool
+        self.store = store
+        self.config = config
+        self.max_pending = max_pending
+        self.debounce = debounce
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.history = history
+        self.metrics = metrics
+        self.timeout = timeout
+        self.sink = sink
+
+        self.lock = threading.Condition()
+        self.slots = threading.Semaphore(max_inflight)
+        # path -> (due time, attempt)
+        self.pending = OrderedDict()
+        # path -> (task number, attempt, start time)
+        self.inflight = {}
+        self.tasks = 0
+        # path -> outcome of the files whose result is not written yet
+        self.storing = {}
+        self.outcomes = OrderedDict()
+        self.counters = {
+            "events": 0,
+            "processed": 0,
+            "failed": 0,
+            "retried": 0,
+            "timed_out": 0,
+            "store_failures": 0,
+        }
+        self.running = False
+        self.threads = []
+        if sink is not None:
+            sink.add_listener(self._stored)
+
+    def notify(self, path):
+        """
+        Record an event for `path`, (re)starting its quiet period. Blocks
+        while the pending queue is full.
+        """
+        with self.lock:
+            self.counters["events"] += 1
+            while self.running and path not in self.pending and \
+                    len(self.pending) >= self.max_pending:
+                self.lock.wait(1.0)
+            attempt = self.pending.pop(path, (None, 0))[1]
+            self.pending[path] = (time.time() + self.debounce, attempt)
+            self.lock.notify_all()
+
+    def start(self):
+        self.running = True
+        targets = [self._dispatch]
+        if self.timeout is not None:
+            targets.append(self._watch)
+        for target in targets:
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+            self.lock.notify_all()
+        while self.threads:
+            self.threads.pop().join()
+
+    def _next(self):
+        """
+        Wait for the next file whose quiet period is over, take it out of
+        the pending queue and return it with its attempt and task number.
+        """
+        with self.lock:
+            while self.running:
+                now = time.time()
+                due = [(when, path) for (path, (when, _)) in
+                       self.pending.iteritems() if path not in self.inflight]
+                if due:
+                    when, path = min(due)
+                    if when <= now:
+                        attempt = self.pending.pop(path)[1]
+                        self.tasks += 1
+                        self.inflight[path] = (self.tasks, attempt, now)
+                        self.lock.notify_all()
+                        return (path, attempt, self.tasks)
+                    self.lock.wait(when - now)
+                else:
+                    self.lock.wait(1.0)
+            return (None, None, None)
+
+    def _dispatch(self):
+        while self.running:
+            # Wait for a free slot before taking work so files keep
+            # collecting events (and the queue fills up) while we are busy.
+            self.slots.acquire()
+            path, attempt, task = self._next()
+            if path is None:
+                self.slots.release()
+                break
+            self.pool.apply_async(
+                run, (path, self.store if self.sink is None else None,
+                      self.config, self.metrics is not None),
+                callback=lambda outcome, path=path, task=task:
+                    self._done(path, task, *outcome))
+
+    def _watch(self):
+        """
+        Fail the files processed for longer than `timeout`.
+        """
+        with self.lock:
+            while self.running:
+                self.lock.wait(min(self.timeout, 1.0))
+                now = time.time()
+                expired = [
+                    (path, task) for (path, (task, _, started)) in
+                    self.inflight.items() if now - started >= self.timeout]
+                for (path, task) in expired:
+                    self.counters["timed_out"] += 1
+                    self._record(path, task, ("error", (
+                        "No result after %g seconds, the worker may have "
+                        "died" % self.timeout)), None)
+
+    def _done(self, path, task, error, snapshot=None, data=None):
+        """
+        Record the outcome of a file and schedule a retry if it failed.
+        Results of tasks the watchdog gave up on are dropped.
+        """
+        stored = self._record(path, task, error, snapshot)
+        # Not under our lock: the sink calls `_stored` under its own.
+        if stored and self.sink is not None:
+            try:
+                self.sink.put(path, data)
+            except Exception:
+                # Kept by the sink and written later, `_stored` has the
+                # error.
+                pass
+
+    def _record(self, path, task, error, snapshot):
+        """
+        Record the outcome of a task, returning whether its result is
+        to be stored.
+        """
+        with self.lock:
+            current = self.inflight.get(path)
+            if current is None or current[0] != task:
+                return False
+            attempt = self.inflight.pop(path)[1]
+            self.slots.release()
+            if snapshot is not None and self.metrics is not None:
+                self.metrics.merge(snapshot)
+            outcome = {"attempts": attempt + 1, "time": time.time()}
+            if error is None and self.sink is not None:
+                outcome["status"] = "storing"
+                self.storing[path] = outcome
+            elif error is None:
+                outcome["status"] = "ok"
+                self.counters["processed"] += 1
+            else:
+                kind, message = error
+                outcome["status"] = "failed"
+                outcome["error"] = message
+                if kind != "unsupported" and attempt < self.retries:
+                    outcome["status"] = "retrying"
+                    self.counters["retried"] += 1
+                    if path not in self.pending:
+                        self.pending[path] = (
+                            time.time() + self.retry_delay * 2 ** attempt,
+                            attempt + 1)
+                else:
+                    self.counters["failed"] += 1
+
+            self._outcome(path, outcome)
+            return error is None
+
+    def _outcome(self, path, outcome):
+        self.outcomes.pop(path, None)
+        self.outcomes[path] = outcome
+        while len(self.outcomes) > self.history:
+            self.outcomes.popitem(last=False)
+        self.lock.notify_all()
+
+    def _stored(self, paths, error):
+        """
+        Sink listener: count the files whose result was written, or note
+        the error of a failed write on those still waiting.
+        """
+        with self.lock:
+            if error is not None:
+                self.counters["store_failures"] += 1
+            for path in paths:
+                outcome = self.storing.get(path)
+                if outcome is None:
+                    continue
+                if error is not None:
+                    outcome["error"] = "%s: %s" % (type(error).__name__, error)
+                    continue
+                del self.storing[path]
+                outcome["status"] = "ok"
+                outcome.pop("error", None)
+                outcome["time"] = time.time()
+                self.counters["processed"] += 1
+                self._outcome(path, outcome)
+
+    def close(self):
+        """
+        Write the results still buffered in the sink, once the pool is
+        done. Files whose result could not be written are failed.
+        """
+        if self.sink is None:
+            return
+        try:
+            self.sink.close()
+        except Exception, ex:
+            with self.lock:
+                for (path, outcome) in self.storing.items():
+                    outcome["status"] = "failed"
+                    outcome["error"] = "%s: %s" % (type(ex).__name__, ex)
+                    self.counters["failed"] += 1
+                    self._outcome(path, outcome)
+                self.storing.clear()
+
+    def stats(self):
+        """
+        Return the queue depth, in-flight and storing counts and the
+        counters.
+        """
+        with self.lock:
+            stats = dict(self.counters)
+            stats["pending"] = len(self.pending)
+            stats["inflight"] = len(self.inflight)
+            stats["storing"] = len(self.storing)
+            return stats
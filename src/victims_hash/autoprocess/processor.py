@@ -1,9 +1,80 @@
 
-from victims_hash import fingerprint, metadata
+from victims_hash.analyze import analyze
+from victims_hash.archive.memo import MemberCache
+from victims_hash.archive.reader.scope import Scope
+from victims_hash.cache import FingerprintCache
+from victims_hash.metrics import NULL
 
 
-def process(filename, store, config={}):
-    data = {}
-    data.update(fingerprint.fingerprint(filename))
-    data.update(metadata.extract_metadata(filename))
-    store(filename, data, config)
+# One cache connection per worker process, keyed by database path.
+_caches = {}
+
+# Member digests seen by this worker process.
+_member_cache = None
+
+
+def get_cache(config):
+    """
+    Return the cache configured with ``cache=/path/to/db``, if any.
+    """
+    path = config.get('cache')
+    if not path:
+        return None
+    if path not in _caches:
+        _caches[path] = FingerprintCache(path)
+    return _caches[path]
+
+
+def get_member_cache(config):
+    """
+    Return the worker's member cache if ``member_cache=<entries>`` is set.
+    """
+    global _member_cache
+    if not config.get('member_cache'):
+        return None
+    if _member_cache is None:
+        _member_cache = MemberCache(int(config['member_cache']))
+    return _member_cache
+
+
+def get_scopes(config):
+    """
+    Return the member scopes set with ``scope.<format>=<scope>``, eg.
+    ``scope.jar=include=*.class,*.so;max_size=64M``.
+    """
+    return dict(
+        (key[len('scope.'):], Scope.parse(value))
+        for (key, value) in config.iteritems() if key.startswith('scope.'))
+
+
+def process(filename, store, config={}, metrics=None):
+    """
+    Analyze a file as configured, store the result unless `store` is None
+    and return it.
+
+    :Parameters:
+       - `filename`: Path of the file.
+       - `store`: Callable that will store results (filename, data,
+         config), or None.
+       - `config`: Configuration dict.
+       - `metrics`: Optional ``Metrics`` recording the stages.
+    """
+    stages = metrics if metrics is not None else NULL
+    with stages.stage('analyze'):
+        data = analyze(
+            filename, cache=get_cache(config),
+            member_cache=get_member_cache(config),
+            depth=int(config.get('depth', 0)),
+            hash_workers=int(config.get('hash_workers', 1)),
+            scopes=get_scopes(config),
+            sidecar=config.get('sidecar') or None,
+            normalize=config.get('normalize', '').lower() in (
+                '1', 'true', 'yes'),
+            sketch=config.get('sketch', '').lower() in ('1', 'true', 'yes'),
+            trust_record=config.get('trust_record', '').lower() in (
+                '1', 'true', 'yes'),
+            metrics=metrics)
+    if store is not None:
+        with stages.stage('store'):
+            store(filename, data, config)
+    return data
@@ -0,0 +1,362 @@
+"""
+Batched result sinks.
+
+A sink keeps one connection open for the life of a process and buffers
+results, writing them in bulk once ``batch_size`` results are waiting or
+the oldest has waited ``batch_delay`` seconds. A batch only leaves the
+buffer once written: a failed write is retried ``batch_delay`` seconds
+later, or by the next flush (at-least-once delivery). Listeners learn
+which results were written and which writes failed, so a result is only
+reported stored once it is. Every result is written as an upsert keyed by
+the artifact hash, which makes replaying a batch harmless.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def result_key(filename, data):
+    """
+    Key a result is stored under: the combined hash of the artifact, or
+    its path when only metadata was extracted.
+
+    :Parameters:
+       - `filename`: Path of the artifact.
+       - `data`: Result of ``analyze``.
+    """
+    if data.get("hash"):
+        return data["hash"]
+    for algorithm in sorted(data.get("hashes", {})):
+        combined = data["hashes"][algorithm].get("combined")
+        if combined:
+            return combined
+    return filename
+
+
+class Sink(object):
+    """
+    Buffers results and writes them in batches. Subclasses implement
+    ``connect``, ``write`` and ``disconnect``.
+    """
+
+    def __init__(self, batch_size=100, batch_delay=5.0):
+        """
+        Creates a sink. The connection is opened on the first write.
+
+        :Parameters:
+           - `batch_size`: Results buffered before they are written.
+           - `batch_delay`: Longest time, in seconds, a result is buffered.
+        """
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.buffer = []
+        self.oldest = None
+        self.connected = False
+        self.closed = False
+        self.lock = threading.RLock()
+        self.timer = None
+        self.listeners = []
+        # Exception of the last write if it failed.
+        self.error = None
+        self.counters = {"written": 0, "batches": 0, "failures": 0}
+
+    def add_listener(self, listener):
+        """
+        Call ``listener(filenames, error)`` after every write with the
+        filenames of the results in the batch, and None once they are
+        stored or the exception that kept them buffered. It is called
+        with the sink locked and must not wait for other threads using it.
+
+        :Parameters:
+           - `listener`: Callable taking a list of filenames and an error.
+        """
+        self.listeners.append(listener)
+
+    def put(self, filename, data):
+        """
+        Queue a result, writing the buffer if it is due. The result is not
+        stored before a write of it succeeded (see `add_listener`). Raises
+        the error of a write done here; the results stay buffered.
+
+        :Parameters:
+           - `filename`: Path of the artifact.
+           - `data`: Result of ``analyze``.
+        """
+        with self.lock:
+            self.buffer.append((result_key(filename, data), filename, data))
+            if self.oldest is None:
+                self.oldest = time.time()
+            if len(self.buffer) >= self.batch_size or \
+                    time.time() - self.oldest >= self.batch_delay:
+                self.flush()
+            else:
+                self._schedule()
+
+    def _schedule(self):
+        """
+        Write the buffer in `batch_delay` seconds unless already planned,
+        so results arriving slowly and failed writes are not left behind.
+        """
+        if self.timer is None and self.buffer and not self.closed:
+            self.timer = threading.Timer(self.batch_delay, self._expire)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def _expire(self):
+        with self.lock:
+            self.timer = None
+            try:
+                self.flush()
+            except Exception:
+                # Still buffered and planned again, the error is in
+                # `error` and was passed to the listeners.
+                pass
+
+    def flush(self):
+        """
+        Write everything buffered. On failure the results stay buffered,
+        another write is planned and the error is raised.
+        """
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if not self.buffer:
+                return
+            batch = list(self.buffer)
+            filenames = [filename for (_, filename, _) in batch]
+            try:
+                if not self.connected:
+                    self.connect()
+                    self.connected = True
+                self.write(batch)
+            except Exception, ex:
+                self.counters["failures"] += 1
+                self.error = ex
+                self._reset()
+                self._schedule()
+                self._notify(filenames, ex)
+                raise
+            del self.buffer[:len(batch)]
+            self.oldest = time.time() if self.buffer else None
+            self.error = None
+            self.counters["written"] += len(batch)
+            self.counters["batches"] += 1
+            self._notify(filenames, None)
+
+    def _notify(self, filenames, error):
+        for listener in self.listeners:
+            listener(filenames, error)
+
+    def _reset(self):
+        """
+        Drop a connection that failed so the next flush reconnects.
+        """
+        if self.connected:
+            self.connected = False
+            try:
+                self.disconnect()
+            except Exception:
+                pass
+
+    def close(self):
+        """
+        Write what is left and close the connection. Raises the error if
+        that write failed, the results left are lost.
+        """
+        with self.lock:
+            self.closed = True
+            try:
+                self.flush()
+            finally:
+                self._reset()
+
+    def connect(self):
+        pass
+
+    def write(self, batch):
+        """
+        Upsert a list of (key, filename, data) tuples.
+        """
+        raise NotImplementedError("Sinks must implement write")
+
+    def disconnect(self):
+        pass
+
+
+class MongoSink(Sink):
+    """
+    Upserts results into a mongodb collection, ``_id`` being the key.
+
+    Config expected to be like so::
+
+       host=127.0.0.1
+       port=1234
+       database=mydb
+       collection=data
+    """
+
+    def __init__(self, config, collection=None, **kwargs):
+        """
+        :Parameters:
+           - `config`: Configuration dict.
+           - `collection`: Collection to use instead of connecting, eg. a
+             fake one.
+        """
+        Sink.__init__(self, **kwargs)
+        self.config = config
+        self.client = None
+        self.collection = collection
+
+    def connect(self):
+        if self.collection is not None:
+            return
+        try:
+            from pymongo import MongoClient
+        except ImportError:
+            from pymongo import Connection as MongoClient
+
+        self.client = MongoClient(
+            self.config['host'], int(self.config['port']))
+        db = self.client[self.config['database']]
+        self.collection = db[self.config['collection']]
+
+    def write(self, batch):
+        documents = []
+        for (key, filename, data) in batch:
+            document = dict(data)
+            document["_id"] = key
+            documents.append(document)
+
+        if hasattr(self.collection, "bulk_write"):
+            from pymongo import ReplaceOne
+            self.collection.bulk_write(
+                [ReplaceOne({"_id": document["_id"]}, document, upsert=True)
+                 for document in documents], ordered=False)
+        else:
+            # pymongo 2 has no bulk upserts, the connection is still reused.
+            for document in documents:
+                self.collection.update(
+                    {"_id": document["_id"]}, document, upsert=True)
+
+    def disconnect(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+            self.collection = None
+
+
+class SQLiteSink(Sink):
+    """
+    Upserts results into a local SQLite database configured with
+    ``sqlite=/path/to/results.db``.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS results (
+            key TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            result TEXT NOT NULL,
+            stored REAL NOT NULL
+        )
+    """
+
+    def __init__(self, config, **kwargs):
+        Sink.__init__(self, **kwargs)
+        self.path = config['sqlite']
+        self.db = None
+
+    def connect(self):
+        self.db = sqlite3.connect(self.path, timeout=60)
+        self.db.execute(self.SCHEMA)
+        self.db.commit()
+
+    def write(self, batch):
+        now = time.time()
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                [(key, filename, json.dumps(data), now)
+                 for (key, filename, data) in batch])
+
+    def disconnect(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+
+class JSONLinesSink(Sink):
+    """
+    Appends results to the file configured with ``jsonlines=/path``, one
+    JSON document holding ``key``, ``filename`` and ``result`` per line.
+    The file is append only: a key written twice is replaced by its last
+    line when read back with `read_jsonlines`.
+    """
+
+    def __init__(self, config, **kwargs):
+        Sink.__init__(self, **kwargs)
+        self.path = config['jsonlines']
+        self.output = None
+
+    def connect(self):
+        self.output = open(self.path, "a")
+
+    def write(self, batch):
+        self.output.write("".join(
+            json.dumps({"key": key, "filename": filename, "result": data}) +
+            "\n" for (key, filename, data) in batch))
+        self.output.flush()
+        os.fsync(self.output.fileno())
+
+    def disconnect(self):
+        if self.output is not None:
+            self.output.close()
+            self.output = None
+
+
+def read_jsonlines(path):
+    """
+    Return a dict of key to the last document written for it by a
+    `JSONLinesSink`. A partial last line, left by a crash, is ignored.
+    """
+    documents = {}
+    with open(path) as io:
+        for line in io:
+            try:
+                document = json.loads(line)
+            except ValueError:
+                continue
+            documents[document["key"]] = document
+    return documents
+
+
+class MemorySink(Sink):
+    """
+    Keeps results in a dict, for tests and offline runs. Set `failures`
+    to make that many writes fail.
+    """
+
+    def __init__(self, config=None, **kwargs):
+        Sink.__init__(self, **kwargs)
+        self.documents = {}
+        self.batches = []
+        self.failures = 0
+
+    def write(self, batch):
+        if self.failures > 0:
+            self.failures -= 1
+            raise IOError("Simulated write failure")
+        self.batches.append(len(batch))
+        for (key, filename, data) in batch:
+            self.documents[key] = (filename, data)
+
+
+SINKS = {
+    'mongo': MongoSink,
+    'sqlite': SQLiteSink,
+    'jsonlines': JSONLinesSink,
+    'memory': MemorySink,
+}
@@ -1,3 +1,51 @@
+from multiprocessing.util import Finalize
+
+from victims_hash.autoprocess.sinks import SINKS
+
+
+# One sink per store and configuration in each worker process.
+_sinks = {}
+
+
+def create_sink(name, config):
+    """
+    Return a new sink for a store. Besides the store specific settings
+    the config may hold ``batch_size`` and ``batch_delay`` (seconds).
+
+    :Parameters:
+       - `name`: Name of the sink (see ``sinks.SINKS``).
+       - `config`: Configuration dict.
+    """
+    return SINKS[name](
+        config, batch_size=int(config.get('batch_size', 100)),
+        batch_delay=float(config.get('batch_delay', 5.0)))
+
+
+def get_sink(name, config):
+    """
+    Return the worker's sink for a store, creating it on first use. The
+    connection is kept for the life of the worker and closed when it
+    exits.
+
+    :Parameters:
+       - `name`: Name of the sink (see ``sinks.SINKS``).
+       - `config`: Configuration dict.
+    """
+    key = (name, tuple(sorted(config.items())))
+    if key not in _sinks:
+        sink = create_sink(name, config)
+        Finalize(sink, sink.close, exitpriority=10)
+        _sinks[key] = sink
+    return _sinks[key]
+
+
+def close():
+    """
+    Flush and close the sinks of this process.
+    """
+    while _sinks:
+        _sinks.popitem()[1].close()
+
 
 def echo(filename, data, config):
     """
@@ -6,6 +54,18 @@ def echo(filename, data, config):
     print filename, data
 
 
+def _write(name, filename, data, config):
+    """
+    Write a result through the worker's sink at once, raising if that
+    failed, so a file is not reported processed before its result is
+    stored. The daemon batches across workers with a ``Pipeline`` sink
+    instead.
+    """
+    sink = get_sink(name, config)
+    sink.put(filename, data)
+    sink.flush()
+
+
 def mongo(filename, data, config):
     """
     Saves back to mongodb.
@@ -17,8 +77,25 @@ def mongo(filename, data, config):
        database=mydb
        collection=data
     """
-    from pymongo import Connection
+    _write('mongo', filename, data, config)
+
+
+def sqlite(filename, data, config):
+    """
+    Saves to the SQLite database configured with ``sqlite=/path``.
+    """
+    _write('sqlite', filename, data, config)
+
+
+def jsonlines(filename, data, config):
+    """
+    Appends to the JSON Lines file configured with ``jsonlines=/path``.
+    """
+    _write('jsonlines', filename, data, config)
+
 
-    connection = Connection(config['host'], config['port'])
-    db = getattr(connection, config['database'])
-    db[config['collection']].insert(data)
+def memory(filename, data, config):
+    """
+    Keeps results in the worker's memory, for offline testing.
+    """
+    _write('memory', filename, data, config)
@@ -0,0 +1,334 @@
+"""
+Fingerprint many artifacts in parallel and stream the results as JSON Lines.
+"""
+
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import traceback
+
+from victims_hash.analyze import analyze
+from victims_hash.archive.reader.registry import extensions, formats
+from victims_hash.archive.reader.scope import parse_scopes
+from victims_hash.archive.memo import MemberCache
+from victims_hash.cache import FingerprintCache
+
+
+# Per worker process state, set up by `init_worker`.
+_options = {}
+
+
+def init_worker(options):
+    """
+    Prepare a worker process: open its caches once for all its files.
+
+    :Parameters:
+       - `options`: Dict with ``algorithms``, ``cache``, ``member_cache``,
+         ``depth``, ``nested_workers``, ``hash_workers``, ``normalize``,
+         ``sketch``, ``members``, ``scopes``, ``sidecar`` and
+         ``trust_record``.
+    """
+    _options.clear()
+    _options['algorithms'] = options['algorithms']
+    _options['depth'] = options.get('depth', 0)
+    _options['workers'] = options.get('nested_workers', 1)
+    _options['hash_workers'] = options.get('hash_workers', 1)
+    _options['normalize'] = options.get('normalize', False)
+    _options['sketch'] = options.get('sketch', False)
+    _options['members'] = options.get('members', False)
+    _options['scopes'] = options.get('scopes')
+    _options['sidecar'] = options.get('sidecar')
+    _options['trust_record'] = options.get('trust_record', False)
+    _options['cache'] = None
+    _options['member_cache'] = None
+    if options.get('cache'):
+        _options['cache'] = FingerprintCache(options['cache'])
+    if options.get('member_cache'):
+        _options['member_cache'] = MemberCache(options['member_cache'])
+
+
+def process(filename, previous=None):
+    """
+    Analyze a single file, turning any failure into an error record so
+    one bad file does not stop the batch.
+
+    :Parameters:
+       - `filename`: Path of the artifact.
+       - `previous`: Optional earlier result for the file, see
+         ``analyze``.
+    """
+    try:
+        result = analyze(
+            filename, algorithms=_options.get('algorithms', ["sha512", "sha1"]),
+            cache=_options.get('cache'),
+            member_cache=_options.get('member_cache'),
+            depth=_options.get('depth', 0),
+            workers=_options.get('workers', 1),
+            hash_workers=_options.get('hash_workers', 1),
+            normalize=_options.get('normalize', False),
+            sketch=_options.get('sketch', False),
+            members=_options.get('members', False),
+            scopes=_options.get('scopes'),
+            sidecar=_options.get('sidecar'),
+            trust_record=_options.get('trust_record', False),
+            previous=previous)
+        result['filename'] = filename
+        return result
+    except Exception, ex:
+        return {
+            'filename': filename,
+            'error': "%s: %s" % (type(ex).__name__, ex),
+            'traceback': traceback.format_exc(),
+        }
+
+
+def process_job(job):
+    """
+    Analyze a (filename, previous result) pair. Returns the result with
+    the worker's process id and the counters of its member cache, None
+    without one.
+    """
+    result = process(*job)
+    member_cache = _options.get('member_cache')
+    return (result, os.getpid(),
+            member_cache.stats() if member_cache is not None else None)
+
+
+def combine(stats):
+    """
+    Return the sum of the member cache counters of several workers.
+
+    :Parameters:
+       - `stats`: Iterable of ``MemberCache.stats`` dicts.
+    """
+    total = {"hits": 0, "misses": 0, "rejected": 0, "entries": 0}
+    for worker in stats:
+        for name in total:
+            total[name] += worker[name]
+    lookups = total["hits"] + total["misses"]
+    total["hit_rate"] = float(total["hits"]) / lookups if lookups else 0.0
+    return total
+
+
+def readprevious(io):
+    """
+    Return a dict of filename to result from earlier JSON Lines output,
+    skipping failures.
+    """
+    previous = {}
+    for line in io:
+        result = json.loads(line)
+        if 'error' not in result:
+            previous[result['filename']] = result
+    return previous
+
+
+def supported(filename):
+    """
+    Whether a file found while walking a directory should be processed.
+    """
+    return filename.lower().endswith(extensions())
+
+
+def expand(paths):
+    """
+    Yield the files named by the given paths. Directories are walked
+    recursively for supported artifacts, globs are expanded and anything
+    else is passed through as is.
+
+    :Parameters:
+       - `paths`: Iterable of files, directories or glob patterns.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for (dirpath, dirnames, filenames) in os.walk(path):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    if supported(filename):
+                        yield os.path.join(dirpath, filename)
+        elif glob.has_magic(path):
+            for match in expand(sorted(glob.iglob(path))):
+                yield match
+        else:
+            yield path
+
+
+def readlist(io, separator="\n"):
+    """
+    Yield the paths of a newline or NUL separated list.
+
+    :Parameters:
+       - `io`: File-like object holding the list.
+       - `separator`: Separator between paths.
+    """
+    pending = ""
+    for buff in iter(lambda: io.read(64 * 1024), ""):
+        pending += buff
+        parts = pending.split(separator)
+        pending = parts.pop()
+        for part in parts:
+            if part.strip():
+                yield part.rstrip("\r") if separator == "\n" else part
+    if pending.strip():
+        yield pending
+
+
+def run(filenames, output, workers=None, chunksize=16, ordered=False,
+        options={}, previous={}):
+    """
+    Analyze the given files over a process pool and write one JSON
+    document per file as soon as it is done.
+
+    Returns a tuple of the processed and failed counts and the combined
+    member cache counters of the workers, None without a member cache.
+
+    :Parameters:
+       - `filenames`: Iterable of paths.
+       - `output`: File-like object to write JSON Lines to.
+       - `workers`: Number of worker processes, defaults to the CPU count.
+       - `chunksize`: Number of files handed to a worker at a time.
+       - `ordered`: Emit results in input order instead of completion order.
+       - `options`: Options passed to `init_worker`.
+       - `previous`: Dict of filename to earlier result, which unchanged
+         members are reused from.
+    """
+    pool = multiprocessing.Pool(workers, init_worker, (options,))
+    processed = failed = 0
+    # The counters of a worker only grow, its latest ones are kept.
+    caches = {}
+    try:
+        mapper = pool.imap if ordered else pool.imap_unordered
+        jobs = ((filename, previous.get(filename)) for filename in filenames)
+        for (result, pid, cache) in mapper(process_job, jobs, chunksize):
+            if cache is not None:
+                caches[pid] = cache
+            processed += 1
+            if 'error' in result:
+                failed += 1
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return (processed, failed, combine(caches.values()) if caches else None)
+
+
+def main(argv=None):
+    """
+    Entry point of ``victims_hash batch``.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="victims_hash batch")
+    parser.add_argument(
+        'paths', nargs='*',
+        help='Files, directories or globs. "-" reads a list from stdin.')
+    parser.add_argument(
+        '-0', '--null', action='store_true',
+        help='Paths read from stdin are NUL separated.')
+    parser.add_argument(
+        '-w', '--workers', default=multiprocessing.cpu_count(), type=int)
+    parser.add_argument('--chunksize', default=16, type=int)
+    parser.add_argument(
+        '--ordered', action='store_true',
+        help='Emit results in input order.')
+    parser.add_argument('-o', '--output', default=None, type=str)
+    parser.add_argument(
+        '-a', '--algorithms', default='sha512,sha1', type=str)
+    parser.add_argument('--cache', default=None, type=str)
+    parser.add_argument('--member-cache', default=0, type=int)
+    parser.add_argument(
+        '--depth', default=0, type=int,
+        help='Levels of nested archives to descend into.')
+    parser.add_argument(
+        '--nested-workers', default=1, type=int,
+        help='Threads analyzing nested archives of one file.')
+    parser.add_argument(
+        '--hash-workers', default=1, type=int,
+        help='Threads inflating and hashing the members of one archive.')
+    parser.add_argument(
+        '--normalize', action='store_true',
+        help='Hash class files in their compiler independent normal form.')
+    parser.add_argument(
+        '--sketch', action='store_true',
+        help='Add a MinHash sketch for similarity searches.')
+    parser.add_argument(
+        '--members', action='store_true',
+        help='Record member keys so later runs can be incremental.')
+    parser.add_argument(
+        '--previous', default=None, type=str,
+        help='Earlier output to reuse unchanged member digests from.')
+    parser.add_argument(
+        '--scope', action='append', default=[],
+        help='Members to fingerprint for a format, eg. '
+             '"jar:include=*.class,*.so;exclude=*/test/*;max_size=64M". '
+             'Formats: %s.' % ', '.join(formats()))
+
+    parser.add_argument(
+        '--sidecar', default=None, choices=['trust', 'verify'],
+        help='Use the .sha1/.sha512/.md5 files next to the artifacts: '
+             'trust them instead of hashing the whole file, or verify '
+             'them in the same read as the members.')
+    parser.add_argument(
+        '--trust-record', action='store_true',
+        help='Use the member digests listed in the RECORD of wheels '
+             'instead of hashing those members. Only for wheels from a '
+             'trusted source, the digests are not verified.')
+
+    args = parser.parse_args(argv)
+    try:
+        scopes = parse_scopes(args.scope)
+    except ValueError, ex:
+        parser.error(str(ex))
+    unknown = set(scopes) - set(formats())
+    if unknown:
+        parser.error("Unknown format %s" % ", ".join(sorted(unknown)))
+
+    def inputs():
+        for path in args.paths or ['-']:
+            if path == '-':
+                for name in readlist(sys.stdin, "\0" if args.null else "\n"):
+                    yield name
+            else:
+                yield path
+
+    options = {
+        'algorithms': args.algorithms.split(','),
+        'cache': args.cache,
+        'member_cache': args.member_cache,
+        'depth': args.depth,
+        'nested_workers': args.nested_workers,
+        'hash_workers': args.hash_workers,
+        'normalize': args.normalize,
+        'sketch': args.sketch,
+        'members': args.members,
+        'scopes': scopes,
+        'sidecar': args.sidecar,
+        'trust_record': args.trust_record,
+    }
+    previous = {}
+    if args.previous:
+        with open(args.previous) as io:
+            previous = readprevious(io)
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        processed, failed, member_cache = run(
+            expand(inputs()), output, args.workers, args.chunksize,
+            args.ordered, options, previous)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    sys.stderr.write("Processed %i files, %i failed\n" % (processed, failed))
+    if member_cache is not None:
+        sys.stderr.write(
+            "Member cache: %i hits, %i misses (%.1f%% hit rate), "
+            "%i rejected\n" % (
+                member_cache["hits"], member_cache["misses"],
+                member_cache["hit_rate"] * 100, member_cache["rejected"]))
+    return 1 if failed else 0
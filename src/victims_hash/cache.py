@@ -0,0 +1,204 @@
+"""
+Persistent, content addressed cache of analysis results.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from victims_hash.archive.reader.normalize import NORMALIZE_VERSION
+
+
+# Bump whenever the layout of the cache or the rules used to produce
+# fingerprints change. Caches written with another version are dropped.
+# 2: member scopes, header-less class keys, gem and sdist readers.
+SCHEMA_VERSION = 2
+
+# What a cache must have been written with to be used, the normal form of
+# class files has a version of its own.
+SCHEMA = "%i.%i" % (SCHEMA_VERSION, NORMALIZE_VERSION)
+
+
+class FingerprintCache(object):
+    """
+    SQLite backed cache of analysis results keyed by the sha512 digest of
+    the outer file. A table of (path, size, mtime) lets a file that was
+    already seen skip even the outer hash; the digest of a new file is
+    taken from its analysis (see `record`). Entries are evicted least
+    recently used first once the stored results exceed `max_bytes`.
+    """
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024):
+        """
+        Opens (and creates if needed) a cache.
+
+        :Parameters:
+           - `path`: Location of the SQLite database.
+           - `max_bytes`: Upper bound on the size of the stored results.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path, timeout=30)
+        self._setup()
+
+    def _setup(self):
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS meta "
+                "(key TEXT PRIMARY KEY, value TEXT)")
+            row = self.db.execute(
+                "SELECT value FROM meta WHERE key = 'schema'").fetchone()
+            if row is None or row[0] != SCHEMA:
+                self.db.execute("DROP TABLE IF EXISTS results")
+                self.db.execute("DROP TABLE IF EXISTS files")
+                self.db.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('schema', ?)",
+                    (SCHEMA,))
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS results "
+                "(digest TEXT, options TEXT, data TEXT, size INTEGER, "
+                "atime REAL, PRIMARY KEY (digest, options))")
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS results_atime ON results (atime)")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS files "
+                "(path TEXT PRIMARY KEY, size INTEGER, mtime REAL, "
+                "digest TEXT)")
+
+    def recorded(self, filename):
+        """
+        Return the sha512 digest recorded for a file whose size and
+        modification time have not changed since, or None, and the stamp
+        to `record` its digest with.
+
+        :Parameters:
+           - `filename`: Path of the file.
+        """
+        path = os.path.realpath(filename)
+        st = os.stat(path)
+        stamp = (path, st.st_size, st.st_mtime)
+        row = self.db.execute(
+            "SELECT size, mtime, digest FROM files WHERE path = ?",
+            (path,)).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime:
+            return row[2], stamp
+        return None, stamp
+
+    def record(self, stamp, digest):
+        """
+        Remember the sha512 digest of a file, eg. computed while it was
+        analyzed.
+
+        :Parameters:
+           - `stamp`: Stamp of the file returned by `recorded`, taken
+             before it was read.
+           - `digest`: sha512 digest of the file.
+        """
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                stamp + (digest,))
+
+    def digest(self, filename):
+        """
+        Return the sha512 digest of a file, reusing the recorded digest when
+        its size and modification time have not changed.
+
+        :Parameters:
+           - `filename`: Path of the file.
+        """
+        digest, stamp = self.recorded(filename)
+        if digest is not None:
+            return digest
+
+        digest = hashlib.sha512()
+        with open(stamp[0], "rb") as f:
+            for buff in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(buff)
+        digest = digest.hexdigest()
+        self.record(stamp, digest)
+        return digest
+
+    def get(self, digest, options=""):
+        """
+        Look up a stored result, or None if there is none.
+
+        :Parameters:
+           - `digest`: sha512 digest of the outer file, None for a file
+             whose digest is not known yet (a miss).
+           - `options`: String describing the options the result was
+             produced with.
+        """
+        if digest is None:
+            self.misses += 1
+            return None
+        row = self.db.execute(
+            "SELECT data FROM results WHERE digest = ? AND options = ?",
+            (digest, options)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        with self.db:
+            self.db.execute(
+                "UPDATE results SET atime = ? WHERE digest = ? AND options = ?",
+                (time.time(), digest, options))
+        return json.loads(row[0])
+
+    def put(self, digest, result, options=""):
+        """
+        Store a result and evict old entries if over the size bound.
+
+        :Parameters:
+           - `digest`: sha512 digest of the outer file.
+           - `result`: JSON serializable result.
+           - `options`: String describing the options used.
+        """
+        data = json.dumps(result)
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (digest, options, data, len(data), time.time()))
+        self.evict()
+
+    def evict(self):
+        """
+        Drop least recently used results until under `max_bytes`.
+        """
+        total, = self.db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results").fetchone()
+        if total <= self.max_bytes:
+            return
+
+        victims = []
+        for (digest, options, size) in self.db.execute(
+                "SELECT digest, options, size FROM results ORDER BY atime"):
+            if total <= self.max_bytes:
+                break
+            victims.append((digest, options))
+            total -= size
+        with self.db:
+            self.db.executemany(
+                "DELETE FROM results WHERE digest = ? AND options = ?",
+                victims)
+
+    def stats(self):
+        """
+        Return the hit/miss counters of this instance.
+        """
+        count, size = self.db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": count,
+            "bytes": size,
+        }
+
+    def close(self):
+        self.db.close()
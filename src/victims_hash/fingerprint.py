@@ -1,33 +1,15 @@
 from json import dumps
-from archive.archive import Archive
-from archive.reader.jar import JarReader
-from archive.reader.gem import GemReader
-from archive.reader.egg import EggReader
+from analyze import analyze
 
 
 def fingerprint(file, io=None):
 
-    archive_instance = None
     if not io:
-        io = open(file, "r")
+        io = open(file, "rb")
 
     try:
-        if file.endswith(".jar"):
-            archive_instance = Archive(JarReader(io)).fingerprint()
+        return dumps(analyze(io, name=file, meta=False))
 
-        elif file.endswith(".gem"):
-            archive_instance = Archive(GemReader(io)).fingerprint()
-
-        elif file.endswith(".egg"):
-            archive_instance = Archive(EggReader(io)).fingerprint()
-
-        if not archive_instance:
-            raise NotImplemtedError("No support for %s files." % file)
-        return dumps(archive_instance)
-
-    except Exception, ex:
-        # Blind raising ...
-        raise ex
     finally:
         # Always make sure the file is closed.
         if not io.closed:
@@ -0,0 +1,369 @@
+"""
+On-disk inverted index from member digests to the artifacts holding them.
+
+An index is a directory with:
+
+- ``artifacts.jsonl``: one line per indexed artifact, its line number being
+  its id.
+- ``<algorithm>-<n>.seg``: sorted postings. A 16 byte header (magic,
+  version, digest size, count) is followed by fixed size records of the raw
+  member digest and the artifact id. Segments are memory mapped and
+  binary searched.
+- ``manifest.json``: the committed segments and artifacts. It is replaced
+  atomically, so anything written after the last commit is ignored.
+
+New results are buffered and written as a new segment on `commit`;
+`compact` merges all segments into one.
+"""
+
+import binascii
+import glob
+import hashlib
+import heapq
+import json
+import mmap
+import os
+import struct
+import sys
+
+
+SEGMENT_MAGIC = b"VHIX"
+SEGMENT_VERSION = 1
+SEGMENT_HEADER = struct.Struct("<4sHHQ")
+ARTIFACT_ID = struct.Struct("<L")
+
+
+class Segment(object):
+    """
+    Read only, memory mapped segment of sorted postings.
+    """
+
+    def __init__(self, path, digest_size):
+        self.path = path
+        self.digest_size = digest_size
+        self.record_size = digest_size + ARTIFACT_ID.size
+        self.io = open(path, "rb")
+        self.data = mmap.mmap(self.io.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, size, self.count) = SEGMENT_HEADER.unpack_from(
+            self.data, 0)
+        if magic != SEGMENT_MAGIC or version != SEGMENT_VERSION or \
+                size != digest_size:
+            raise ValueError("%s is not a segment of this index" % path)
+        if len(self.data) < SEGMENT_HEADER.size + \
+                self.count * self.record_size:
+            raise ValueError("%s is truncated" % path)
+
+    def __len__(self):
+        return self.count
+
+    def digest(self, i):
+        start = SEGMENT_HEADER.size + i * self.record_size
+        return self.data[start:start + self.digest_size]
+
+    def artifact(self, i):
+        return ARTIFACT_ID.unpack_from(
+            self.data, SEGMENT_HEADER.size + i * self.record_size +
+            self.digest_size)[0]
+
+    def find(self, digest, lo=0):
+        """
+        Return the artifact ids posted for a raw `digest` and the position
+        to start the search for the next, larger, digest from.
+        """
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.digest(mid) < digest:
+                lo = mid + 1
+            else:
+                hi = mid
+        ids = []
+        while lo < self.count and self.digest(lo) == digest:
+            ids.append(self.artifact(lo))
+            lo += 1
+        return (ids, lo)
+
+    def __iter__(self):
+        for i in xrange(self.count):
+            yield (self.digest(i), self.artifact(i))
+
+    def close(self):
+        self.data.close()
+        self.io.close()
+
+
+def write_segment(path, digest_size, postings):
+    """
+    Write sorted (digest, artifact id) postings to a new segment,
+    atomically replacing `path`.
+    """
+    tmp = path + ".tmp"
+    count = 0
+    with open(tmp, "wb") as io:
+        io.write(SEGMENT_HEADER.pack(
+            SEGMENT_MAGIC, SEGMENT_VERSION, digest_size, 0))
+        previous = None
+        for posting in postings:
+            if posting == previous:
+                continue
+            io.write(posting[0] + ARTIFACT_ID.pack(posting[1]))
+            previous = posting
+            count += 1
+        io.seek(0)
+        io.write(SEGMENT_HEADER.pack(
+            SEGMENT_MAGIC, SEGMENT_VERSION, digest_size, count))
+        io.flush()
+        os.fsync(io.fileno())
+    os.rename(tmp, path)
+    return count
+
+
+class HashIndex(object):
+    """
+    Index of the member digests of one hash algorithm to the artifacts
+    holding them. Meant for a single writer; readers see what was
+    committed when they opened the index (or last called `refresh`).
+    """
+
+    def __init__(self, path, algorithm="sha512", max_pending=1000000):
+        """
+        Opens (and creates if needed) an index.
+
+        :Parameters:
+           - `path`: Directory of the index.
+           - `algorithm`: Algorithm of the member digests indexed.
+           - `max_pending`: Postings buffered before they are committed.
+        """
+        self.path = path
+        self.algorithm = algorithm
+        self.digest_size = hashlib.new(algorithm).digest_size
+        self.max_pending = max_pending
+        self.segments = []
+        self.pending = []
+        self.pending_artifacts = []
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.refresh()
+
+    def _path(self, name):
+        return os.path.join(self.path, name)
+
+    def refresh(self):
+        """
+        Load the last committed state of the index, dropping anything
+        not committed yet.
+        """
+        for segment in self.segments:
+            segment.close()
+        self.pending = []
+        self.pending_artifacts = []
+
+        manifest = {"segments": [], "artifacts": 0, "artifacts_size": 0}
+        if os.path.exists(self._path("manifest.json")):
+            with open(self._path("manifest.json")) as io:
+                manifest = json.load(io)
+        if manifest.get("algorithm", self.algorithm) != self.algorithm:
+            raise ValueError("Index %s holds %s digests" % (
+                self.path, manifest["algorithm"]))
+        self.manifest = manifest
+
+        self.segments = [
+            Segment(self._path(name), self.digest_size)
+            for name in manifest["segments"]]
+
+        self.artifacts = []
+        if manifest["artifacts"]:
+            with open(self._path("artifacts.jsonl")) as io:
+                for line in io:
+                    if len(self.artifacts) == manifest["artifacts"]:
+                        break
+                    self.artifacts.append(json.loads(line))
+        self.known = dict(
+            (artifact["hash"], i) for (i, artifact) in
+            enumerate(self.artifacts))
+
+    def add(self, result, name):
+        """
+        Queue the member digests of an ``analyze`` result, and of the
+        archives nested in it, for the next commit. Returns the id of the
+        artifact; an artifact indexed before keeps its id.
+
+        :Parameters:
+           - `result`: Result of ``analyze`` (or ``fingerprint``).
+           - `name`: Name of the artifact, usually its path.
+        """
+        hashes = result.get("hashes", {}).get(self.algorithm)
+        if hashes is None:
+            raise ValueError("%s has no %s digests" % (name, self.algorithm))
+
+        artifact_id = self.known.get(hashes["combined"])
+        if artifact_id is None:
+            artifact_id = len(self.artifacts) + len(self.pending_artifacts)
+            self.known[hashes["combined"]] = artifact_id
+            self.pending_artifacts.append(
+                {"hash": hashes["combined"], "name": name})
+            unhexlify = binascii.unhexlify
+            self.pending.extend(
+                (unhexlify(digest), artifact_id) for digest in hashes["files"])
+
+        for inner in result.get("archives", []):
+            if "hashes" in inner:
+                self.add(inner, "%s!/%s" % (name, inner["name"]))
+
+        if len(self.pending) >= self.max_pending:
+            self.commit()
+        return artifact_id
+
+    def commit(self):
+        """
+        Write the queued artifacts and postings as a new segment.
+        """
+        if not self.pending_artifacts:
+            return
+
+        # Drop artifacts appended after the last commit, then append ours.
+        with open(self._path("artifacts.jsonl"), "ab") as io:
+            io.truncate(self.manifest["artifacts_size"])
+            io.seek(0, 2)
+            for artifact in self.pending_artifacts:
+                io.write(json.dumps(artifact) + "\n")
+            io.flush()
+            os.fsync(io.fileno())
+            artifacts_size = io.tell()
+
+        segments = list(self.manifest["segments"])
+        if self.pending:
+            name = self._segment_name()
+            self.pending.sort()
+            write_segment(self._path(name), self.digest_size, self.pending)
+            segments.append(name)
+
+        self._write_manifest(
+            segments, len(self.artifacts) + len(self.pending_artifacts),
+            artifacts_size)
+        self.refresh()
+
+    def _segment_name(self):
+        numbers = [
+            int(os.path.basename(path).rsplit("-", 1)[1].split(".")[0])
+            for path in glob.glob(self._path("%s-*.seg" % self.algorithm))]
+        return "%s-%08i.seg" % (self.algorithm, max(numbers or [0]) + 1)
+
+    def _write_manifest(self, segments, artifacts, artifacts_size):
+        tmp = self._path("manifest.json.tmp")
+        with open(tmp, "w") as io:
+            json.dump({
+                "algorithm": self.algorithm,
+                "segments": segments,
+                "artifacts": artifacts,
+                "artifacts_size": artifacts_size,
+            }, io)
+            io.flush()
+            os.fsync(io.fileno())
+        os.rename(tmp, self._path("manifest.json"))
+
+    def compact(self):
+        """
+        Merge all segments into one and delete the old ones.
+        """
+        self.commit()
+        if len(self.segments) < 2:
+            return
+        name = self._segment_name()
+        write_segment(
+            self._path(name), self.digest_size,
+            heapq.merge(*self.segments))
+        old = list(self.manifest["segments"])
+        self._write_manifest(
+            [name], self.manifest["artifacts"],
+            self.manifest["artifacts_size"])
+        self.refresh()
+        for segment in old:
+            os.remove(self._path(segment))
+
+    def lookup(self, digest):
+        """
+        Return the artifacts holding a member with the given hex digest.
+        """
+        return self.lookup_many([digest]).get(digest, [])
+
+    def lookup_many(self, digests):
+        """
+        Return a dict of each hex digest found to the artifacts holding
+        it. The digests are looked up in sorted order, every search
+        starting where the previous one ended.
+
+        :Parameters:
+           - `digests`: Iterable of hex digests.
+        """
+        queries = sorted(
+            (binascii.unhexlify(digest), digest) for digest in set(digests))
+        ids = {}
+        for segment in self.segments:
+            lo = 0
+            for (raw, digest) in queries:
+                found, lo = segment.find(raw, lo)
+                if found:
+                    ids.setdefault(digest, set()).update(found)
+        return dict(
+            (digest, [self.artifacts[i] for i in sorted(found)])
+            for (digest, found) in ids.iteritems())
+
+    def stats(self):
+        return {
+            "artifacts": len(self.artifacts),
+            "segments": len(self.segments),
+            "postings": sum(len(segment) for segment in self.segments),
+            "pending": len(self.pending),
+        }
+
+    def close(self):
+        self.commit()
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+
+
+def main(argv=None):
+    """
+    Entry point of ``victims_hash index``.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="victims_hash index")
+    parser.add_argument('-a', '--algorithm', default='sha512', type=str)
+    commands = parser.add_subparsers(dest='command')
+    add = commands.add_parser(
+        'add', help='Index the JSON Lines output of victims_hash batch.')
+    add.add_argument('index')
+    add.add_argument('results', nargs='*', help='Defaults to stdin.')
+    query = commands.add_parser(
+        'query', help='Find the artifacts holding member digests.')
+    query.add_argument('index')
+    query.add_argument('digests', nargs='*', help='Defaults to stdin.')
+    compact = commands.add_parser('compact', help='Merge all segments.')
+    compact.add_argument('index')
+
+    args = parser.parse_args(argv)
+    index = HashIndex(args.index, args.algorithm)
+    try:
+        if args.command == 'add':
+            inputs = [open(path) for path in args.results] or [sys.stdin]
+            for io in inputs:
+                for line in io:
+                    result = json.loads(line)
+                    if "error" not in result:
+                        index.add(result, result.get("filename"))
+            index.commit()
+        elif args.command == 'query':
+            digests = args.digests or sys.stdin.read().split()
+            for (digest, artifacts) in sorted(
+                    index.lookup_many(digests).iteritems()):
+                sys.stdout.write(json.dumps(
+                    {"digest": digest, "artifacts": artifacts}) + "\n")
+        elif args.command == 'compact':
+            index.compact()
+        sys.stderr.write("%s\n" % json.dumps(index.stats()))
+    finally:
+        index.close()
+    return 0
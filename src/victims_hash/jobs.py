@@ -0,0 +1,286 @@
+"""
+Non-blocking fingerprinting for services running an event loop.
+
+`Fingerprinter` runs analyses on its own worker threads and hands back a
+`Job` right away. Inflating and hashing release the GIL, so the calling
+thread (eg. an event loop) stays responsive. A job can be waited on,
+given a callback, or cancelled; a running job stops before the next member
+it would hash or inner archive it would read. Uploads are fed to an `Upload` chunk by chunk as they
+arrive and moved to a temporary file once large.
+
+Callbacks run on a worker thread, event loops should hop back to their own
+thread from there (eg. with ``call_soon_threadsafe`` or
+``IOLoop.add_callback``).
+"""
+
+import Queue
+import sys
+import threading
+
+from io import BytesIO
+from tempfile import TemporaryFile
+
+from victims_hash.analyze import Cancelled, analyze
+
+
+PENDING = "pending"
+RUNNING = "running"
+FINISHED = "finished"
+CANCELLED = "cancelled"
+
+
+class Job(object):
+    """
+    Result of an analysis that may not have finished yet.
+    """
+
+    def __init__(self, function):
+        """
+        :Parameters:
+           - `function`: Callable doing the work, given the job's `check`
+             to call regularly.
+        """
+        self.function = function
+        self.state = PENDING
+        self.cancelling = False
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def cancel(self):
+        """
+        Cancel the job. A pending job never starts, a running one stops
+        before the next member. Returns False if it already finished.
+        """
+        with self._lock:
+            if self.state in (FINISHED, CANCELLED):
+                return self.state == CANCELLED
+            self.cancelling = True
+            if self.state == RUNNING:
+                return True
+            self.state = CANCELLED
+        self._finish(CANCELLED)
+        return True
+
+    def cancelled(self):
+        return self.state == CANCELLED
+
+    def done(self):
+        return self._done.is_set()
+
+    def check(self, member=None):
+        """
+        Raise `Cancelled` if the job was cancelled.
+        """
+        if self.cancelling:
+            raise Cancelled()
+
+    def result(self, timeout=None):
+        """
+        Wait for and return the result, raising what the analysis raised
+        or `Cancelled`.
+
+        :Parameters:
+           - `timeout`: Seconds to wait, forever if None.
+        """
+        if not self._done.wait(timeout):
+            raise RuntimeError("Timed out waiting for the job")
+        if self.state == CANCELLED:
+            raise Cancelled()
+        if self._exception is not None:
+            raise self._exception[0], self._exception[1], self._exception[2]
+        return self._result
+
+    def exception(self, timeout=None):
+        """
+        Wait for the job and return the exception it raised, or None.
+        """
+        try:
+            self.result(timeout)
+        except Cancelled:
+            raise
+        except Exception, ex:
+            return ex
+        return None
+
+    def add_done_callback(self, callback):
+        """
+        Call `callback` with the job once it is done (at once if it is).
+        """
+        with self._lock:
+            if not self.done():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def run(self):
+        """
+        Do the work on the current thread, unless the job was cancelled.
+        """
+        with self._lock:
+            if self.state != PENDING:
+                return
+            self.state = RUNNING
+        try:
+            self._result = self.function(self.check)
+        except Cancelled:
+            pass
+        except Exception:
+            self._exception = sys.exc_info()
+        # A job cancelled while it was finishing (eg. hashing its last
+        # member) still counts as cancelled.
+        self._finish(CANCELLED if self.cancelling else FINISHED)
+
+    def _finish(self, state):
+        with self._lock:
+            self.state = state
+            callbacks, self._callbacks = self._callbacks, []
+            self._done.set()
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                pass
+
+
+class Fingerprinter(object):
+    """
+    Runs analyses on a fixed number of worker threads.
+    """
+
+    def __init__(self, workers=2, max_queued=100,
+                 spool_size=8 * 1024 * 1024, **options):
+        """
+        Creates the worker threads.
+
+        :Parameters:
+           - `workers`: Analyses running at the same time.
+           - `max_queued`: Jobs waiting for a worker before `submit`
+             refuses more. 0 means no limit.
+           - `spool_size`: Bytes of an upload kept in memory before it is
+             spooled to a temporary file.
+           - `options`: Default options for ``analyze``.
+        """
+        self.spool_size = spool_size
+        self.options = options
+        self.queue = Queue.Queue(max_queued)
+        self.threads = []
+        for _ in xrange(workers):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            job.run()
+
+    def submit(self, source, name=None, block=False, **options):
+        """
+        Queue the analysis of a path or file-like object and return its
+        `Job`. Raises ``Queue.Full`` when `max_queued` jobs are waiting
+        unless `block` is set.
+
+        :Parameters:
+           - `source`: Path of the artifact or a seekable file-like object.
+           - `name`: Name used to pick the reader.
+           - `block`: Wait for room in the queue instead of raising.
+           - `options`: Options for ``analyze``, added to the defaults.
+        """
+        merged = dict(self.options)
+        merged.update(options)
+        job = Job(lambda check: analyze(
+            source, name, progress=check, **merged))
+        self.queue.put(job, block)
+        return job
+
+    def fingerprint(self, source, name=None, **options):
+        """
+        Like `submit`, for the fingerprint alone.
+        """
+        options.setdefault("meta", False)
+        return self.submit(source, name, **options)
+
+    def upload(self, name):
+        """
+        Return an `Upload` to feed the content of an artifact to.
+
+        :Parameters:
+           - `name`: Name of the artifact, used to pick the reader.
+        """
+        return Upload(self, name)
+
+    def close(self, wait=True):
+        """
+        Stop the workers once the queued jobs are done.
+        """
+        for _ in self.threads:
+            self.queue.put(None)
+        if wait:
+            for thread in self.threads:
+                thread.join()
+
+
+class Upload(object):
+    """
+    An artifact received in chunks, eg. a request body. Kept in memory up
+    to the fingerprinter's `spool_size`, then moved to a temporary file.
+
+    ``SpooledTemporaryFile`` is not used: the zip index asks for the
+    ``fileno`` of what it reads to map it, which makes such a file roll over
+    to disk however small it is. An upload in memory is analyzed from a
+    ``BytesIO`` instead, which the index reads without mapping.
+    """
+
+    def __init__(self, fingerprinter, name):
+        self.fingerprinter = fingerprinter
+        self.name = name
+        self.io = BytesIO()
+        self.size = 0
+
+    @property
+    def spooled(self):
+        """
+        Whether the upload was moved to a temporary file.
+        """
+        return not isinstance(self.io, BytesIO)
+
+    def feed(self, chunk):
+        """
+        Append a chunk of the artifact.
+        """
+        self.io.write(chunk)
+        self.size += len(chunk)
+        if not self.spooled and self.size > self.fingerprinter.spool_size:
+            spool = TemporaryFile()
+            spool.write(self.io.getvalue())
+            self.io.close()
+            self.io = spool
+
+    def finish(self, **options):
+        """
+        Submit the complete upload and return its `Job`. The spooled data
+        is released once the job is done.
+
+        :Parameters:
+           - `options`: Options for ``analyze``.
+        """
+        self.io.seek(0)
+        try:
+            job = self.fingerprinter.submit(self.io, self.name, **options)
+        except Exception:
+            self.abort()
+            raise
+        job.add_done_callback(lambda job: self.io.close())
+        return job
+
+    def abort(self):
+        """
+        Drop the upload, eg. when the client went away.
+        """
+        self.io.close()
@@ -0,0 +1,276 @@
+"""
+Opt-in instrumentation of the fingerprinting pipeline.
+
+A `Metrics` instance handed to ``analyze`` (or ``Archive``) records the
+wall and CPU time spent in every stage, the bytes read and inflated, and
+counters such as members hashed and cache hits:
+
+    metrics = Metrics()
+    analyze('file.jar', metrics=metrics)
+    metrics.snapshot()
+    print metrics.prometheus()
+
+Without one the pipeline uses `NULL`, whose methods do nothing, so
+disabled instrumentation costs a method call per stage and per member.
+
+Hooks added with `Metrics.add_hook` see every observation as it is made,
+eg. to forward them to statsd.
+
+Stages:
+
+    index        parsing the container index (central directory, tar)
+    metadata     extracting the metadata
+    filehash     hashing the whole artifact
+    fingerprint  hashing the members (includes inflate and hash)
+    inflate      reading the content of the members (wall time only)
+    hash         feeding the content to the digests (wall time only)
+    analyze      a whole artifact in the autoprocess daemon
+    store        storing its result
+
+CPU time is that of the whole process, so it includes other threads
+working at the same time. The wall time of every stage is also counted in
+the histogram buckets of `BUCKETS`, so a single slow artifact can be told
+from a generally slow stage.
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+
+
+# Upper bounds in seconds of the wall time histogram buckets, the last
+# (+Inf) bucket is implied.
+BUCKETS = (0.001, 0.01, 0.1, 1.0, 10.0, 60.0, 600.0)
+
+
+def _cpu():
+    times = os.times()
+    return times[0] + times[1]
+
+
+class _Stage(object):
+    """
+    Context manager timing one stage of a `Metrics`.
+    """
+
+    __slots__ = ("metrics", "name", "wall", "cpu")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.wall = time.time()
+        self.cpu = _cpu()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.time(
+            self.name, time.time() - self.wall, _cpu() - self.cpu)
+        return False
+
+
+class Metrics(object):
+    """
+    Accumulates stage timings and counters. Safe to share between threads.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hooks = []
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            # name -> [calls, wall seconds, cpu seconds, bucket counts]
+            self.stages = {}
+            self.counters = {}
+
+    def add_hook(self, hook):
+        """
+        Call `hook` with every observation: ``hook("stage", name, (wall,
+        cpu))`` when a stage ends and ``hook("count", name, value)`` when a
+        counter is increased. cpu is None for stages timed by wall clock
+        only. Exceptions raised by hooks propagate.
+
+        :Parameters:
+           - `hook`: Callable taking kind, name and value.
+        """
+        self.hooks.append(hook)
+
+    def stage(self, name):
+        """
+        Return a context manager adding the time spent in it to stage
+        `name`.
+        """
+        return _Stage(self, name)
+
+    def time(self, name, wall, cpu=None):
+        """
+        Add time spent in stage `name`.
+
+        :Parameters:
+           - `name`: Name of the stage.
+           - `wall`: Elapsed seconds.
+           - `cpu`: CPU seconds, None if not measured.
+        """
+        with self.lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = self._new_stage()
+            stage[0] += 1
+            stage[1] += wall
+            if cpu is not None:
+                stage[2] = (stage[2] or 0.0) + cpu
+            stage[3][bisect.bisect_left(BUCKETS, wall)] += 1
+        for hook in self.hooks:
+            hook("stage", name, (wall, cpu))
+
+    @staticmethod
+    def _new_stage():
+        return [0, 0.0, None, [0] * (len(BUCKETS) + 1)]
+
+    def count(self, name, value=1):
+        """
+        Increase counter `name` by `value`.
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        for hook in self.hooks:
+            hook("count", name, value)
+
+    def snapshot(self):
+        """
+        Return the current values as a JSON serializable dict:
+        ``{"stages": {name: {"calls", "wall", "cpu", "buckets"}},
+        "counters": {}}``. buckets holds the number of calls per bucket of
+        `BUCKETS`, not cumulated, and one more for longer calls.
+        """
+        with self.lock:
+            return {
+                "stages": dict(
+                    (name, {"calls": calls, "wall": wall, "cpu": cpu,
+                            "buckets": list(buckets)})
+                    for (name, (calls, wall, cpu, buckets))
+                    in self.stages.iteritems()),
+                "counters": dict(self.counters),
+            }
+
+    def merge(self, snapshot):
+        """
+        Add the values of a `snapshot`, eg. one taken in a worker process.
+        Hooks are not called.
+        """
+        with self.lock:
+            for (name, values) in snapshot.get("stages", {}).iteritems():
+                stage = self.stages.get(name)
+                if stage is None:
+                    stage = self.stages[name] = self._new_stage()
+                stage[0] += values["calls"]
+                stage[1] += values["wall"]
+                if values["cpu"] is not None:
+                    stage[2] = (stage[2] or 0.0) + values["cpu"]
+                for (i, calls) in enumerate(values["buckets"]):
+                    stage[3][i] += calls
+            for (name, value) in snapshot.get("counters", {}).iteritems():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def json(self, counters=None, gauges=None):
+        """
+        Return the snapshot as JSON, see `prometheus` for the parameters.
+        """
+        snapshot = self.snapshot()
+        snapshot["counters"].update(counters or {})
+        snapshot["gauges"] = dict(gauges or {})
+        return json.dumps(snapshot, sort_keys=True)
+
+    def prometheus(self, counters=None, gauges=None, prefix="victims_hash"):
+        """
+        Return the values in the Prometheus text exposition format.
+
+        :Parameters:
+           - `counters`: Optional {name: value} of counters kept elsewhere,
+             eg. by the autoprocess pipeline.
+           - `gauges`: Optional {name: value} of point in time values, eg.
+             queue depths.
+           - `prefix`: Prefix of the metric names.
+        """
+        snapshot = self.snapshot()
+        snapshot["counters"].update(counters or {})
+        stages = sorted(snapshot["stages"].iteritems())
+        lines = [
+            "# HELP %s_stage_calls_total Times a stage ran." % prefix,
+            "# TYPE %s_stage_calls_total counter" % prefix,
+        ]
+        for (name, values) in stages:
+            lines.append('%s_stage_calls_total{stage="%s"} %d' % (
+                prefix, name, values["calls"]))
+        lines.extend([
+            "# HELP %s_stage_seconds_total Time spent in a stage." % prefix,
+            "# TYPE %s_stage_seconds_total counter" % prefix,
+        ])
+        for (name, values) in stages:
+            for clock in ("wall", "cpu"):
+                if values[clock] is not None:
+                    lines.append(
+                        '%s_stage_seconds_total{stage="%s",clock="%s"} %r' % (
+                            prefix, name, clock, values[clock]))
+        lines.extend([
+            "# HELP %s_stage_duration_seconds Wall time of a stage." % prefix,
+            "# TYPE %s_stage_duration_seconds histogram" % prefix,
+        ])
+        for (name, values) in stages:
+            total = 0
+            for (bound, calls) in zip(BUCKETS + ("+Inf",), values["buckets"]):
+                total += calls
+                lines.append(
+                    '%s_stage_duration_seconds_bucket{stage="%s",le="%s"} %d'
+                    % (prefix, name, bound, total))
+            lines.append('%s_stage_duration_seconds_sum{stage="%s"} %r' % (
+                prefix, name, values["wall"]))
+            lines.append('%s_stage_duration_seconds_count{stage="%s"} %d' % (
+                prefix, name, values["calls"]))
+        for (name, value) in sorted(snapshot["counters"].iteritems()):
+            lines.append("# TYPE %s_%s_total counter" % (prefix, name))
+            lines.append("%s_%s_total %d" % (prefix, name, value))
+        for (name, value) in sorted((gauges or {}).iteritems()):
+            lines.append("# TYPE %s_%s gauge" % (prefix, name))
+            lines.append("%s_%s %r" % (prefix, name, value))
+        return "\n".join(lines) + "\n"
+
+
+class _NullStage(object):
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class NullMetrics(object):
+    """
+    Stands in for `Metrics` when instrumentation is disabled.
+    """
+
+    enabled = False
+
+    _stage = _NullStage()
+
+    def stage(self, name):
+        return self._stage
+
+    def time(self, name, wall, cpu=None):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+
+NULL = NullMetrics()
@@ -0,0 +1,109 @@
+"""
+Checksum files published next to artifacts.
+
+Maven repositories (and many mirrors) store ``file.jar.sha1``,
+``file.jar.md5`` and, for newer uploads, ``file.jar.sha256`` and
+``file.jar.sha512`` beside every artifact. ``analyze`` can use them for the
+digest of the whole artifact instead of reading it again:
+
+    trust   take the digest from the checksum file, the artifact is only
+            read for its members
+    verify  compute the digest while the members are read, in a single
+            pass, and raise `ChecksumMismatch` if it differs
+
+``maven-metadata.xml`` lists the versions of an artifact, not checksums of
+its files, so the checksum files are the only source.
+"""
+
+import hashlib
+import os
+import re
+
+
+TRUST = "trust"
+VERIFY = "verify"
+MODES = (TRUST, VERIFY)
+
+# Checksum file extension of every algorithm.
+SUFFIXES = {
+    "md5": ".md5",
+    "sha1": ".sha1",
+    "sha256": ".sha256",
+    "sha512": ".sha512",
+}
+
+# Checksum files are tiny, anything larger is not one.
+MAX_SIZE = 4096
+
+HEX = re.compile(r"[0-9a-fA-F]+")
+
+
+class ChecksumMismatch(ValueError):
+    """
+    The digest of an artifact differs from its checksum file.
+    """
+
+
+def parse_checksum(content, algorithm):
+    """
+    Return the hex digest in the content of a checksum file, or None.
+    Accepts the bare digest, ``digest  filename`` (sha1sum) and
+    ``SHA1(filename)= digest`` (openssl) forms.
+
+    :Parameters:
+       - `content`: Content of the checksum file.
+       - `algorithm`: Algorithm of the digest, for its length.
+    """
+    length = hashlib.new(algorithm).digest_size * 2
+    for token in HEX.findall(content):
+        if len(token) == length:
+            return token.lower()
+    return None
+
+
+def read_sidecars(path, algorithms):
+    """
+    Return {algorithm: hexdigest} read from the checksum files next to
+    `path`, for the algorithms that have one.
+
+    :Parameters:
+       - `path`: Path of the artifact.
+       - `algorithms`: Algorithms to look for.
+    """
+    checksums = {}
+    for algorithm in algorithms:
+        suffix = SUFFIXES.get(algorithm)
+        if suffix is None:
+            continue
+        try:
+            with open(path + suffix, "rb") as sidecar:
+                content = sidecar.read(MAX_SIZE + 1)
+        except (IOError, OSError):
+            continue
+        if len(content) > MAX_SIZE:
+            continue
+        checksum = parse_checksum(content, algorithm)
+        if checksum is not None:
+            checksums[algorithm] = checksum
+    return checksums
+
+
+def verify(result, checksums, name=None):
+    """
+    Compare the combined digests of an analysis with known checksums,
+    raising `ChecksumMismatch` on the first difference.
+
+    :Parameters:
+       - `result`: Result of ``analyze``.
+       - `checksums`: {algorithm: hexdigest} expected.
+       - `name`: Name of the artifact, for the error message.
+    """
+    hashes = result.get("hashes", {})
+    for (algorithm, expected) in sorted(checksums.iteritems()):
+        if algorithm not in hashes:
+            continue
+        actual = hashes[algorithm]["combined"]
+        if actual != expected.lower():
+            raise ChecksumMismatch(
+                "%s digest of %s is %s, its checksum file says %s" % (
+                    algorithm, name or "the artifact", actual, expected))
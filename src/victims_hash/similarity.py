@@ -0,0 +1,193 @@
+"""
+Similarity between archives based on the digests of their members.
+
+Repackaged or shaded archives rarely share their combined hash but keep
+most of their members. `jaccard` and `containment` compare the member
+digest sets of two fingerprints exactly. For corpus wide searches a
+fingerprint can carry a MinHash ``sketch`` (see `add_sketch`), which
+`LSHIndex` buckets so that candidates are found without comparing every
+pair.
+
+The sketch uses one permutation hashing: member digests are already
+uniformly distributed, so each one is split into a bin number and a value
+and every bin keeps its smallest value. Empty bins borrow the value of the
+next non-empty bin (densification). This costs one pass over the members
+whatever the sketch size.
+"""
+
+SKETCH_SIZE = 128
+
+# Marks a sketch of an archive without members.
+EMPTY = (1 << 64) - 1
+
+
+def digests(result, algorithm="sha512"):
+    """
+    Return the set of member digests of a fingerprint.
+
+    :Parameters:
+       - `result`: Result of ``analyze`` or ``fingerprint``.
+       - `algorithm`: Algorithm of the digests to compare.
+    """
+    return set(result["hashes"][algorithm]["files"])
+
+
+def jaccard(a, b, algorithm="sha512"):
+    """
+    Return the Jaccard index of the member digests of two fingerprints:
+    members in both over members in either.
+    """
+    a, b = digests(a, algorithm), digests(b, algorithm)
+    if not a and not b:
+        return 0.0
+    return len(a & b) / float(len(a | b))
+
+
+def containment(a, b, algorithm="sha512"):
+    """
+    Return the fraction of the members of `a` also found in `b`, eg. how
+    much of a vulnerable library `b` embeds.
+    """
+    a, b = digests(a, algorithm), digests(b, algorithm)
+    if not a:
+        return 0.0
+    return len(a & b) / float(len(a))
+
+
+def sketch(files, size=SKETCH_SIZE):
+    """
+    Return the MinHash signature, a list of `size` integers, of an
+    iterable of hex digests.
+
+    :Parameters:
+       - `files`: Hex member digests, at least 24 digits long.
+       - `size`: Number of bins of the signature.
+    """
+    bins = [None] * size
+    for digest in files:
+        i = int(digest[:8], 16) % size
+        value = int(digest[8:24], 16)
+        if bins[i] is None or value < bins[i]:
+            bins[i] = value
+
+    filled = [i for (i, value) in enumerate(bins) if value is not None]
+    if not filled:
+        return [EMPTY] * size
+    # Borrow from the next filled bin, wrapping around. The offset keeps
+    # borrowed values from colliding with genuine ones by chance.
+    for i in xrange(size):
+        if bins[i] is None:
+            j = next((k for k in filled if k > i), filled[0])
+            bins[i] = (bins[j] + (j - i) % size) & EMPTY
+    return bins
+
+
+def add_sketch(result, algorithm="sha512", size=SKETCH_SIZE):
+    """
+    Store a ``sketch`` in a fingerprint, and in those of its nested
+    archives, from the member digests of `algorithm`. Returns the result.
+    """
+    hashes = result.get("hashes", {}).get(algorithm)
+    if hashes is not None:
+        result["sketch"] = {
+            "algorithm": algorithm,
+            "members": len(hashes["files"]),
+            "minhash": sketch(hashes["files"], size),
+        }
+    for inner in result.get("archives", []):
+        add_sketch(inner, algorithm, size)
+    return result
+
+
+def estimate_jaccard(a, b):
+    """
+    Estimate the Jaccard index of two fingerprints from their sketches.
+    """
+    a, b = a["sketch"], b["sketch"]
+    if a["algorithm"] != b["algorithm"] or \
+            len(a["minhash"]) != len(b["minhash"]):
+        raise ValueError("Sketches are not comparable")
+    if not a["members"] or not b["members"]:
+        return 0.0
+    same = sum(1 for (x, y) in zip(a["minhash"], b["minhash"]) if x == y)
+    return same / float(len(a["minhash"]))
+
+
+def estimate_containment(a, b):
+    """
+    Estimate `containment` from the sketches and member counts.
+    """
+    j = estimate_jaccard(a, b)
+    na, nb = a["sketch"]["members"], b["sketch"]["members"]
+    if not na:
+        return 0.0
+    return min(1.0, j * (na + nb) / ((1 + j) * na))
+
+
+class LSHIndex(object):
+    """
+    In memory locality sensitive hashing index of sketches. A sketch is
+    cut into `bands` of `rows` values and filed under each band; two
+    sketches sharing any band become candidates. Pairs with a Jaccard
+    index above about ``(1 / bands) ** (1 / rows)`` are likely found.
+    """
+
+    def __init__(self, bands=32, rows=4):
+        """
+        :Parameters:
+           - `bands`: Number of bands.
+           - `rows`: Sketch values per band, `bands` * `rows` must not
+             exceed the sketch size.
+        """
+        self.bands = bands
+        self.rows = rows
+        self.buckets = [{} for _ in xrange(bands)]
+        self.sketches = {}
+
+    def _bands(self, result):
+        minhash = result["sketch"]["minhash"]
+        if len(minhash) < self.bands * self.rows:
+            raise ValueError("Sketch too small for %i bands of %i rows" % (
+                self.bands, self.rows))
+        for band in xrange(self.bands):
+            yield band, tuple(minhash[band * self.rows:
+                                      (band + 1) * self.rows])
+
+    def insert(self, key, result):
+        """
+        Index the sketch of a fingerprint under `key`.
+
+        :Parameters:
+           - `key`: Identifier of the artifact, eg. its combined hash.
+           - `result`: Fingerprint holding a ``sketch``.
+        """
+        if not result["sketch"]["members"]:
+            return
+        self.sketches[key] = {"sketch": result["sketch"]}
+        for (band, values) in self._bands(result):
+            self.buckets[band].setdefault(values, set()).add(key)
+
+    def candidates(self, result):
+        """
+        Return the keys sharing at least one band with a fingerprint.
+        """
+        found = set()
+        for (band, values) in self._bands(result):
+            found.update(self.buckets[band].get(values, ()))
+        return found
+
+    def nearest(self, result, count=10, threshold=0.0):
+        """
+        Return up to `count` (estimated Jaccard index, key) pairs of the
+        indexed fingerprints most similar to `result`, best first.
+        """
+        scored = []
+        for key in self.candidates(result):
+            score = estimate_jaccard(result, self.sketches[key])
+            if score >= threshold:
+                scored.append((score, key))
+        scored.sort(key=lambda pair: (-pair[0], pair[1]))
+        return scored[:count]
+
+    def __len__(self):
+        return len(self.sketches)
@@ -0,0 +1,8 @@
+"""
+Unit tests, run with ``python setup.py test``.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
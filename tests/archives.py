@@ -0,0 +1,311 @@
+"""
+Builders of the small archives and class files the tests run against.
+Everything is built in memory so the tests need no fixtures on disk.
+"""
+
+import base64
+import hashlib
+import io
+import random
+import struct
+import tarfile
+import zlib
+
+
+def sha1(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def sha512(data):
+    return hashlib.sha512(data).hexdigest()
+
+
+class ZipBuilder(object):
+    """
+    Writes zips the way unusual producers do: zip64 records, data
+    descriptors (streamed output) and a prefix (self extracting).
+    """
+
+    def __init__(self, zip64=False, descriptor=False):
+        self.zip64 = zip64
+        self.descriptor = descriptor
+        self.out = io.BytesIO()
+        self.entries = []
+
+    def add(self, name, data, level=6):
+        crc = zlib.crc32(data) & 0xffffffff
+        if level:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+            payload = compressor.compress(data) + compressor.flush()
+            method = 8
+        else:
+            payload = data
+            method = 0
+        flags = 0x08 if self.descriptor else 0
+        offset = self.out.tell()
+
+        header = (crc, len(payload), len(data))
+        if self.descriptor:
+            header = (0, 0, 0)
+        extra = b''
+        if self.zip64:
+            extra = struct.pack('<2H2Q', 1, 16, header[2], header[1])
+            header = (header[0], 0xffffffff, 0xffffffff)
+        self.out.write(struct.pack(
+            '<4s5H3L2H', b'PK\x03\x04', 45 if self.zip64 else 20, flags,
+            method, 0, 0x21, header[0], header[1], header[2], len(name),
+            len(extra)))
+        self.out.write(name + extra + payload)
+        if self.descriptor:
+            layout = '<4sL2Q' if self.zip64 else '<4s3L'
+            self.out.write(struct.pack(
+                layout, b'PK\x07\x08', crc, len(payload), len(data)))
+        self.entries.append(
+            (name, flags, method, crc, len(payload), len(data), offset))
+
+    def getvalue(self, prefix=b''):
+        """
+        Return the zip, preceded by `prefix` whose length the offsets do
+        not account for, like a stub concatenated with a zip.
+        """
+        out = self.out
+        start = out.tell()
+        for (name, flags, method, crc, csize, usize, offset) in self.entries:
+            extra = b''
+            if self.zip64:
+                extra = struct.pack('<2H3Q', 1, 24, usize, csize, offset)
+                csize = usize = offset = 0xffffffff
+            out.write(struct.pack(
+                '<4s6H3L5H2L', b'PK\x01\x02', 45, 45, flags, method, 0,
+                0x21, crc, csize, usize, len(name), len(extra), 0, 0, 0, 0,
+                offset))
+            out.write(name + extra)
+        end = out.tell()
+        count = len(self.entries)
+        size, cd_offset = end - start, start
+        if self.zip64:
+            out.write(struct.pack(
+                '<4sQ2H2L4Q', b'PK\x06\x06', 44, 45, 45, 0, 0, count, count,
+                size, cd_offset))
+            out.write(struct.pack('<4sLQL', b'PK\x06\x07', 0, end, 1))
+            count, size, cd_offset = 0xffff, 0xffffffff, 0xffffffff
+        out.write(struct.pack(
+            '<4s4H2LH', b'PK\x05\x06', 0, 0, count, count, size, cd_offset,
+            0))
+        return prefix + out.getvalue()
+
+
+MANIFEST = (
+    b'Manifest-Version: 1.0\r\nImplementation-Title: sample\r\n'
+    b'Implementation-Version: 1.0\r\n')
+POM_PROPERTIES = b'groupId=org.sample\nartifactId=sample\nversion=1.0\n'
+
+
+def jar_bytes(classes, files=(), zip64=False, descriptor=False, prefix=b'',
+              level=6):
+    """
+    Return a jar with a manifest, a pom.properties, the class files
+    {name: content} and the other `files` (name, content).
+    """
+    builder = ZipBuilder(zip64, descriptor)
+    builder.add(b'META-INF/MANIFEST.MF', MANIFEST, level)
+    builder.add(b'META-INF/maven/org.sample/sample/pom.properties',
+                POM_PROPERTIES, level)
+    for name in sorted(classes):
+        builder.add(name, classes[name], level)
+    for (name, content) in files:
+        builder.add(name, content, level)
+    return builder.getvalue(prefix)
+
+
+class ClassBuilder(object):
+    """
+    Builds a small class file whose constant pool can be laid out in any
+    order, like two compilers would.
+    """
+
+    def __init__(self, name, value=42, line=1, source=b'Sample.java'):
+        self.constants = []
+        self.ids = {}
+        self.name = name
+        self.value = value
+        self.line = line
+        self.source = source
+
+    def constant(self, *entry):
+        if entry not in self.ids:
+            self.ids[entry] = len(self.constants)
+            self.constants.append(entry)
+        return self.ids[entry]
+
+    def utf8(self, value):
+        return self.constant('utf8', value)
+
+    def klass(self, name):
+        return self.constant('class', self.utf8(name))
+
+    def methodref(self, owner, name, descriptor):
+        return self.constant(
+            'methodref', self.klass(owner),
+            self.constant('nat', self.utf8(name), self.utf8(descriptor)))
+
+    def build(self, seed=None):
+        """
+        Return the class file, its constant pool shuffled with `seed`.
+        """
+        this = self.klass(self.name)
+        parent = self.klass(b'java/lang/Object')
+        init = self.methodref(b'java/lang/Object', b'<init>', b'()V')
+        value = self.constant('int', self.value)
+        names = [self.utf8(n) for n in (
+            b'Code', b'LineNumberTable', b'SourceFile', self.source,
+            b'<init>', b'()V', b'value', b'()I')]
+
+        order = range(len(self.constants))
+        if seed is not None:
+            random.Random(seed).shuffle(order)
+        index = dict((logical, i + 1) for (i, logical) in enumerate(order))
+
+        pool = []
+        for logical in order:
+            entry = self.constants[logical]
+            if entry[0] == 'utf8':
+                pool.append(b'\x01' + struct.pack('>H', len(entry[1])) +
+                            entry[1])
+            elif entry[0] == 'class':
+                pool.append(b'\x07' + struct.pack('>H', index[entry[1]]))
+            elif entry[0] == 'nat':
+                pool.append(b'\x0c' + struct.pack(
+                    '>HH', index[entry[1]], index[entry[2]]))
+            elif entry[0] == 'methodref':
+                pool.append(b'\x0a' + struct.pack(
+                    '>HH', index[entry[1]], index[entry[2]]))
+            elif entry[0] == 'int':
+                pool.append(b'\x03' + struct.pack('>i', entry[1]))
+
+        code_name, lines_name, source_name, source, init_name, init_type, \
+            value_name, value_type = [index[n] for n in names]
+
+        def method(name, descriptor, stack, code):
+            lines = struct.pack('>HIHHH', lines_name, 6, 1, 0, self.line)
+            body = struct.pack('>HHI', stack, 1, len(code)) + code + \
+                struct.pack('>HH', 0, 1) + lines
+            return struct.pack('>HHHH', 0x1, name, descriptor, 1) + \
+                struct.pack('>HI', code_name, len(body)) + body
+
+        out = [b'\xca\xfe\xba\xbe', struct.pack('>HHH', 0, 50, len(pool) + 1)]
+        out.extend(pool)
+        out.append(struct.pack(
+            '>HHHHH', 0x21, index[this], index[parent], 0, 0))
+        out.append(struct.pack('>H', 2))
+        out.append(method(init_name, init_type, 1,
+                          b'\x2a\xb7' + struct.pack('>H', index[init]) +
+                          b'\xb1'))
+        out.append(method(value_name, value_type, 1,
+                          b'\x12' + struct.pack('>B', index[value]) +
+                          b'\xac'))
+        out.append(struct.pack('>HHIH', 1, source_name, 2, source))
+        return b''.join(out)
+
+
+def java_class(name, value=42, seed=None, line=1):
+    """
+    Return a class file, see `ClassBuilder`.
+    """
+    return ClassBuilder(name, value, line).build(seed)
+
+
+def tar_add(archive, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = 0
+    archive.addfile(info, io.BytesIO(data))
+
+
+def tar_bytes(files, mode='w'):
+    """
+    Return a tarball of the (name, content) `files`.
+    """
+    out = io.BytesIO()
+    archive = tarfile.open(fileobj=out, mode=mode)
+    for (name, content) in files:
+        tar_add(archive, name, content)
+    archive.close()
+    return out.getvalue()
+
+
+GEMSPEC = (
+    b'--- !ruby/object:Gem::Specification\nname: sample\nversion: '
+    b'!ruby/object:Gem::Version\n  version: 1.0.0\nlicenses:\n- MIT\n')
+
+
+def gem_bytes(files):
+    """
+    Return a gem whose data.tar.gz holds the (name, content) `files`.
+    """
+    spec = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    metadata = spec.compress(GEMSPEC) + spec.flush()
+    return tar_bytes([
+        ('metadata.gz', metadata),
+        ('data.tar.gz', tar_bytes(files, 'w:gz')),
+    ])
+
+
+PKG_INFO = b'Metadata-Version: 2.1\nName: sample\nVersion: 1.0\n\n'
+
+
+def wheel_bytes(files, record=None):
+    """
+    Return a wheel of the (name, content) `files` whose RECORD lists
+    their sha256, or the {name: content} `record` claims instead.
+    """
+    builder = ZipBuilder()
+    lines = []
+    for (name, content) in files:
+        builder.add(name, content)
+        claimed = (record or {}).get(name, content)
+        digest = base64.urlsafe_b64encode(
+            hashlib.sha256(claimed).digest()).rstrip(b'=')
+        lines.append(b'%s,sha256=%s,%d' % (name, digest, len(claimed)))
+    builder.add(b'sample-1.0.dist-info/METADATA', PKG_INFO)
+    builder.add(b'sample-1.0.dist-info/RECORD',
+                b'\n'.join(lines) + b'\nsample-1.0.dist-info/RECORD,,\n')
+    return builder.getvalue()
+
+
+class Unseekable(object):
+    """
+    Hides ``seek`` so a stream is read like a pipe.
+    """
+
+    def __init__(self, data):
+        self.io = io.BytesIO(data)
+
+    def read(self, size=-1):
+        return self.io.read(size)
+
+
+class CountingFile(object):
+    """
+    A file that counts the bytes read from it.
+    """
+
+    def __init__(self, data, name=None):
+        self.io = io.BytesIO(data)
+        self.name = name
+        self.bytes_read = 0
+        self.closed = False
+
+    def read(self, size=-1):
+        data = self.io.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def seek(self, offset, whence=0):
+        return self.io.seek(offset, whence)
+
+    def tell(self):
+        return self.io.tell()
+
+    def close(self):
+        self.closed = True
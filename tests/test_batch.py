@@ -0,0 +1,153 @@
+"""
+Tests of the ``victims_hash batch`` command line.
+"""
+
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from victims_hash import batch
+from victims_hash.analyze import analyze
+
+from tests.archives import jar_bytes, java_class
+
+
+def jar(value):
+    return jar_bytes(dict(
+        (b'x/C%d.class' % i, java_class(b'x/C%d' % i, value * 10 + i))
+        for i in range(3)))
+
+
+class Stderr(io.BytesIO):
+
+    def write(self, data):
+        io.BytesIO.write(self, bytes(data))
+
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.paths = [self.write('a%02d.jar' % i, jar(i)) for i in range(8)]
+        self.output = os.path.join(self.directory, 'results.jsonl')
+        self.stdin = sys.stdin
+        self.stderr, sys.stderr = sys.stderr, Stderr()
+
+    def tearDown(self):
+        sys.stdin = self.stdin
+        sys.stderr = self.stderr
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as out:
+            out.write(data)
+        return path
+
+    def main(self, *argv):
+        """
+        Run the command, return its status and the results it wrote.
+        """
+        status = batch.main(list(argv) + ['-o', self.output])
+        with open(self.output) as io:
+            return status, [json.loads(line) for line in io]
+
+    def test_directory(self):
+        self.write('notes.txt', b'not an archive')
+        status, results = self.main('-w', '2', self.directory)
+        self.assertEqual(0, status)
+        self.assertEqual(sorted(self.paths),
+                         sorted(result['filename'] for result in results))
+        for result in results:
+            expected = analyze(result['filename'])
+            expected['filename'] = result['filename']
+            self.assertEqual(expected, result)
+        self.assertEqual('Processed 8 files, 0 failed\n',
+                         sys.stderr.getvalue())
+
+    def test_ordered(self):
+        paths = list(reversed(self.paths))
+        status, results = self.main('-w', '4', '--chunksize', '1',
+                                    '--ordered', *paths)
+        self.assertEqual(paths, [result['filename'] for result in results])
+        status, results = self.main('-w', '4', '--chunksize', '1', *paths)
+        # Unordered output holds the same results in completion order.
+        self.assertEqual(sorted(paths),
+                         sorted(result['filename'] for result in results))
+
+    def test_errors(self):
+        text = self.write('notes.txt', b'not an archive')
+        missing = os.path.join(self.directory, 'missing.jar')
+        status, results = self.main('-w', '2', '--ordered', text,
+                                    self.paths[0], missing)
+        self.assertEqual(1, status)
+        self.assertEqual([text, self.paths[0], missing],
+                         [result['filename'] for result in results])
+        self.assertTrue(results[0]['error'].startswith('NotImplementedError'))
+        self.assertTrue(results[2]['error'].startswith('IOError'))
+        self.assertTrue('Traceback' in results[2]['traceback'])
+        self.assertFalse('error' in results[1])
+        self.assertEqual('Processed 3 files, 2 failed\n',
+                         sys.stderr.getvalue())
+
+    def test_stdin(self):
+        sys.stdin = io.BytesIO('\n'.join(self.paths[:3]) + '\r\n\n')
+        status, results = self.main('--ordered', '-')
+        self.assertEqual(self.paths[:3],
+                         [result['filename'] for result in results])
+        # A NUL separated list takes names with newlines.
+        odd = self.write('new\nline.jar', jar(9))
+        sys.stdin = io.BytesIO('\0'.join([odd, self.paths[0]]))
+        status, results = self.main('--ordered', '-0')
+        self.assertEqual([odd, self.paths[0]],
+                         [result['filename'] for result in results])
+        self.assertFalse('error' in results[0])
+
+    def test_previous(self):
+        status, previous = self.main('--members', self.paths[0])
+        self.write('a00.jar', jar_bytes({
+            b'x/C0.class': java_class(b'x/C0', 0),
+            b'x/C1.class': java_class(b'x/C1', 100)}))
+        earlier = os.path.join(self.directory, 'previous.jsonl')
+        os.rename(self.output, earlier)
+        status, results = self.main('--previous', earlier, *self.paths[:2])
+        results = dict((result['filename'], result) for result in results)
+        self.assertEqual({'added': [], 'removed': ['x/C2.class'],
+                          'changed': ['x/C1.class'], 'reused': 1},
+                         results[self.paths[0]]['diff'])
+        # Files without an earlier result are fingerprinted as usual.
+        self.assertFalse('diff' in results[self.paths[1]])
+
+    def test_member_cache(self):
+        copy = self.write('copy.jar', jar(0))
+        status, results = self.main('-w', '1', '--ordered',
+                                    '--member-cache', '100',
+                                    self.paths[0], copy)
+        self.assertEqual(results[0]['hashes'], results[1]['hashes'])
+        self.assertEqual(
+            'Processed 2 files, 0 failed\n'
+            'Member cache: 3 hits, 3 misses (50.0% hit rate), 0 rejected\n',
+            sys.stderr.getvalue())
+
+
+class CombineTest(unittest.TestCase):
+
+    def test_combine(self):
+        workers = [
+            {'hits': 3, 'misses': 1, 'rejected': 1, 'entries': 4,
+             'hit_rate': 0.75},
+            {'hits': 0, 'misses': 4, 'rejected': 0, 'entries': 4,
+             'hit_rate': 0.0},
+        ]
+        self.assertEqual({'hits': 3, 'misses': 5, 'rejected': 1,
+                          'entries': 8, 'hit_rate': 0.375},
+                         batch.combine(workers))
+        self.assertEqual(0.0, batch.combine([])['hit_rate'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""
+Tests of the benchmark corpus and the comparison of results.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(__file__), '..', 'benchmarks'))
+
+import corpus
+import pipeline_bench
+
+from victims_hash.analyze import analyze
+
+
+SPECS = [
+    ('jar', 20, 512, 6, 0),
+    ('jar', 6, 512, 0, 1),
+    ('egg', 20, 512, 6, 0),
+    ('gem', 20, 512, 6, 0),
+]
+
+
+class CorpusTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def generate(self, name):
+        return corpus.generate(os.path.join(self.directory, name), SPECS)
+
+    def test_reproducible(self):
+        for (first, second) in zip(self.generate('a'), self.generate('b')):
+            with open(first, 'rb') as a:
+                with open(second, 'rb') as b:
+                    self.assertEqual(a.read(), b.read())
+
+    def test_members(self):
+        for (spec, path) in zip(SPECS, self.generate('a')):
+            depth = pipeline_bench.nesting(path)
+            self.assertEqual(spec[4], depth)
+            members = pipeline_bench.count(
+                pipeline_bench.reader_for(path), depth)[0]
+            self.assertTrue(members >= spec[1], (path, members))
+            result = analyze(path, depth=depth)
+            self.assertEqual(3 if depth else 0,
+                             len(result.get('archives', [])))
+
+
+class CompareTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def report(self, name, wall):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as out:
+            json.dump({'results': [{
+                'path': 'a.jar', 'peak_rss_kb': 1000,
+                'stages': {'fingerprint': {'wall': wall, 'cpu': wall}},
+            }]}, out)
+        return path
+
+    def compare(self, old, new, threshold=0.1, min_time=0.01):
+        args = argparse.Namespace(
+            old=self.report('old.json', old),
+            new=self.report('new.json', new),
+            threshold=threshold, min_time=min_time)
+        sys.stdout, stdout = open(os.devnull, 'w'), sys.stdout
+        try:
+            return pipeline_bench.compare(args)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    def test_regression(self):
+        self.assertEqual(1, self.compare(1.0, 1.5))
+
+    def test_within_threshold(self):
+        self.assertEqual(0, self.compare(1.0, 1.05))
+
+    def test_noise(self):
+        # Slower by more than the threshold but by less than min_time.
+        self.assertEqual(0, self.compare(0.001, 0.005))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+"""
+Tests of the persistent cache of analysis results.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from victims_hash.analyze import analyze
+from victims_hash.cache import FingerprintCache
+
+from tests.archives import jar_bytes, java_class, sha512
+
+
+def jar(value):
+    return jar_bytes({b'x/A.class': java_class(b'x/A', value)})
+
+
+class FingerprintCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db = os.path.join(self.directory, 'cache.db')
+        self.cache = FingerprintCache(self.db)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as out:
+            out.write(data)
+        return path
+
+    def test_hit(self):
+        path = self.write('a.jar', jar(1))
+        expected = analyze(path)
+        # The digest of a new file comes from its analysis, it is not read
+        # a second time for it.
+        digest = self.cache.digest
+        self.cache.digest = lambda filename: self.fail('File hashed again')
+        self.assertEqual(expected, analyze(path, cache=self.cache))
+        self.assertEqual(sha512(jar(1)), self.cache.recorded(path)[0])
+        self.assertEqual(expected, analyze(path, cache=self.cache))
+        self.cache.digest = digest
+        stats = self.cache.stats()
+        self.assertEqual((1, 1, 1), (
+            stats['hits'], stats['misses'], stats['entries']))
+
+    def test_same_content(self):
+        first = self.write('a.jar', jar(1))
+        second = self.write('b.jar', jar(1))
+        analyze(first, cache=self.cache)
+        # Known by its content once the path was recorded.
+        self.assertEqual(sha512(jar(1)), self.cache.digest(second))
+        analyze(second, cache=self.cache)
+        self.assertEqual(1, self.cache.stats()['hits'])
+
+    def test_options(self):
+        path = self.write('a.jar', jar(1))
+        analyze(path, cache=self.cache)
+        result = analyze(path, cache=self.cache, algorithms=['sha1'])
+        self.assertEqual(['sha1'], list(result['hashes']))
+        self.assertEqual(2, self.cache.stats()['entries'])
+        self.assertEqual(0, self.cache.stats()['hits'])
+
+    def test_changed(self):
+        path = self.write('a.jar', jar(1))
+        first = analyze(path, cache=self.cache)
+        self.assertEqual(sha512(jar(1)), self.cache.recorded(path)[0])
+        self.write('a.jar', jar(22))
+        # A different size is enough to tell.
+        self.assertEqual(None, self.cache.recorded(path)[0])
+        second = analyze(path, cache=self.cache)
+        self.assertNotEqual(first['hash'], second['hash'])
+        self.assertEqual(sha512(jar(22)), self.cache.recorded(path)[0])
+
+    def test_mtime(self):
+        path = self.write('a.jar', jar(1))
+        self.assertEqual(sha512(jar(1)), self.cache.digest(path))
+        st = os.stat(path)
+        os.utime(path, (st.st_atime, st.st_mtime + 10))
+        self.assertEqual(None, self.cache.recorded(path)[0])
+
+    def test_eviction(self):
+        # Room for two results of 17 bytes.
+        self.cache.max_bytes = 40
+        for name in ('a', 'b', 'c'):
+            self.cache.put(name, {'name': name * 5})
+            time.sleep(0.01)
+            if name == 'b':
+                # Used again, so 'b' is now the least recently used.
+                self.cache.get('a')
+        self.assertEqual(None, self.cache.get('b'))
+        self.assertEqual({'name': 'aaaaa'}, self.cache.get('a'))
+        self.assertEqual({'name': 'ccccc'}, self.cache.get('c'))
+
+    def test_schema(self):
+        self.cache.put('a', {})
+        with self.cache.db:
+            self.cache.db.execute(
+                "UPDATE meta SET value = '1' WHERE key = 'schema'")
+        self.cache.close()
+        self.cache = FingerprintCache(self.db)
+        self.assertEqual(0, self.cache.stats()['entries'])
+        self.cache.put('a', {})
+        self.cache.close()
+        # The same schema keeps the entries.
+        self.cache = FingerprintCache(self.db)
+        self.assertEqual({}, self.cache.get('a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
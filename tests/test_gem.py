@@ -0,0 +1,73 @@
+"""
+Tests of the single pass over gems.
+"""
+
+import io
+import unittest
+
+from victims_hash.analyze import analyze
+from victims_hash.archive.reader.registry import SNIFF_SIZE
+from victims_hash.archive.reader.scope import parse_scopes
+
+from tests.archives import CountingFile, gem_bytes, jar_bytes, java_class
+
+
+FILES = [
+    ('lib/sample.rb', b'module Sample\nend\n'),
+    ('lib/sample/version.rb', b'VERSION = "1.0.0"\n'),
+    ('README.md', b'# Sample\n'),
+    ('vendor/sample.jar', jar_bytes(
+        {b'org/sample/A.class': java_class(b'org/sample/A')})),
+]
+
+
+class GemTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = gem_bytes(FILES)
+
+    def multipass(self, **options):
+        """
+        Result of the seekable path, which reads the gem once per stage.
+        """
+        result = analyze(io.BytesIO(self.data), 'sample.gem', members=True,
+                         **options)
+        for inner in [result] + result.get('archives', []):
+            del inner['members']
+        return result
+
+    def test_read_once(self):
+        source = CountingFile(self.data, 'sample.gem')
+        result = analyze(source, depth=1)
+        # Only the head sniffed to pick the reader is read again.
+        self.assertEqual(len(self.data) + SNIFF_SIZE, source.bytes_read)
+        self.assertEqual(self.multipass(depth=1), result)
+        self.assertEqual('sample', result['meta']['name'])
+        self.assertEqual(
+            set(['lib/sample.rb', 'lib/sample/version.rb']),
+            set(result['hashes']['sha1']['files'].values()))
+        self.assertEqual(['vendor/sample.jar'],
+                         [inner['name'] for inner in result['archives']])
+
+    def test_member_and_archive(self):
+        """
+        A nested archive within the scope is both fingerprinted and
+        descended into.
+        """
+        options = dict(depth=1, scopes=parse_scopes(['gem:include=*']))
+        result = analyze(io.BytesIO(self.data), 'sample.gem', **options)
+        self.assertEqual(self.multipass(**options), result)
+        self.assertTrue('vendor/sample.jar' in
+                        result['hashes']['sha1']['files'].values())
+        self.assertEqual(1, len(result['archives']))
+
+    def test_trusted_checksum(self):
+        expected = self.multipass()
+        checksums = {'sha512': expected['hash']}
+        result = analyze(io.BytesIO(self.data), 'sample.gem',
+                         sidecar='trust', checksums=checksums)
+        self.assertEqual(expected, result)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+"""
+Tests of re-fingerprinting against an earlier result.
+"""
+
+import io
+import unittest
+
+from victims_hash.analyze import analyze
+
+from tests.archives import jar_bytes, java_class
+
+
+def classes(values):
+    return dict(
+        (b'x/%s.class' % name, java_class(b'x/%s' % name, value))
+        for (name, value) in values.items())
+
+
+class IncrementalTest(unittest.TestCase):
+
+    def analyze(self, values, **options):
+        return analyze(io.BytesIO(jar_bytes(classes(values))), 'sample.jar',
+                       meta=False, **options)
+
+    def test_diff(self):
+        previous = self.analyze({'A': 1, 'B': 2, 'C': 3}, members=True)
+        result = self.analyze({'A': 1, 'B': 20, 'D': 4}, previous=previous)
+        self.assertEqual({'added': ['x/D.class'], 'removed': ['x/C.class'],
+                          'changed': ['x/B.class'], 'reused': 1},
+                         result['diff'])
+        # Reused digests make no difference to the fingerprint.
+        expected = self.analyze({'A': 1, 'B': 20, 'D': 4}, members=True)
+        del result['diff']
+        self.assertEqual(expected, result)
+
+    def test_unchanged(self):
+        values = {'A': 1, 'B': 2}
+        previous = self.analyze(values, members=True)
+        result = self.analyze(values, previous=previous)
+        self.assertEqual({'added': [], 'removed': [], 'changed': [],
+                          'reused': 2}, result['diff'])
+        self.assertEqual(previous['hashes'], result['hashes'])
+
+    def test_not_rehashed(self):
+        """
+        A member with an unchanged key is not read again: a digest planted
+        in the earlier result comes back.
+        """
+        previous = self.analyze({'A': 1}, members=True, algorithms=['sha1'])
+        previous['hashes']['sha1']['files'] = {'f' * 40: 'x/A.class'}
+        result = self.analyze({'A': 1}, previous=previous,
+                              algorithms=['sha1'])
+        self.assertEqual({'f' * 40: 'x/A.class'},
+                         result['hashes']['sha1']['files'])
+
+    def test_without_members(self):
+        """
+        Without the member keys of the earlier run nothing is reused, the
+        diff is still made from the digests.
+        """
+        previous = self.analyze({'A': 1, 'B': 2})
+        result = self.analyze({'A': 1, 'B': 3}, previous=previous)
+        self.assertEqual({'added': [], 'removed': [],
+                          'changed': ['x/B.class'], 'reused': 0},
+                         result['diff'])
+
+    def test_other_algorithms(self):
+        previous = self.analyze({'A': 1}, members=True, algorithms=['sha1'])
+        result = self.analyze({'A': 1}, previous=previous)
+        self.assertEqual(0, result['diff']['reused'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+"""
+Tests of the on-disk index of member digests.
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from victims_hash.analyze import analyze
+from victims_hash.index import HashIndex
+
+from tests.archives import jar_bytes, java_class
+
+
+def jar(numbers):
+    return analyze(io.BytesIO(jar_bytes(dict(
+        (b'x/C%d.class' % i, java_class(b'x/C%d' % i, i))
+        for i in numbers))), 'sample.jar', meta=False)
+
+
+class HashIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'index')
+        self.first = jar([0, 1])
+        self.second = jar([1, 2])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def digest(self, result, name):
+        files = result['hashes']['sha512']['files']
+        return [digest for (digest, member) in files.items()
+                if member == name][0]
+
+    def names(self, index, result, member):
+        return [artifact['name'] for artifact in
+                index.lookup(self.digest(result, member))]
+
+    def test_round_trip(self):
+        index = HashIndex(self.path)
+        self.assertEqual(0, index.add(self.first, 'first.jar'))
+        # Nothing is visible before the commit.
+        self.assertEqual([], self.names(index, self.first, 'x/C0.class'))
+        index.commit()
+        self.assertEqual(1, index.add(self.second, 'second.jar'))
+        # Indexed again, the artifact keeps its id.
+        self.assertEqual(0, index.add(self.first, 'again.jar'))
+        index.close()
+
+        index = HashIndex(self.path)
+        self.assertEqual(2, index.stats()['segments'])
+        self.assertEqual(['first.jar', 'second.jar'],
+                         self.names(index, self.first, 'x/C1.class'))
+        self.assertEqual(['second.jar'],
+                         self.names(index, self.second, 'x/C2.class'))
+        self.assertEqual([], index.lookup('00' * 64))
+
+        index.compact()
+        self.assertEqual({'artifacts': 2, 'segments': 1, 'postings': 4,
+                          'pending': 0}, index.stats())
+        self.assertEqual(['first.jar', 'second.jar'],
+                         self.names(index, self.first, 'x/C1.class'))
+        self.assertEqual(
+            ['first.jar'], self.names(index, self.first, 'x/C0.class'))
+        index.close()
+        self.assertEqual(
+            ['artifacts.jsonl', 'manifest.json', 'sha512-00000003.seg'],
+            sorted(os.listdir(self.path)))
+
+    def test_uncommitted(self):
+        """
+        What was not committed is dropped when the index is reopened.
+        """
+        index = HashIndex(self.path)
+        index.add(self.first, 'first.jar')
+        index.commit()
+        index.add(self.second, 'second.jar')
+        index.refresh()
+        self.assertEqual(1, index.stats()['artifacts'])
+        self.assertEqual([], self.names(index, self.second, 'x/C2.class'))
+
+    def test_algorithm(self):
+        index = HashIndex(self.path)
+        index.add(self.first, 'first.jar')
+        index.close()
+        self.assertRaises(ValueError, HashIndex, self.path, 'sha1')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+"""
+Tests of the offset based class file parser against the stream based one.
+"""
+
+import io
+import os
+import struct
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(__file__), '..', 'benchmarks'))
+
+from javaclass_bench import synthetic_class
+
+from victims_hash.archive.reader.javaclass import (
+    CONSTANT_Long, CONSTANT_Utf8, ClassData, StreamClassData)
+
+from tests.archives import java_class
+
+
+def attributes(table):
+    return [(a.attribute_name_index, a.info) for a in table]
+
+
+def members(table):
+    return [(m.access_flags, m.name_index, m.descriptor_index,
+             attributes(m.attributes)) for m in table]
+
+
+def constants(pool):
+    return sorted((n, info.tag, info.info) for (n, info) in pool.items())
+
+
+class ClassDataTest(unittest.TestCase):
+
+    classes = [
+        java_class(b'org/sample/A'),
+        java_class(b'org/sample/A', 7, seed=3, line=12),
+        synthetic_class(),
+        synthetic_class(methods=0, fields=0),
+    ]
+
+    def test_same_as_stream(self):
+        for data in self.classes:
+            stream = StreamClassData(io.BytesIO(data))
+            parsed = ClassData(data)
+            self.assertEqual(
+                (stream.magic, stream.major, stream.minor,
+                 stream.access_flags, stream.this_class, stream.super_class,
+                 stream.interfaces),
+                (parsed.magic, parsed.major, parsed.minor,
+                 parsed.access_flags, parsed.this_class, parsed.super_class,
+                 parsed.interfaces))
+            self.assertEqual(constants(stream.constant_pool),
+                             constants(parsed.constant_pool))
+            self.assertEqual(members(stream.fields), members(parsed.fields))
+            self.assertEqual(members(stream.methods), members(parsed.methods))
+            self.assertEqual(attributes(stream.attributes),
+                             attributes(parsed.attributes))
+
+    def test_info_types(self):
+        """
+        Callers of either parser get the same types back.
+        """
+        parsed = ClassData(java_class(b'org/sample/A'))
+        stream = StreamClassData(io.BytesIO(java_class(b'org/sample/A')))
+        self.assertEqual(str, type(parsed.methods[0].attributes[0].info))
+        self.assertEqual(type(stream.attributes[0].info),
+                         type(parsed.attributes[0].info))
+        self.assertEqual(type(stream.constant_pool[1].info),
+                         type(parsed.constant_pool[1].info))
+
+    def test_constant_pool(self):
+        data = synthetic_class()
+        pool = ClassData(data).constant_pool
+        expected = StreamClassData(io.BytesIO(data)).constant_pool
+        self.assertEqual(len(expected), len(pool))
+        self.assertEqual(sorted(expected), list(pool))
+        # The slot after a long is not an entry.
+        (long_index,) = [n for n in pool if pool.tag(n) == CONSTANT_Long]
+        self.assertFalse(long_index + 1 in pool)
+        self.assertEqual(None, pool.get(long_index + 1))
+        self.assertEqual(None, pool.get(0))
+        self.assertEqual('x', pool.get(len(expected) + 10, 'x'))
+        self.assertRaises(KeyError, pool.__getitem__, long_index + 1)
+        self.assertEqual(expected[1].info, pool.get(1).info)
+        self.assertEqual(CONSTANT_Utf8, pool.tag(1))
+        self.assertEqual(u'bench/Synthetic', pool.utf8(1))
+        self.assertEqual(u'bench/Synthetic', ClassData(data).name)
+
+    def test_file(self):
+        data = java_class(b'org/sample/A')
+        self.assertEqual(constants(ClassData(data).constant_pool),
+                         constants(ClassData(io.BytesIO(data)).constant_pool))
+
+    def test_invalid(self):
+        data = java_class(b'org/sample/A')
+        self.assertRaises(ValueError, ClassData, b'\0' * 4 + data[4:])
+        # The errors normal_form falls back on.
+        for size in (20, len(data) // 2, len(data) - 1):
+            self.assertRaises((ValueError, IndexError, struct.error),
+                              ClassData, data[:size])
+        # A tag no class file version has.
+        self.assertRaises(ValueError, ClassData,
+                          data[:10] + b'\x02' + data[11:])
+
+
+if __name__ == '__main__':
+    unittest.main()
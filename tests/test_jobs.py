@@ -0,0 +1,119 @@
+"""
+Tests of the non-blocking job API.
+"""
+
+import io
+import threading
+import time
+import unittest
+
+from victims_hash.analyze import analyze
+from victims_hash.jobs import Cancelled, Fingerprinter, RUNNING
+from victims_hash.metrics import Metrics
+
+from tests.archives import jar_bytes, java_class
+
+
+CLASSES = dict(
+    (b'org/sample/C%d.class' % i, java_class(b'org/sample/C%d' % i, i))
+    for i in range(3))
+
+
+class UploadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = jar_bytes(CLASSES)
+        self.expected = analyze(io.BytesIO(self.data), 'sample.jar')
+
+    def upload(self, fingerprinter):
+        upload = fingerprinter.upload('sample.jar')
+        for start in range(0, len(self.data), 100):
+            upload.feed(self.data[start:start + 100])
+        job = upload.finish()
+        self.assertEqual(self.expected, job.result(10))
+        fingerprinter.close()
+        self.assertTrue(upload.io.closed)
+        return upload
+
+    def test_in_memory(self):
+        upload = self.upload(Fingerprinter(1))
+        self.assertFalse(upload.spooled)
+
+    def test_spooled(self):
+        upload = self.upload(
+            Fingerprinter(1, spool_size=len(self.data) // 2))
+        self.assertTrue(upload.spooled)
+
+
+class Blocked(io.BytesIO):
+    """
+    A file whose reads wait until `release` is set.
+    """
+
+    def __init__(self, data):
+        io.BytesIO.__init__(self, data)
+        self.release = threading.Event()
+
+    def read(self, size=-1):
+        self.release.wait(10)
+        return io.BytesIO.read(self, size)
+
+
+class JobTest(unittest.TestCase):
+
+    def test_cancel_pending(self):
+        fingerprinter = Fingerprinter(1)
+        data = jar_bytes(CLASSES)
+        # The only worker is kept busy by the first job.
+        blocked = Blocked(data)
+        first = fingerprinter.submit(blocked, 'sample.jar')
+        second = fingerprinter.submit(io.BytesIO(data), 'sample.jar')
+        self.assertTrue(second.cancel())
+        self.assertTrue(second.cancelled())
+        blocked.release.set()
+        first.result(10)
+        self.assertRaises(Cancelled, second.result, 10)
+        fingerprinter.close()
+
+    def test_cancel_running(self):
+        fingerprinter = Fingerprinter(1)
+        blocked = Blocked(jar_bytes(CLASSES))
+        job = fingerprinter.submit(blocked, 'sample.jar')
+        while job.state != RUNNING:
+            time.sleep(0.01)
+        self.assertTrue(job.cancel())
+        blocked.release.set()
+        self.assertRaises(Cancelled, job.result, 10)
+        self.assertTrue(job.cancelled())
+        fingerprinter.close()
+
+    def test_cancel_nested(self):
+        """
+        Cancelling inside an inner archive stops the outer one too, the
+        other inner archives are not read.
+        """
+        inner = jar_bytes(CLASSES)
+        data = jar_bytes({}, [(b'lib/j%02d.jar' % i, inner)
+                              for i in range(20)])
+        seen = []
+
+        def progress(member):
+            seen.append(member.name)
+            if member.name.endswith('.class'):
+                raise Cancelled()
+
+        metrics = Metrics()
+        self.assertRaises(Cancelled, analyze, io.BytesIO(data), 'a.jar',
+                          depth=1, progress=progress, metrics=metrics)
+        self.assertEqual(2, metrics.snapshot()['counters']['archives'])
+        self.assertEqual(['lib/j00.jar', 'org/sample/C0.class'], seen)
+
+    def test_error(self):
+        fingerprinter = Fingerprinter(1)
+        job = fingerprinter.submit(io.BytesIO(b'not an archive'), 'a.jar')
+        self.assertTrue(job.exception(10) is not None)
+        fingerprinter.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+"""
+Tests of the member digest cache.
+"""
+
+import io
+import unittest
+
+from victims_hash.analyze import analyze
+from victims_hash.archive.memo import MemberCache
+from victims_hash.archive.reader.scope import parse_scopes
+
+from tests.archives import jar_bytes, java_class
+
+
+class MemberCacheTest(unittest.TestCase):
+
+    def analyze(self, data, **options):
+        return analyze(io.BytesIO(data), 'sample.jar', meta=False,
+                       **options)['hashes']
+
+    def test_same_fingerprint(self):
+        """
+        The cache never changes a fingerprint, even for the same bytes
+        hashed whole under one name and without header under another.
+        """
+        content = java_class(b'x/A')
+        data = jar_bytes({b'x/A.class': content},
+                         [(b'x/A.class.bak', content)])
+        for normalize in (False, True):
+            options = dict(
+                scopes=parse_scopes(['jar:include=*.class,*.bak']),
+                normalize=normalize)
+            expected = self.analyze(data, **options)
+            self.assertEqual(2, len(expected['sha1']['files']))
+            cache = MemberCache()
+            self.assertEqual(
+                expected, self.analyze(data, member_cache=cache, **options))
+            self.assertEqual(
+                expected, self.analyze(data, member_cache=cache, **options))
+            self.assertEqual(2, cache.stats()['hits'])
+
+    def test_shared(self):
+        cache = MemberCache()
+        classes = dict(
+            (b'x/C%d.class' % i, java_class(b'x/C%d' % i, i))
+            for i in range(4))
+        first = self.analyze(jar_bytes(classes), member_cache=cache)
+        classes[b'x/C9.class'] = java_class(b'x/C9', 9)
+        second = self.analyze(jar_bytes(classes), member_cache=cache)
+        self.assertEqual(4, cache.stats()['hits'])
+        self.assertTrue(set(first['sha1']['files']) <
+                        set(second['sha1']['files']))
+
+
+if __name__ == '__main__':
+    unittest.main()
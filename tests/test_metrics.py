@@ -0,0 +1,233 @@
+"""
+Tests of the instrumentation and of its export by the autoprocess daemon.
+"""
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import urllib2
+
+from multiprocessing.pool import ThreadPool
+
+from victims_hash.analyze import analyze
+from victims_hash.autoprocess import exporter
+from victims_hash.autoprocess.pipeline import Pipeline
+from victims_hash.metrics import BUCKETS, NULL, Metrics
+
+from tests.archives import jar_bytes, java_class
+from tests.test_pipeline import wait_for
+
+
+def jar():
+    return jar_bytes(dict(
+        (b'x/C%d.class' % i, java_class(b'x/C%d' % i, i)) for i in range(3)))
+
+
+def samples(text):
+    """
+    Return the {name with labels: value} of a Prometheus exposition.
+    """
+    values = {}
+    for line in text.splitlines():
+        if not line.startswith('#'):
+            (name, value) = line.rsplit(' ', 1)
+            values[name] = float(value)
+    return values
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics()
+        self.metrics.time('inflate', 0.05)
+        self.metrics.time('inflate', 5.0, 2.0)
+        self.metrics.time('inflate', 700.0)
+        self.metrics.count('members', 3)
+        self.metrics.count('members')
+
+    def test_snapshot(self):
+        snapshot = self.metrics.snapshot()
+        self.assertEqual({'members': 4}, snapshot['counters'])
+        inflate = snapshot['stages']['inflate']
+        self.assertEqual((3, 705.05, 2.0), (
+            inflate['calls'], inflate['wall'], inflate['cpu']))
+        # 0.05 is at most 0.1, 5 at most 10, 700 beyond the last bound.
+        expected = [0] * (len(BUCKETS) + 1)
+        expected[BUCKETS.index(0.1)] = 1
+        expected[BUCKETS.index(10.0)] = 1
+        expected[-1] = 1
+        self.assertEqual(expected, inflate['buckets'])
+
+    def test_prometheus(self):
+        text = self.metrics.prometheus({'processed': 2}, {'pending': 5})
+        self.assertTrue(text.endswith('\n'))
+        values = samples(text)
+        self.assertEqual(3, values['victims_hash_stage_calls_total'
+                                   '{stage="inflate"}'])
+        self.assertEqual(705.05, values['victims_hash_stage_seconds_total'
+                                        '{stage="inflate",clock="wall"}'])
+        self.assertEqual(2.0, values['victims_hash_stage_seconds_total'
+                                     '{stage="inflate",clock="cpu"}'])
+        # Counters end in _total, gauges do not.
+        self.assertEqual(4, values['victims_hash_members_total'])
+        self.assertEqual(2, values['victims_hash_processed_total'])
+        self.assertEqual(5, values['victims_hash_pending'])
+        self.assertTrue('# TYPE victims_hash_members_total counter' in text)
+        self.assertTrue('# TYPE victims_hash_pending gauge' in text)
+
+    def test_histogram(self):
+        text = self.metrics.prometheus()
+        self.assertTrue(
+            '# TYPE victims_hash_stage_duration_seconds histogram' in text)
+        values = samples(text)
+        bucket = 'victims_hash_stage_duration_seconds_bucket' \
+            '{stage="inflate",le="%s"}'
+        # Cumulated, up to +Inf which counts every call.
+        self.assertEqual(
+            [0, 0, 1, 1, 2, 2, 2, 3],
+            [values[bucket % bound] for bound in BUCKETS + ('+Inf',)])
+        self.assertEqual(3, values['victims_hash_stage_duration_seconds_count'
+                                   '{stage="inflate"}'])
+        self.assertEqual(705.05, values['victims_hash_stage_duration_seconds'
+                                        '_sum{stage="inflate"}'])
+        # Buckets come in order of their bound.
+        bounds = [line for line in text.splitlines() if '_bucket' in line]
+        self.assertEqual(bucket % 0.001, bounds[0].rsplit(' ', 1)[0])
+        self.assertTrue('le="+Inf"' in bounds[-1])
+
+    def test_prefix(self):
+        text = self.metrics.prometheus(prefix='sample')
+        for line in text.splitlines():
+            name = line.split(' ')[2] if line.startswith('#') else line
+            self.assertTrue(name.startswith('sample_'), line)
+
+    def test_json(self):
+        values = json.loads(self.metrics.json({'processed': 2},
+                                              {'pending': 5}))
+        self.assertEqual({'members': 4, 'processed': 2}, values['counters'])
+        self.assertEqual({'pending': 5}, values['gauges'])
+        self.assertEqual(3, values['stages']['inflate']['calls'])
+        # Counters kept elsewhere are not added to the metrics.
+        self.assertEqual({'members': 4}, self.metrics.snapshot()['counters'])
+
+    def test_merge(self):
+        other = Metrics()
+        other.time('inflate', 0.0005)
+        other.time('hash', 0.2)
+        other.count('members', 2)
+        self.metrics.merge(json.loads(json.dumps(other.snapshot())))
+        snapshot = self.metrics.snapshot()
+        self.assertEqual({'members': 6}, snapshot['counters'])
+        self.assertEqual(4, snapshot['stages']['inflate']['calls'])
+        self.assertEqual(1, snapshot['stages']['inflate']['buckets'][0])
+        self.assertEqual(None, snapshot['stages']['hash']['cpu'])
+        self.assertEqual(1, snapshot['stages']['hash']['buckets'][
+            BUCKETS.index(1.0)])
+
+    def test_hooks(self):
+        seen = []
+        self.metrics.add_hook(lambda *observation: seen.append(observation))
+        with self.metrics.stage('index'):
+            pass
+        self.metrics.count('members', 2)
+        self.assertEqual(['stage', 'count'], [kind for (kind, _, _) in seen])
+        self.assertEqual(('count', 'members', 2), seen[1])
+        self.assertEqual('index', seen[0][1])
+        self.assertEqual(1, self.metrics.snapshot()['stages']['index'][
+            'calls'])
+
+    def test_analyze(self):
+        metrics = Metrics()
+        analyze(io.BytesIO(jar()), 'sample.jar', metrics=metrics)
+        snapshot = metrics.snapshot()
+        self.assertEqual(3, snapshot['counters']['members_hashed'])
+        self.assertEqual(1, snapshot['counters']['archives'])
+        for name in ('index', 'filehash', 'fingerprint', 'inflate', 'hash'):
+            self.assertTrue(snapshot['stages'][name]['calls'] > 0, name)
+
+
+class NullMetricsTest(unittest.TestCase):
+
+    def test_no_op(self):
+        """
+        The disabled instrumentation keeps nothing, whatever it is given.
+        """
+        self.assertFalse(NULL.enabled)
+        with NULL.stage('index') as stage:
+            self.assertTrue(stage is NULL.stage('hash'))
+        NULL.time('inflate', 1.0, 1.0)
+        NULL.count('members', 3)
+        expected = analyze(io.BytesIO(jar()), 'sample.jar')
+        self.assertEqual(expected, analyze(io.BytesIO(jar()), 'sample.jar',
+                                           metrics=NULL))
+        self.assertEqual({}, vars(NULL))
+        self.assertRaises(AttributeError, getattr, NULL, 'snapshot')
+
+
+class ExporterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'sample.jar')
+        with open(self.path, 'wb') as out:
+            out.write(jar())
+        pool = ThreadPool(1)
+        self.pipeline = Pipeline(pool, lambda *args: None, {},
+                                 debounce=0.0, metrics=Metrics())
+        self.pipeline.start()
+        try:
+            self.pipeline.notify(self.path)
+            wait_for(lambda: self.path in self.pipeline.outcomes)
+        finally:
+            self.pipeline.stop()
+            pool.close()
+            pool.join()
+        self.server = exporter.serve(self.pipeline, 0, '127.0.0.1')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def get(self, path):
+        response = urllib2.urlopen('http://127.0.0.1:%i%s' % (
+            self.server.server_address[1], path))
+        return response.info().gettype(), response.read()
+
+    def test_prometheus(self):
+        (content_type, text) = self.get('/metrics')
+        self.assertEqual('text/plain', content_type)
+        values = samples(text)
+        # The counters of the pipeline next to those of the workers.
+        self.assertEqual(1, values['victims_hash_processed_total'])
+        self.assertEqual(3, values['victims_hash_members_hashed_total'])
+        # Queue depths are gauges.
+        for name in ('pending', 'inflight', 'storing'):
+            self.assertEqual(0, values['victims_hash_' + name])
+            self.assertFalse('victims_hash_%s_total' % name in values)
+        self.assertEqual(1, values['victims_hash_stage_duration_seconds'
+                                   '_count{stage="analyze"}'])
+
+    def test_json(self):
+        (content_type, text) = self.get('/metrics.json')
+        self.assertEqual('application/json', content_type)
+        values = json.loads(text)
+        self.assertEqual(1, values['counters']['processed'])
+        self.assertEqual(3, values['counters']['members_hashed'])
+        self.assertEqual({'pending': 0, 'inflight': 0, 'storing': 0},
+                         values['gauges'])
+
+    def test_not_found(self):
+        try:
+            self.get('/')
+        except urllib2.HTTPError as e:
+            self.assertEqual(404, e.code)
+        else:
+            self.fail('No error for an unknown path')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+"""
+Tests of the compiler independent normal form of class files.
+"""
+
+import io
+import struct
+import unittest
+
+from victims_hash.analyze import analyze
+from victims_hash.archive.reader.normalize import normalize_class
+
+from tests.archives import jar_bytes, java_class, sha1
+
+
+def classes(seed, line=1):
+    return dict(
+        (b'org/sample/C%d.class' % i,
+         java_class(b'org/sample/C%d' % i, i, seed, line))
+        for i in range(4))
+
+
+class NormalizeTest(unittest.TestCase):
+
+    def test_pool_order(self):
+        first = java_class(b'org/sample/A', seed=1)
+        second = java_class(b'org/sample/A', seed=2, line=7)
+        self.assertNotEqual(first, second)
+        self.assertEqual(normalize_class(first), normalize_class(second))
+
+    def test_code(self):
+        self.assertNotEqual(
+            normalize_class(java_class(b'org/sample/A', 1, seed=1)),
+            normalize_class(java_class(b'org/sample/A', 2, seed=1)))
+
+    def test_cycle(self):
+        """
+        A class whose constants refer in circles is hashed as stored
+        instead of failing the whole jar.
+        """
+        # Constant #1 is a class named by itself.
+        looped = b'\xca\xfe\xba\xbe' + struct.pack(
+            '>HHHBHHHHHHHH', 0, 50, 2, 7, 1, 0x21, 1, 0, 0, 0, 0, 0)
+        self.assertRaises(ValueError, normalize_class, looped)
+        data = jar_bytes({b'x/Looped.class': looped,
+                          b'x/A.class': java_class(b'x/A')})
+        files = analyze(io.BytesIO(data), 'sample.jar', meta=False,
+                        normalize=True, algorithms=['sha1'])
+        files = files['hashes']['sha1']['files']
+        self.assertEqual(2, len(files))
+        # Without the 8 byte header, like any class that fails to parse.
+        self.assertEqual('x/Looped.class', files[sha1(looped[8:])])
+
+    def hashes(self, data, **options):
+        return analyze(io.BytesIO(data), 'sample.jar', meta=False,
+                       **options)['hashes']['sha512']
+
+    def test_fingerprint(self):
+        """
+        Builds differing in pool order and debug information share their
+        normalized fingerprint, however many threads hash them.
+        """
+        first = jar_bytes(classes(seed=1))
+        second = jar_bytes(classes(seed=2, line=9))
+        self.assertNotEqual(self.hashes(first)['files'],
+                            self.hashes(second)['files'])
+        expected = self.hashes(first, normalize=True)['files']
+        self.assertEqual(4, len(expected))
+        for data in (first, second):
+            for workers in (1, 4):
+                self.assertEqual(expected, self.hashes(
+                    data, normalize=True, hash_workers=workers)['files'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+"""
+Tests of the autoprocess dispatch pipeline.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from multiprocessing.pool import ThreadPool
+
+from victims_hash.autoprocess.pipeline import Pipeline
+
+from tests.archives import jar_bytes, java_class
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError("Timed out")
+        time.sleep(0.02)
+
+
+class LostPool(object):
+    """
+    A pool whose workers die: results never come back.
+    """
+
+    def __init__(self):
+        self.submitted = []
+
+    def apply_async(self, function, args, callback=None):
+        self.submitted.append(args[0])
+
+
+class PipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.stored = {}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def store(self, filename, data, config):
+        self.stored[filename] = data
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as out:
+            out.write(content)
+        return path
+
+    def test_process(self):
+        jar = self.write('sample.jar', jar_bytes(
+            {b'org/sample/A.class': java_class(b'org/sample/A')}))
+        text = self.write('notes.txt', b'not an archive')
+        pool = ThreadPool(2)
+        pipeline = Pipeline(pool, self.store, {}, debounce=0.05)
+        pipeline.start()
+        try:
+            for path in (jar, text, jar):
+                pipeline.notify(path)
+            wait_for(lambda: len(pipeline.outcomes) == 2)
+        finally:
+            pipeline.stop()
+            pool.close()
+            pool.join()
+        self.assertEqual('ok', pipeline.outcomes[jar]['status'])
+        # Unsupported files are not retried.
+        self.assertEqual('failed', pipeline.outcomes[text]['status'])
+        self.assertEqual([jar], list(self.stored))
+        stats = pipeline.stats()
+        self.assertEqual((3, 1, 1, 0), (
+            stats['events'], stats['processed'], stats['failed'],
+            stats['inflight']))
+
+    def test_lost_results(self):
+        """
+        Files whose worker died are failed once the timeout passed and
+        free their slot.
+        """
+        paths = [self.write('a%d.jar' % i, b'') for i in range(3)]
+        pool = LostPool()
+        pipeline = Pipeline(pool, self.store, {}, max_inflight=1,
+                            debounce=0.0, retries=1, retry_delay=0.0,
+                            timeout=0.1)
+        pipeline.start()
+        try:
+            for path in paths:
+                pipeline.notify(path)
+            wait_for(lambda: pipeline.stats()['failed'] == 3)
+        finally:
+            pipeline.stop()
+        stats = pipeline.stats()
+        self.assertEqual((6, 3, 0), (
+            stats['timed_out'], stats['retried'], stats['inflight']))
+        self.assertEqual(sorted(paths * 2), sorted(pool.submitted))
+        for path in paths:
+            self.assertEqual(2, pipeline.outcomes[path]['attempts'])
+
+    def test_late_result(self):
+        """
+        A result arriving after the watchdog gave up is dropped.
+        """
+        path = self.write('a.jar', b'')
+        pipeline = Pipeline(LostPool(), self.store, {}, debounce=0.0,
+                            retries=0, timeout=0.1)
+        pipeline.start()
+        try:
+            pipeline.notify(path)
+            wait_for(lambda: pipeline.stats()['failed'] == 1)
+            pipeline._done(path, 1, None)
+        finally:
+            pipeline.stop()
+        self.assertEqual('failed', pipeline.outcomes[path]['status'])
+        self.assertEqual(0, pipeline.stats()['processed'])
+
+
+if __name__ == '__main__':
+    unittest.main()
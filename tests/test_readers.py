@@ -0,0 +1,197 @@
+"""
+Tests of picking a reader and of what the readers take on trust.
+"""
+
+import hashlib
+import io
+import sys
+import unittest
+
+import pkg_resources
+
+from victims_hash.analyze import analyze
+from victims_hash.archive.reader import ArchiveReader
+from victims_hash.archive.reader import registry
+from victims_hash.archive.reader.gem import GemReader
+from victims_hash.archive.reader.jar import JarReader
+from victims_hash.archive.reader.registry import find_reader, peek
+from victims_hash.archive.reader.sdist import SdistReader
+from victims_hash.archive.reader.wheel import WheelReader
+
+from tests.archives import (
+    PKG_INFO, ZipBuilder, gem_bytes, jar_bytes, java_class, tar_bytes,
+    wheel_bytes)
+
+
+SOURCE = b'VERSION = 1\n'
+# Same size as the source, so only the digest gives the RECORD away.
+CLAIMED = b'VERSION = 2\n'
+
+
+class WheelRecordTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = wheel_bytes([(b'sample/__init__.py', SOURCE)],
+                                record={b'sample/__init__.py': CLAIMED})
+
+    def files(self, **options):
+        result = analyze(io.BytesIO(self.data), 'sample.whl',
+                         algorithms=['sha256'], meta=False, **options)
+        return result['hashes']['sha256']['files']
+
+    def test_not_trusted(self):
+        self.assertEqual(
+            {hashlib.sha256(SOURCE).hexdigest(): 'sample/__init__.py'},
+            self.files())
+
+    def test_trusted(self):
+        self.assertEqual(
+            {hashlib.sha256(CLAIMED).hexdigest(): 'sample/__init__.py'},
+            self.files(trust_record=True))
+
+
+class SniffTest(unittest.TestCase):
+
+    def test_gem(self):
+        data = gem_bytes([('lib/sample.rb', b'module Sample\nend\n')])
+        self.assertFalse(SdistReader.sniff(peek(io.BytesIO(data))))
+        # Whatever the name says.
+        self.assertEqual(GemReader, find_reader('sample.tar', data[:512]))
+        self.assertEqual(GemReader, find_reader(None, data[:512]))
+
+    def test_sdist(self):
+        data = tar_bytes([('sample-1.0/PKG-INFO', PKG_INFO)])
+        self.assertTrue(SdistReader.sniff(data[:512]))
+        self.assertEqual(SdistReader, find_reader('sample-1.0.tar',
+                                                  data[:512]))
+
+    def test_plain_sdist(self):
+        """
+        An uncompressed sdist without an extension is not taken for a gem.
+        """
+        data = tar_bytes([('sample-1.0/PKG-INFO', PKG_INFO),
+                          ('sample-1.0/sample/__init__.py', b'VERSION = 1\n')])
+        self.assertFalse(GemReader.sniff(data[:512]))
+        self.assertEqual(SdistReader, find_reader(None, data[:512]))
+        result = analyze(io.BytesIO(data))
+        self.assertEqual('sample', result['meta']['Name'])
+        self.assertEqual(['sample-1.0/sample/__init__.py'],
+                         result['hashes']['sha1']['files'].values())
+
+
+# Continuation lines and a description body, as setuptools writes them.
+LONG_PKG_INFO = (
+    b'Metadata-Version: 1.1\nName: sample\nVersion: 1.0\n'
+    b'License: Apache 2.0\n        with exceptions\n'
+    b'Classifier: Topic :: Security\nClassifier: License :: OSI Approved\n'
+    b'\nA sample package.\n\nIts description: long.\n')
+
+
+class PkgInfoTest(unittest.TestCase):
+
+    def test_same_metadata(self):
+        """
+        Eggs and sdists read their PKG-INFO alike.
+        """
+        egg = ZipBuilder()
+        egg.add(b'EGG-INFO/PKG-INFO', LONG_PKG_INFO)
+        egg.add(b'sample/__init__.py', SOURCE)
+        egg = analyze(io.BytesIO(egg.getvalue()), 'sample.egg')['meta']
+        sdist = tar_bytes([('sample-1.0/PKG-INFO', LONG_PKG_INFO)], 'w:gz')
+        sdist = analyze(io.BytesIO(sdist), 'sample-1.0.tar.gz')['meta']
+        self.assertEqual(sdist, egg)
+        self.assertEqual('Apache 2.0 with exceptions', egg['License'])
+        self.assertEqual(2, len(egg['Classifier']))
+
+
+class ApkReader(ArchiveReader):
+
+    format = "apk"
+    extensions = (".apk",)
+
+    @classmethod
+    def sniff(cls, head):
+        return head.startswith(b"APK!")
+
+
+class EntryPoint(object):
+
+    def __init__(self, name, target):
+        self.name = name
+        self.target = target
+
+    def load(self):
+        if isinstance(self.target, Exception):
+            raise self.target
+        return self.target
+
+    def __str__(self):
+        return self.name
+
+
+class Stderr(io.BytesIO):
+
+    def write(self, data):
+        io.BytesIO.write(self, bytes(data))
+
+
+class RegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.readers = list(registry._readers)
+        self.loaded = registry._plugins_loaded
+        self.iter_entry_points = pkg_resources.iter_entry_points
+
+    def tearDown(self):
+        registry._readers[:] = self.readers
+        registry._plugins_loaded = self.loaded
+        pkg_resources.iter_entry_points = self.iter_entry_points
+
+    def test_extension(self):
+        jar = jar_bytes({b'x/A.class': java_class(b'x/A')})
+        self.assertEqual(JarReader, find_reader('a.jar', jar[:512]))
+        self.assertEqual(WheelReader, find_reader('a.whl', jar[:512]))
+        # Zips without a known extension go to the first zip reader.
+        self.assertEqual(JarReader, find_reader(None, jar[:512]))
+        self.assertEqual(JarReader, find_reader('a.zip', jar[:512]))
+
+    def test_content_wins(self):
+        gem = gem_bytes([('lib/a.rb', b'')])
+        self.assertEqual(GemReader, find_reader('a.jar', gem[:512]))
+
+    def test_claimed_fallback(self):
+        # Nothing recognizes the content, the extension decides.
+        self.assertEqual(JarReader, find_reader('a.jar', b'MZ' + b'\0' * 62))
+        self.assertRaises(NotImplementedError, find_reader, 'a.txt', b'text')
+
+    def test_order(self):
+        registry.register(ApkReader)
+        # Registering twice changes nothing.
+        registry.register(ApkReader)
+        self.assertEqual(1, registry.readers().count(ApkReader))
+        self.assertEqual(ApkReader, find_reader(None, b'APK!'))
+        self.assertTrue('.apk' in registry.extensions())
+        self.assertTrue('apk' in registry.formats())
+
+    def test_plugins(self):
+        points = [EntryPoint('broken', ImportError('no module apk')),
+                  EntryPoint('apk', ApkReader)]
+        pkg_resources.iter_entry_points = lambda group: (
+            points if group == registry.ENTRY_POINT else [])
+        registry._plugins_loaded = False
+        stderr, sys.stderr = sys.stderr, Stderr()
+        try:
+            readers = registry.readers()
+            message = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(ApkReader, readers[-1])
+        self.assertTrue('Could not load reader broken' in message)
+        # Entry points are only loaded once.
+        points.append(EntryPoint('other', ApkReader))
+        registry.readers()
+        self.assertEqual(readers, registry.readers())
+
+
+if __name__ == '__main__':
+    unittest.main()
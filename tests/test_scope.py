@@ -0,0 +1,94 @@
+"""
+Tests of the per format member scopes.
+"""
+
+import io
+import unittest
+
+from victims_hash.analyze import analyze, analyze_stream
+from victims_hash.archive.reader.scope import Scope, parse_scopes
+
+from tests.archives import Unseekable, jar_bytes, java_class
+
+
+CLASSES = dict(
+    (b'org/sample/C%d.class' % i, java_class(b'org/sample/C%d' % i, i))
+    for i in range(3))
+
+FILES = [
+    (b'lib/native.so', b'\x7fELF' + b'\0' * 2000),
+    (b'static/app.js', b'var a = 1;\n' * 50),
+    (b'static/big.js', b'var b = 2;\n' * 5000),
+]
+
+
+class ScopeTest(unittest.TestCase):
+
+    def test_parse(self):
+        scope = Scope.parse('include=*.class, *.so;exclude=*/test/*;'
+                            'min_size=1;max_size=10K')
+        self.assertEqual(('*.class', '*.so'), scope.include)
+        self.assertEqual(('*/test/*',), scope.exclude)
+        self.assertEqual((1, 10240), (scope.min_size, scope.max_size))
+        self.assertTrue(scope.match('a/B.class', 100))
+        self.assertFalse(scope.match('a/test/B.class', 100))
+        self.assertFalse(scope.match('a/B.class', 20000))
+        self.assertFalse(scope.match('a/B.class', 0))
+        self.assertTrue(scope.match('a/B.class'))
+
+    def test_parse_errors(self):
+        self.assertRaises(ValueError, Scope.parse, 'include')
+        self.assertRaises(ValueError, Scope.parse, 'color=red')
+        self.assertRaises(ValueError, Scope.parse, 'max_size=lots')
+        self.assertRaises(ValueError, parse_scopes, ['include=*.class'])
+
+    def test_inherit(self):
+        scopes = parse_scopes(['jar:exclude=*/C1.class;max_size=1M'])
+        self.assertEqual(None, scopes['jar'].include)
+        result = analyze(io.BytesIO(jar_bytes(CLASSES, FILES)),
+                         'sample.jar', scopes=scopes)
+        self.assertEqual(
+            set(['org/sample/C0.class', 'org/sample/C2.class']),
+            set(result['hashes']['sha1']['files'].values()))
+
+    def test_empty_include(self):
+        # An explicitly empty include selects nothing.
+        result = analyze(io.BytesIO(jar_bytes(CLASSES)), 'sample.jar',
+                         scopes=parse_scopes(['jar:include=']))
+        self.assertEqual({}, result['hashes']['sha1']['files'])
+
+    def fingerprints(self, data, scope, **options):
+        """
+        Return the member digests of a jar read from a seekable file and
+        from a stream.
+        """
+        scopes = parse_scopes(['jar:' + scope])
+        seekable = analyze(io.BytesIO(data), 'sample.jar', scopes=scopes,
+                           **options)
+        stream = analyze_stream(Unseekable(data), 'sample.jar',
+                                scopes=scopes, **options)
+        return (seekable['hashes']['sha1']['files'],
+                stream['hashes']['sha1']['files'])
+
+    def test_stream_all(self):
+        for options in ({}, {'descriptor': True}):
+            data = jar_bytes(CLASSES, FILES, **options)
+            seekable, stream = self.fingerprints(data, 'include=*')
+            self.assertEqual(seekable, stream)
+            # The manifest and pom.properties are members too.
+            self.assertEqual(len(CLASSES) + len(FILES) + 2, len(stream))
+
+    def test_stream_sizes(self):
+        for options in ({}, {'descriptor': True}):
+            data = jar_bytes(CLASSES, FILES, **options)
+            seekable, stream = self.fingerprints(
+                data, 'include=*.js,*.so,*.MF;max_size=4K')
+            self.assertEqual(seekable, stream)
+            self.assertEqual(
+                set(['lib/native.so', 'static/app.js',
+                     'META-INF/MANIFEST.MF']),
+                set(stream.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
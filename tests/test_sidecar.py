@@ -0,0 +1,112 @@
+"""
+Tests of the checksum files published next to artifacts.
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from victims_hash.analyze import analyze
+from victims_hash.sidecar import ChecksumMismatch, parse_checksum
+
+from tests.archives import CountingFile, jar_bytes, java_class, sha1, sha512
+
+
+DATA = jar_bytes(dict(
+    (b'org/sample/C%d.class' % i, java_class(b'org/sample/C%d' % i, i))
+    for i in range(3)))
+
+
+class ParseTest(unittest.TestCase):
+
+    def test_forms(self):
+        digest = sha1(DATA)
+        for content in (digest, digest.upper() + '\n',
+                        '%s  sample.jar\n' % digest,
+                        'SHA1(sample.jar)= %s\n' % digest):
+            self.assertEqual(digest, parse_checksum(content, 'sha1'))
+
+    def test_invalid(self):
+        self.assertEqual(None, parse_checksum('', 'sha1'))
+        # A sha1 is not a sha512.
+        self.assertEqual(None, parse_checksum(sha1(DATA), 'sha512'))
+        self.assertEqual(None, parse_checksum('<html>404</html>', 'sha1'))
+
+
+class SidecarTest(unittest.TestCase):
+
+    def setUp(self):
+        self.expected = analyze(io.BytesIO(DATA), 'sample.jar')
+        self.checksums = {'sha1': sha1(DATA), 'sha512': sha512(DATA)}
+
+    def analyze(self, **options):
+        source = CountingFile(DATA, 'sample.jar')
+        return analyze(source, **options), source.bytes_read
+
+    def test_trust(self):
+        result, read = self.analyze(
+            sidecar='trust', checksums={'sha1': '0' * 40,
+                                        'sha512': '0' * 128})
+        # Whatever the checksum says is taken.
+        self.assertEqual('0' * 40, result['hashes']['sha1']['combined'])
+        self.assertEqual(self.expected['hashes']['sha1']['files'],
+                         result['hashes']['sha1']['files'])
+        hashed = self.analyze()[1]
+        self.assertTrue(hashed - read >= len(DATA))
+
+    def test_verify(self):
+        result, read = self.analyze(sidecar='verify',
+                                    checksums=self.checksums)
+        self.assertEqual(self.expected, result)
+        # The file digest comes from the same read as the members.
+        self.assertEqual(len(DATA), read)
+
+    def test_mismatch(self):
+        checksums = dict(self.checksums, sha1='0' * 40)
+        self.assertRaises(ChecksumMismatch, self.analyze, sidecar='verify',
+                          checksums=checksums)
+        # Only the algorithms fingerprinted with are compared.
+        self.analyze(sidecar='verify', checksums=dict(
+            checksums, sha1=self.checksums['sha1'], md5='0' * 32))
+
+
+class SidecarFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'sample.jar')
+        with open(self.path, 'wb') as out:
+            out.write(DATA)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def sidecar(self, suffix, content):
+        with open(self.path + suffix, 'wb') as out:
+            out.write(content)
+
+    def test_files(self):
+        self.sidecar('.sha512', '%s  sample.jar\n' % sha512(DATA))
+        self.sidecar('.sha1', 'SHA1(sample.jar)= %s\n' % sha1(DATA))
+        expected = analyze(self.path)
+        for mode in ('trust', 'verify'):
+            self.assertEqual(expected, analyze(self.path, sidecar=mode))
+
+    def test_file_mismatch(self):
+        self.sidecar('.sha1', sha1(b'something else'))
+        self.assertRaises(ChecksumMismatch, analyze, self.path,
+                          sidecar='verify')
+
+    def test_missing(self):
+        # Without checksum files the artifact is simply hashed.
+        self.assertEqual(analyze(self.path),
+                         analyze(self.path, sidecar='verify'))
+
+    def test_unknown_mode(self):
+        self.assertRaises(ValueError, analyze, self.path, sidecar='ignore')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+"""
+Tests of the member based similarity of archives.
+"""
+
+import hashlib
+import io
+import unittest
+
+from victims_hash.analyze import analyze
+from victims_hash.similarity import (
+    EMPTY, LSHIndex, add_sketch, containment, estimate_containment,
+    estimate_jaccard, jaccard, sketch)
+
+from tests.archives import jar_bytes, java_class
+
+
+def fingerprint(members, size=128, algorithm="sha512"):
+    """
+    Return a sketched fingerprint of the members numbered `members`.
+    """
+    files = dict(
+        (hashlib.new(algorithm, b'member %i' % i).hexdigest(), 'm%i' % i)
+        for i in members)
+    return add_sketch({"hashes": {algorithm: {"files": files}}},
+                      algorithm, size)
+
+
+class ExactTest(unittest.TestCase):
+
+    def test_jaccard(self):
+        a, b = fingerprint(range(10)), fingerprint(range(5, 20))
+        self.assertAlmostEqual(5 / 20.0, jaccard(a, b))
+        self.assertAlmostEqual(0.5, containment(a, b))
+        self.assertAlmostEqual(1 / 3.0, containment(b, a))
+
+    def test_empty(self):
+        empty = fingerprint([])
+        self.assertEqual(0.0, jaccard(empty, empty))
+        self.assertEqual(0.0, containment(empty, fingerprint(range(3))))
+
+
+class SketchTest(unittest.TestCase):
+
+    def test_estimates(self):
+        a = fingerprint(range(1000))
+        b = fingerprint(range(50, 1050))
+        exact = jaccard(a, b)
+        self.assertAlmostEqual(950 / 1050.0, exact)
+        self.assertTrue(abs(estimate_jaccard(a, b) - exact) < 0.1)
+        self.assertEqual(1.0, estimate_jaccard(a, a))
+        small = fingerprint(range(100))
+        self.assertTrue(estimate_containment(small, a) > 0.8)
+        self.assertTrue(estimate_containment(a, small) < 0.2)
+
+    def test_densification(self):
+        """
+        Bins no member fell into borrow from the next filled one, so
+        sketches of small archives are still comparable.
+        """
+        digest = 'ff' * 64
+        bins = sketch([digest], 8)
+        # 0xffffffff % 8 is 7, so every bin borrows from the last one.
+        value = int(digest[8:24], 16)
+        self.assertEqual(value, bins[7])
+        self.assertEqual([(value + 7 - i) & EMPTY for i in range(7)],
+                         bins[:7])
+        self.assertEqual(8, len(set(bins)))
+        a, b = fingerprint([1]), fingerprint([1])
+        self.assertEqual(1.0, estimate_jaccard(a, b))
+        self.assertTrue(estimate_jaccard(a, fingerprint([2])) < 0.5)
+
+    def test_empty(self):
+        empty = fingerprint([])
+        self.assertEqual([EMPTY] * 128, empty["sketch"]["minhash"])
+        self.assertEqual(0, empty["sketch"]["members"])
+        self.assertEqual(0.0, estimate_jaccard(empty, empty))
+        self.assertEqual(0.0, estimate_containment(empty, fingerprint([1])))
+
+    def test_not_comparable(self):
+        a = fingerprint(range(10))
+        self.assertRaises(ValueError, estimate_jaccard, a,
+                          fingerprint(range(10), size=64))
+        self.assertRaises(ValueError, estimate_jaccard, a,
+                          fingerprint(range(10), algorithm="sha1"))
+        self.assertRaises(ValueError, estimate_containment, a,
+                          fingerprint(range(10), size=64))
+
+    def test_analyze(self):
+        classes = dict(
+            (b'x/C%d.class' % i, java_class(b'x/C%d' % i, i))
+            for i in range(3))
+        inner = jar_bytes(classes)
+        data = jar_bytes(classes, [(b'lib/inner.jar', inner)])
+        result = analyze(io.BytesIO(data), 'a.jar', sketch=True, depth=1)
+        self.assertEqual(3, result["sketch"]["members"])
+        self.assertEqual("sha512", result["sketch"]["algorithm"])
+        self.assertEqual(1.0, estimate_jaccard(result, result["archives"][0]))
+
+
+class LSHIndexTest(unittest.TestCase):
+
+    def test_nearest(self):
+        index = LSHIndex()
+        index.insert('base', fingerprint(range(1000)))
+        index.insert('other', fingerprint(range(5000, 6000)))
+        index.insert('empty', fingerprint([]))
+        self.assertEqual(2, len(index))
+
+        found = index.nearest(fingerprint(range(50, 1050)))
+        self.assertEqual(['base'], [key for (_, key) in found])
+        self.assertTrue(found[0][0] > 0.8)
+        self.assertEqual([], index.nearest(fingerprint(range(9000, 9100))))
+        self.assertEqual([], index.nearest(fingerprint(range(50, 1050)),
+                                           threshold=0.99))
+
+    def test_too_small(self):
+        index = LSHIndex(bands=32, rows=4)
+        self.assertRaises(ValueError, index.insert, 'a',
+                          fingerprint(range(10), size=64))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+"""
+Tests of the batched result sinks.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from multiprocessing.pool import ThreadPool
+
+from victims_hash.autoprocess.pipeline import Pipeline
+from victims_hash.autoprocess.sinks import MemorySink
+
+from tests.archives import jar_bytes, java_class
+from tests.test_pipeline import wait_for
+
+
+def result(number):
+    return {"hash": "h%d" % number}
+
+
+class SinkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.notified = []
+
+    def listener(self, filenames, error):
+        self.notified.append((filenames, error))
+
+    def test_batches(self):
+        sink = MemorySink(batch_size=2, batch_delay=60.0)
+        sink.add_listener(self.listener)
+        sink.put('a', result(1))
+        # Buffered only: nothing is reported stored yet.
+        self.assertEqual([], self.notified)
+        sink.put('b', result(2))
+        self.assertEqual([(['a', 'b'], None)], self.notified)
+        sink.put('c', result(3))
+        sink.close()
+        self.assertEqual([2, 1], sink.batches)
+        self.assertEqual((['c'], None), self.notified[-1])
+
+    def test_failed_write(self):
+        """
+        A failed write keeps the results, is reported to the listeners and
+        retried by the timer.
+        """
+        sink = MemorySink(batch_size=1, batch_delay=0.05)
+        sink.add_listener(self.listener)
+        sink.failures = 1
+        self.assertRaises(IOError, sink.put, 'a', result(1))
+        self.assertTrue(isinstance(sink.error, IOError))
+        self.assertEqual(['a'], self.notified[0][0])
+        self.assertTrue(isinstance(self.notified[0][1], IOError))
+        wait_for(lambda: len(self.notified) == 2)
+        self.assertEqual((['a'], None), self.notified[1])
+        self.assertEqual(None, sink.error)
+        self.assertEqual({"written": 1, "batches": 1, "failures": 1},
+                         sink.counters)
+        sink.close()
+
+    def test_close_error(self):
+        sink = MemorySink(batch_size=10, batch_delay=60.0)
+        sink.put('a', result(1))
+        sink.failures = 1
+        self.assertRaises(IOError, sink.close)
+
+
+class PipelineSinkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, number):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as out:
+            out.write(jar_bytes({b'x/A.class': java_class(b'x/A', number)}))
+        return path
+
+    def run_pipeline(self, sink, paths, condition):
+        pool = ThreadPool(2)
+        pipeline = Pipeline(pool, None, {}, debounce=0.0, sink=sink)
+        pipeline.start()
+        try:
+            for path in paths:
+                pipeline.notify(path)
+            wait_for(lambda: condition(pipeline))
+        finally:
+            pipeline.stop()
+            pool.close()
+            pool.join()
+        return pipeline
+
+    def test_processed_once_written(self):
+        paths = [self.write('a%d.jar' % i, i) for i in range(3)]
+        sink = MemorySink(batch_size=10, batch_delay=60.0)
+        pipeline = self.run_pipeline(
+            sink, paths, lambda pipeline: pipeline.stats()['storing'] == 3)
+        self.assertEqual(0, pipeline.stats()['processed'])
+        self.assertEqual(
+            set(['storing']),
+            set(outcome['status'] for outcome in pipeline.outcomes.values()))
+        pipeline.close()
+        stats = pipeline.stats()
+        self.assertEqual((3, 0), (stats['processed'], stats['storing']))
+        self.assertEqual(3, len(sink.documents))
+        for path in paths:
+            self.assertEqual('ok', pipeline.outcomes[path]['status'])
+
+    def test_failed_writes(self):
+        paths = [self.write('a%d.jar' % i, i) for i in range(2)]
+        sink = MemorySink(batch_size=1, batch_delay=0.05)
+        sink.failures = 2
+        pipeline = self.run_pipeline(
+            sink, paths, lambda pipeline: pipeline.stats()['processed'] == 2)
+        stats = pipeline.stats()
+        self.assertEqual((2, 0), (stats['store_failures'], stats['failed']))
+        for path in paths:
+            self.assertEqual('ok', pipeline.outcomes[path]['status'])
+            self.assertFalse('error' in pipeline.outcomes[path])
+        pipeline.close()
+
+    def test_lost_on_close(self):
+        path = self.write('a.jar', 1)
+        sink = MemorySink(batch_size=10, batch_delay=60.0)
+        pipeline = self.run_pipeline(
+            sink, [path], lambda pipeline: pipeline.stats()['storing'] == 1)
+        sink.failures = 1
+        pipeline.close()
+        self.assertEqual('failed', pipeline.outcomes[path]['status'])
+        self.assertTrue('IOError' in pipeline.outcomes[path]['error'])
+        self.assertEqual((0, 1), (pipeline.stats()['processed'],
+                                  pipeline.stats()['failed']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""
+Tests of the memory mapped zip index.
+"""
+
+import io
+import os
+import tempfile
+import unittest
+import zipfile
+
+from zipfile import BadZipfile
+
+from victims_hash.analyze import analyze
+from victims_hash.archive.reader.zipindex import ZipIndex
+
+from tests.archives import ZipBuilder, java_class, jar_bytes
+
+
+CLASSES = dict(
+    (b'org/sample/C%d.class' % i, java_class(b'org/sample/C%d' % i, i))
+    for i in range(5))
+
+VARIANTS = {
+    'plain': {},
+    'stored': {'level': 0},
+    'zip64': {'zip64': True},
+    'prefix': {'prefix': b'#!/bin/sh\nexec java -jar "$0"\n'},
+    'zip64 prefix': {'zip64': True, 'prefix': b'MZ' + b'\0' * 300},
+    'descriptor': {'descriptor': True},
+    'zip64 descriptor': {'zip64': True, 'descriptor': True},
+}
+
+
+class ZipIndexTest(unittest.TestCase):
+
+    def check(self, data):
+        index = ZipIndex(io.BytesIO(data))
+        expected = zipfile.ZipFile(io.BytesIO(data))
+        self.assertEqual(expected.namelist(), index.namelist())
+        for (i, info) in enumerate(expected.infolist()):
+            self.assertEqual(info.file_size, index.file_sizes[i])
+            self.assertEqual(info.compress_size, index.compress_sizes[i])
+            self.assertEqual(info.CRC, index.crcs[i])
+            self.assertEqual(expected.read(info.filename),
+                             index.open(i).read())
+        return index
+
+    def test_variants(self):
+        for (name, options) in sorted(VARIANTS.items()):
+            index = self.check(jar_bytes(CLASSES, **options))
+            self.assertEqual(
+                len(options.get('prefix', b'')), index.prefix, name)
+
+    def test_mapped_file(self):
+        handle, path = tempfile.mkstemp(suffix='.jar')
+        try:
+            with os.fdopen(handle, 'wb') as out:
+                out.write(jar_bytes(CLASSES, zip64=True))
+            with open(path, 'rb') as io:
+                index = ZipIndex(io)
+                self.assertEqual(7, len(index))
+                self.assertEqual(b'META-INF/MANIFEST.MF', index.name(0))
+                index.close()
+        finally:
+            os.remove(path)
+
+    def test_empty(self):
+        index = self.check(ZipBuilder().getvalue())
+        self.assertEqual(0, len(index))
+
+    def test_not_a_zip(self):
+        self.assertRaises(BadZipfile, ZipIndex, io.BytesIO(b'x' * 100))
+
+    def test_bad_crc(self):
+        builder = ZipBuilder()
+        builder.add(b'a.txt', b'hello world', 0)
+        data = builder.getvalue().replace(b'hello', b'HELLO')
+        index = ZipIndex(io.BytesIO(data))
+        self.assertRaises(BadZipfile, index.open(0).read)
+
+    def test_same_fingerprint(self):
+        """
+        Members fingerprint the same however the zip was written.
+        """
+        files = None
+        for (name, options) in sorted(VARIANTS.items()):
+            result = analyze(io.BytesIO(jar_bytes(CLASSES, **options)),
+                             'sample.jar')
+            found = dict((alg, result['hashes'][alg]['files'])
+                         for alg in result['hashes'])
+            self.assertEqual(5, len(found['sha1']), name)
+            if files is None:
+                files = found
+            self.assertEqual(files, found, name)
+            self.assertEqual('sample', result['meta'][0]['properties'][
+                'Implementation-Title'].strip())
+
+
+if __name__ == '__main__':
+    unittest.main()
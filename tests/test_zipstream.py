@@ -0,0 +1,123 @@
+"""
+Tests of fingerprinting straight from a stream that can not seek.
+"""
+
+import io
+import unittest
+
+from zipfile import BadZipfile
+
+from victims_hash.analyze import analyze, analyze_stream
+
+from tests.archives import (
+    Unseekable, ZipBuilder, gem_bytes, jar_bytes, java_class, sha1, sha512,
+    tar_bytes, wheel_bytes)
+
+
+CLASSES = dict(
+    (b'org/sample/C%d.class' % i, java_class(b'org/sample/C%d' % i, i))
+    for i in range(5))
+
+FILES = [
+    (b'org/sample/notes.txt', b'notes ' * 100),
+    (b'org/sample/empty.txt', b''),
+]
+
+
+def egg_bytes():
+    builder = ZipBuilder(descriptor=True)
+    builder.add(b'EGG-INFO/PKG-INFO',
+                b'Metadata-Version: 1.0\nName: sample\nVersion: 1.0\n')
+    builder.add(b'sample/__init__.py', b'VERSION = 1\n')
+    builder.add(b'sample/core.py', b'def run():\n    pass\n', 0)
+    return builder.getvalue()
+
+
+def sdist_bytes():
+    return tar_bytes([
+        ('sample-1.0/PKG-INFO',
+         b'Metadata-Version: 1.0\nName: sample\nVersion: 1.0\n'),
+        ('sample-1.0/sample/__init__.py', b'VERSION = 1\n'),
+        ('sample-1.0/setup.py', b'from setuptools import setup\n'),
+    ], 'w:gz')
+
+
+class StreamTest(unittest.TestCase):
+
+    def check(self, data, name, **options):
+        """
+        Assert that a stream and a seekable file give the same result.
+        """
+        seekable = analyze(io.BytesIO(data), name, **options)
+        stream = analyze_stream(Unseekable(data), name, **options)
+        self.assertEqual(seekable, stream)
+        self.assertEqual(sha512(data), stream['hash'])
+        self.assertEqual(sha1(data), stream['hashes']['sha1']['combined'])
+        return stream
+
+    def test_jar(self):
+        result = self.check(jar_bytes(CLASSES, FILES), 'sample.jar')
+        self.assertEqual(5, len(result['hashes']['sha1']['files']))
+        self.assertEqual(2, len(result['meta']))
+
+    def test_stored(self):
+        self.check(jar_bytes(CLASSES, FILES, level=0), 'sample.jar')
+
+    def test_zip64(self):
+        self.check(jar_bytes(CLASSES, FILES, zip64=True), 'sample.jar')
+
+    def test_descriptor(self):
+        self.check(jar_bytes(CLASSES, FILES, descriptor=True), 'sample.jar')
+
+    def test_stored_descriptor(self):
+        # Stored entries with a descriptor are delimited by finding it.
+        self.check(jar_bytes(CLASSES, FILES, descriptor=True, level=0),
+                   'sample.jar')
+
+    def test_zip64_descriptor(self):
+        self.check(jar_bytes(CLASSES, FILES, zip64=True, descriptor=True),
+                   'sample.jar')
+
+    def test_descriptor_lookalike(self):
+        # A stored member containing the descriptor signature.
+        files = [(b'trap.class', b'\xca\xfe\xba\xbe\0\0\0\x32PK\x07\x08' +
+                  b'\0' * 40)]
+        self.check(jar_bytes(CLASSES, files, descriptor=True, level=0),
+                   'sample.jar')
+
+    def test_nested(self):
+        inner = jar_bytes(CLASSES, descriptor=True)
+        outer = jar_bytes({}, [(b'WEB-INF/lib/inner.jar', inner)])
+        result = self.check(outer, 'sample.war', depth=1)
+        self.assertEqual(5, len(
+            result['archives'][0]['hashes']['sha1']['files']))
+
+    def test_egg(self):
+        result = self.check(egg_bytes(), 'sample.egg')
+        self.assertEqual('sample', result['meta']['Name'])
+
+    def test_wheel(self):
+        self.check(wheel_bytes([(b'sample/__init__.py', b'VERSION = 1\n')]),
+                   'sample-1.0-py2-none-any.whl')
+
+    def test_gem(self):
+        self.check(gem_bytes([('lib/sample.rb', b'puts 1\n')]),
+                   'sample-1.0.gem')
+
+    def test_sdist(self):
+        result = self.check(sdist_bytes(), 'sample-1.0.tar.gz')
+        self.assertEqual(2, len(result['hashes']['sha1']['files']))
+
+    def test_prefix(self):
+        data = jar_bytes(CLASSES, prefix=b'#!/bin/sh\n')
+        self.assertRaises(
+            BadZipfile, analyze_stream, Unseekable(data), 'sample.jar')
+
+    def test_truncated(self):
+        data = jar_bytes(CLASSES)[:300]
+        self.assertRaises(
+            BadZipfile, analyze_stream, Unseekable(data), 'sample.jar')
+
+
+if __name__ == '__main__':
+    unittest.main()